@@ -14,6 +14,9 @@ DASH_VIEWER_URL = os.getenv("DASH_VIEWER_URL", "http://localhost:8081").rstrip("
 SCRIPT_HANDLER_URL = os.getenv("SCRIPT_HANDLER_URL", "http://predictor:8100").rstrip("/")
 FONT_URL = "https://fonts.googleapis.com/css2?family=Space+Grotesk:wght@400;500;600;700&display=swap"
 
+_mapping_etag: str | None = None
+_mapping_body: Dict[str, Any] | None = None
+
 
 def refresh_mapping() -> None:
     url = f"{MIDDLEWARE_URL}/refresh_mapping"
@@ -24,12 +27,18 @@ def refresh_mapping() -> None:
 
 
 def get_mapping() -> Dict[str, Any]:
+    global _mapping_etag, _mapping_body
     url = f"{MIDDLEWARE_URL}/devices.ifc.json"
+    headers = {"If-None-Match": _mapping_etag} if _mapping_etag and _mapping_body is not None else {}
     with httpx.Client(timeout=10) as client:
-        response = client.get(url)
+        response = client.get(url, headers=headers)
+    if response.status_code == 304 and _mapping_body is not None:
+        return _mapping_body
     if response.status_code != 200:
         raise RuntimeError(f"Fetch mapping failed: {response.status_code}")
-    return response.json()
+    _mapping_body = response.json()
+    _mapping_etag = response.headers.get("etag")
+    return _mapping_body
 
 
 def build_device_options(mapping: Dict[str, Any]) -> List[Dict[str, str]]:
@@ -82,6 +91,26 @@ def fetch_telemetry(
     return response.json()
 
 
+def fetch_telemetry_batch(mapping: Dict[str, Any], items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    if not mapping:
+        raise RuntimeError("Mapping not loaded")
+    url = f"{MIDDLEWARE_URL}/telemetry/batch"
+    with httpx.Client(timeout=30) as client:
+        response = client.post(url, json={"items": items})
+    if response.status_code != 200:
+        detail = f"Telemetry fetch failed: {response.status_code}"
+        try:
+            payload = response.json()
+            message = payload.get("detail") or payload.get("message") or payload.get("error")
+            if message:
+                detail = f"Telemetry fetch failed: {message}"
+        except Exception:
+            if response.text.strip():
+                detail = f"Telemetry fetch failed: {response.text.strip()}"
+        raise RuntimeError(detail)
+    return response.json().get("items") or []
+
+
 def fetch_thingsboard_health() -> Dict[str, Any]:
     url = f"{MIDDLEWARE_URL}/thingsboard/health"
     with httpx.Client(timeout=5) as client:
@@ -1729,26 +1758,35 @@ def on_load_telemetry(
         device_ids = selected_device if isinstance(selected_device, list) else [selected_device]
         tabs = []
         total_points = 0
+        errors = []
 
+        request_items = []
         for device_id in device_ids:
-            payload = fetch_telemetry(
-                mapping,
-                device_id,
-                keys_value or key,
-                int(limit or 24),
-                hours_value,
-                agg,
-                start_ts,
-                end_ts,
-                interval_value,
-            )
+            item = {"deviceId": device_id, "limit": int(limit or 24), "hours": hours_value, "format": "columnar"}
+            if keys_value or key:
+                item["keys"] = keys_value or key
+            if agg:
+                item["agg"] = agg
+            if start_ts:
+                item["startTs"] = start_ts
+            if end_ts:
+                item["endTs"] = end_ts
+            if interval_value:
+                item["interval"] = interval_value
+            request_items.append(item)
+        batch = fetch_telemetry_batch(mapping, request_items)
+
+        for device_id, payload in zip(device_ids, batch):
+            if payload.get("status") == "error":
+                errors.append(f"{device_id}: {payload.get('detail')}")
+                continue
 
             fig = go.Figure()
             if "series" in payload:
                 series = payload.get("series") or {}
-                for name, points in series.items():
-                    x_vals = [datetime.fromtimestamp(p.get("ts") / 1000) for p in points if p.get("ts") is not None]
-                    y_vals = [p.get("value") for p in points]
+                for name, columns in series.items():
+                    x_vals = [datetime.fromtimestamp(ts / 1000) for ts in columns.get("ts", [])]
+                    y_vals = columns.get("value", [])
                     fig.add_trace(
                         go.Scatter(
                             x=x_vals,
@@ -1760,11 +1798,10 @@ def on_load_telemetry(
                             hovertemplate="%{x|%H:%M:%S}<br>value=%{y}<extra></extra>",
                         )
                     )
-                total_points += sum(len(points) for points in series.values())
+                total_points += sum(len(columns.get("ts", [])) for columns in series.values())
             else:
-                points = payload.get("points", [])
-                x_vals = [datetime.fromtimestamp(p.get("ts") / 1000) for p in points if p.get("ts") is not None]
-                y_vals = [p.get("value") for p in points]
+                x_vals = [datetime.fromtimestamp(ts / 1000) for ts in payload.get("ts", [])]
+                y_vals = payload.get("value", [])
                 fig.add_trace(
                     go.Scatter(
                         x=x_vals,
@@ -1775,7 +1812,7 @@ def on_load_telemetry(
                         hovertemplate="%{x|%H:%M:%S}<br>value=%{y}<extra></extra>",
                     )
                 )
-                total_points += len(points)
+                total_points += len(x_vals)
 
             fig.update_layout(
                 margin=dict(l=20, r=20, t=30, b=20),
@@ -1805,6 +1842,10 @@ def on_load_telemetry(
                 )
             )
 
+        if errors and not tabs:
+            return [], f"Failed to load telemetry: {'; '.join(errors)}", error_status_class
+        if errors:
+            return tabs, f"Loaded {total_points} points ({len(errors)} failed: {'; '.join(errors)}).", base_status_class
         return tabs, f"Loaded {total_points} points.", base_status_class
     except Exception as exc:
         return [], f"Failed to load telemetry: {exc}", error_status_class
@@ -32,16 +32,35 @@ export class AppController {
     return (envUrl || "http://localhost:8000").replace(/\/$/, "");
   }
 
-  private async fetchMapping(baseUrl: string, cacheBust = false): Promise<any> {
-    const suffix = cacheBust ? `${baseUrl.includes("?") ? "&" : "?"}ts=${Date.now()}` : "";
-    const url = `${baseUrl}/devices.ifc.json${suffix}`;
-    const response = await fetch(url, { cache: "no-store" });
+  private async fetchMapping(baseUrl: string): Promise<any> {
+    // "no-cache" revalidates with the middleware's ETag, so an unchanged mapping costs a 304.
+    const url = `${baseUrl}/devices.ifc.json`;
+    let response = await fetch(url, { cache: "no-cache" });
+    if (response.status === 503) {
+      // Nothing loaded yet: have the middleware read the file once, then retry.
+      await this.ensureMappingLoaded(baseUrl);
+      response = await fetch(url, { cache: "no-cache" });
+    }
     if (!response.ok) {
       throw new Error(`Failed to load mapping from ${url}: ${response.status}`);
     }
     return response.json();
   }
 
+  private async fetchGuidIndex(url: string): Promise<Map<string, number> | null> {
+    try {
+      const response = await fetch(url, { cache: "no-cache" });
+      if (!response.ok) return null;
+      const index = await response.json();
+      const guidMap = new Map<string, number>();
+      index.guids.forEach((guid: string, i: number) => guidMap.set(guid, index.ids[i]));
+      return guidMap;
+    } catch (error) {
+      console.warn("GUID index unavailable, falling back to the model items", error);
+      return null;
+    }
+  }
+
   private async ensureMappingLoaded(baseUrl: string): Promise<void> {
     const url = `${baseUrl}/refresh_mapping`;
     const response = await fetch(url, { method: "POST" });
@@ -57,8 +76,7 @@ export class AppController {
     this.isEmbedded = window !== window.parent;
 
     const bootstrapUrl = this.getBootstrapUrl();
-    await this.ensureMappingLoaded(bootstrapUrl);
-    const devicesData = await this.fetchMapping(bootstrapUrl, true);
+    const devicesData = await this.fetchMapping(bootstrapUrl);
     this.mapping = devicesData;
     this.apiBaseUrl = ((devicesData as any).backend?.middlewareUrl || bootstrapUrl).replace(/\/$/, "");
     this.modelFile = (devicesData as any).model?.file || "model.ifc";
@@ -87,6 +105,9 @@ export class AppController {
     await ifcLoader.setup({});
     (this.world as any).IFC = { loader: ifcLoader };
 
+    // The GUID index is extracted by the middleware, so it downloads alongside the model
+    // instead of waiting for the loaded model's full item list.
+    const guidIndexPromise = this.fetchGuidIndex(`${modelUrl}/index`);
     this.loader = new FragmentLoader(viewer);
     await this.loader.load(modelUrl);
 
@@ -109,22 +130,25 @@ export class AppController {
     });
 
     // Create GUID to expressID mapping
-    const guidMap = new Map<string, number>();
+    let guidMap = await guidIndexPromise;
     const availableModels = Array.from(this.loader.fragments.list.keys());
     if (availableModels.length > 0) {
       const modelKey = availableModels[0];
       const model = this.loader.fragments.list.get(modelKey);
       if (model) {
         this.modelID = model.modelId;
-        const itemsMap = await model.getItems();
-        for (const [expressID, item] of itemsMap) {
-          guidMap.set(item.guid, expressID);
+        if (!guidMap) {
+          guidMap = new Map<string, number>();
+          const itemsMap = await model.getItems();
+          for (const [expressID, item] of itemsMap) {
+            guidMap.set(item.guid, expressID);
+          }
         }
       }
     }
 
     // Load devices data
-    this.ifcIoTLinker = new IfcIoTLinker(devicesData, guidMap);
+    this.ifcIoTLinker = new IfcIoTLinker(devicesData, guidMap ?? new Map<string, number>());
 
     if (!this.isEmbedded) {
       this.initDeviceMenu();
@@ -404,7 +428,7 @@ export class AppController {
     try {
       const bootstrapUrl = this.getBootstrapUrl();
       await this.ensureMappingLoaded(bootstrapUrl);
-      const devicesData = await this.fetchMapping(bootstrapUrl, true);
+      const devicesData = await this.fetchMapping(bootstrapUrl);
       const previousModelFile = this.modelFile;
 
       this.mapping = devicesData;
@@ -1,15 +1,31 @@
+import asyncio
 import base64
+import gzip
+import hashlib
 import json
+import mmap
 import os
+import re
+import shutil
+import sqlite3
+import struct
+import threading
 import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from email.utils import formatdate, parsedate_to_datetime
+from functools import partial
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
 
 import httpx
+import numpy as np
 import uvicorn
-from fastapi import FastAPI, HTTPException, Query
+from websockets.asyncio.client import connect as ws_connect
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 
 DEVICE_MAPPING_PATH = os.getenv("DEVICE_MAPPING_PATH", "data/devices.ifc.json")
 MAPPING_DIR = Path(os.getenv("MAPPING_DIR") or os.path.dirname(DEVICE_MAPPING_PATH)).resolve()
@@ -18,8 +34,235 @@ TB_API_KEY = os.getenv("TB_API_KEY")
 TB_USERNAME = os.getenv("TB_USERNAME")
 TB_PASSWORD = os.getenv("TB_PASSWORD")
 
+TB_HTTP_MAX_CONNECTIONS = int(os.getenv("TB_HTTP_MAX_CONNECTIONS", "100"))
+TB_HTTP_MAX_KEEPALIVE = int(os.getenv("TB_HTTP_MAX_KEEPALIVE", "20"))
+TB_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("TB_HTTP_KEEPALIVE_EXPIRY", "30"))
+TB_TOKEN_REFRESH_SEC = int(os.getenv("TB_TOKEN_REFRESH_SEC", "300"))
+TB_TOKEN_FALLBACK_TTL_SEC = int(os.getenv("TB_TOKEN_FALLBACK_TTL_SEC", "60"))
+TB_TOKEN_RETRY_MAX_SEC = float(os.getenv("TB_TOKEN_RETRY_MAX_SEC", "300"))
+TB_CIRCUIT_FAILURES = int(os.getenv("TB_CIRCUIT_FAILURES", "5"))
+TB_CIRCUIT_RESET_SEC = float(os.getenv("TB_CIRCUIT_RESET_SEC", "15"))
+TB_CIRCUIT_PROBES = int(os.getenv("TB_CIRCUIT_PROBES", "1"))
+TB_HTTP2 = os.getenv("TB_HTTP2", "").strip().lower() in {"1", "true", "yes"}
+ALARMS_CONCURRENCY = int(os.getenv("ALARMS_CONCURRENCY", "16"))
+TB_WS_ENABLED = os.getenv("TB_WS_ENABLED", "").strip().lower() in {"1", "true", "yes"}
+TB_WS_URL = os.getenv("TB_WS_URL", "").rstrip("/")
+TB_WS_RECONNECT_MAX_SEC = float(os.getenv("TB_WS_RECONNECT_MAX_SEC", "60"))
+TB_WS_CMDS_PER_MESSAGE = int(os.getenv("TB_WS_CMDS_PER_MESSAGE", "200"))
+TELEMETRY_STREAM_POLL_MS = int(os.getenv("TELEMETRY_STREAM_POLL_MS", "2000"))
+TELEMETRY_STREAM_HEARTBEAT_SEC = float(os.getenv("TELEMETRY_STREAM_HEARTBEAT_SEC", "15"))
+TELEMETRY_STREAM_QUEUE_SIZE = int(os.getenv("TELEMETRY_STREAM_QUEUE_SIZE", "100"))
+TELEMETRY_STORE_PATH = os.getenv("TELEMETRY_STORE_PATH", "")
+TELEMETRY_SYNC_INTERVAL_SEC = float(os.getenv("TELEMETRY_SYNC_INTERVAL_SEC", "60"))
+TELEMETRY_SYNC_BACKFILL_HOURS = int(os.getenv("TELEMETRY_SYNC_BACKFILL_HOURS", "720"))
+TELEMETRY_SYNC_PAGE_POINTS = int(os.getenv("TELEMETRY_SYNC_PAGE_POINTS", "5000"))
+TELEMETRY_SYNC_OVERLAP_MS = int(os.getenv("TELEMETRY_SYNC_OVERLAP_MS", "60000"))
+TELEMETRY_SYNC_CONCURRENCY = int(os.getenv("TELEMETRY_SYNC_CONCURRENCY", "4"))
+TELEMETRY_MAX_HOURS = int(os.getenv("TELEMETRY_MAX_HOURS", "8760" if TELEMETRY_STORE_PATH else "168"))
+TELEMETRY_BATCH_CONCURRENCY = int(os.getenv("TELEMETRY_BATCH_CONCURRENCY", "16"))
+TELEMETRY_PAGE_POINTS = max(1, int(os.getenv("TELEMETRY_PAGE_POINTS", "5000")))
+TELEMETRY_RAW_MAX_POINTS = int(os.getenv("TELEMETRY_RAW_MAX_POINTS", "200000"))
+PREDICTIONS_CONCURRENCY = int(os.getenv("PREDICTIONS_CONCURRENCY", "16"))
+PUBLISH_QUEUE_ENABLED = os.getenv("PUBLISH_QUEUE_ENABLED", "0").strip().lower() in {"1", "true", "yes"}
+PUBLISH_QUEUE_PATH = os.getenv("PUBLISH_QUEUE_PATH", "")
+PUBLISH_FLUSH_MS = int(os.getenv("PUBLISH_FLUSH_MS", "500"))
+PUBLISH_FLUSH_POINTS = int(os.getenv("PUBLISH_FLUSH_POINTS", "1000"))
+PUBLISH_MAX_PENDING = int(os.getenv("PUBLISH_MAX_PENDING", "50000"))
+PUBLISH_MAX_ATTEMPTS = int(os.getenv("PUBLISH_MAX_ATTEMPTS", "10"))
+PUBLISH_RETRY_MAX_SEC = float(os.getenv("PUBLISH_RETRY_MAX_SEC", "60"))
+TELEMETRY_BATCH_MAX_ITEMS = int(os.getenv("TELEMETRY_BATCH_MAX_ITEMS", "500"))
+MODEL_CACHE_MAX_BYTES = int(os.getenv("MODEL_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+MODEL_PRECOMPRESS = os.getenv("MODEL_PRECOMPRESS", "1").strip().lower() in {"1", "true", "yes"}
+MODEL_CHUNK_BYTES = 1024 * 1024
+SPATIAL_MAX_BUCKETS = int(os.getenv("SPATIAL_MAX_BUCKETS", "2000"))
+SPATIAL_RAW_MAX_POINTS = int(os.getenv("SPATIAL_RAW_MAX_POINTS", "20000"))
+MAPPING_WATCH_SEC = float(os.getenv("MAPPING_WATCH_SEC", "2"))
+TELEMETRY_CACHE_TTL_SEC = float(os.getenv("TELEMETRY_CACHE_TTL_SEC", "10"))
+TELEMETRY_CACHE_MAX_ENTRIES = int(os.getenv("TELEMETRY_CACHE_MAX_ENTRIES", "4096"))
+TELEMETRY_CACHE_MAX_POINTS = int(os.getenv("TELEMETRY_CACHE_MAX_POINTS", "2000000"))
+TELEMETRY_CACHE_STALE_SEC = float(os.getenv("TELEMETRY_CACHE_STALE_SEC", "300"))
+ALARMS_CACHE_TTL_SEC = float(os.getenv("ALARMS_CACHE_TTL_SEC", "5"))
+TELEMETRY_CACHE_QUANTUM_MS = int(os.getenv("TELEMETRY_CACHE_QUANTUM_MS", "5000"))
+TELEMETRY_BUFFER_MAX_POINTS = int(os.getenv("TELEMETRY_BUFFER_MAX_POINTS", "2000"))
+TELEMETRY_BUFFER_MAX_SERIES = int(os.getenv("TELEMETRY_BUFFER_MAX_SERIES", "10000"))
+TELEMETRY_BUFFER_REFRESH_MS = int(os.getenv("TELEMETRY_BUFFER_REFRESH_MS", "1000"))
+TB_TIMEOUTS = {
+    "login": float(os.getenv("TB_TIMEOUT_LOGIN", "10")),
+    "timeseries": float(os.getenv("TB_TIMEOUT_TIMESERIES", "10")),
+    "alarms": float(os.getenv("TB_TIMEOUT_ALARMS", "10")),
+    "publish": float(os.getenv("TB_TIMEOUT_PUBLISH", "10")),
+    "health": float(os.getenv("TB_TIMEOUT_HEALTH", "10")),
+}
 
-app = FastAPI(title="BIM-IOT Middleware")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by label values, rendered in Prometheus text format."""
+
+    def __init__(
+        self, name: str, help_text: str, labels: Tuple[str, ...], buckets: Tuple[float, ...]
+    ) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [0.0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(self._series.items()):
+            labels = ",".join(f'{k}="{v}"' for k, v in zip(self.labels, label_values))
+            prefix = f"{labels}," if labels else ""
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {int(count)}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {int(series[-2])}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}_count{suffix} {int(series[-2])}")
+            lines.append(f"{self.name}_sum{suffix} {series[-1]:.6f}")
+        return lines
+
+
+def render_gauge(
+    name: str, help_text: str, samples: List[Tuple[Dict[str, str], float]], kind: str = "gauge"
+) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+        lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    return lines
+
+
+http_duration = Histogram(
+    "bimiot_http_request_duration_seconds",
+    "Request latency per route.",
+    ("route", "method", "status"),
+    LATENCY_BUCKETS,
+)
+http_response_size = Histogram(
+    "bimiot_http_response_size_bytes", "Response body size per route.", ("route",), SIZE_BUCKETS
+)
+upstream_duration = Histogram(
+    "bimiot_thingsboard_request_duration_seconds",
+    "ThingsBoard call latency per operation.",
+    ("operation", "outcome"),
+    LATENCY_BUCKETS,
+)
+mapping_reload_duration = Histogram(
+    "bimiot_mapping_reload_duration_seconds", "Mapping file load and indexing time.", (), LATENCY_BUCKETS
+)
+in_flight = {"http": 0, "thingsboard": 0}
+
+# Per-request breakdown for the Server-Timing header: name -> [total seconds, count].
+request_timings: ContextVar[Optional[Dict[str, List[float]]]] = ContextVar("request_timings", default=None)
+
+
+def record_timing(name: str, seconds: float) -> None:
+    timings = request_timings.get()
+    if timings is not None:
+        entry = timings.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+
+def server_timing_header(timings: Dict[str, List[float]], total: float) -> str:
+    parts = [
+        f'{name};dur={value * 1000:.1f};desc="{int(count)}x"' for name, (value, count) in timings.items()
+    ]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse that reports its rendering time as `serialize` in Server-Timing."""
+
+    def render(self, content: Any) -> bytes:
+        started = time.perf_counter()
+        body = super().render(content)
+        record_timing("serialize", time.perf_counter() - started)
+        return body
+
+
+class MetricsMiddleware:
+    """Per-route latency/size histograms, in-flight count and the Server-Timing header."""
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        timings: Dict[str, List[float]] = {}
+        token = request_timings.set(timings)
+        state = {"status": 500, "size": 0}
+
+        async def send_wrapper(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                header = server_timing_header(timings, time.perf_counter() - started)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", header.encode("latin-1"))
+                ]
+            elif message["type"] == "http.response.body":
+                state["size"] += len(message.get("body", b""))
+            await send(message)
+
+        in_flight["http"] += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight["http"] -= 1
+            request_timings.reset(token)
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            http_duration.observe(time.perf_counter() - started, path, scope["method"], str(state["status"]))
+            http_response_size.observe(state["size"], path)
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    tb_client.start()
+    tasks: List[asyncio.Task] = []
+    load_mapping_at_startup()
+    if MAPPING_WATCH_SEC > 0:
+        tasks.append(asyncio.create_task(watch_mapping()))
+    tasks.append(asyncio.create_task(tb_client.refresh_loop()))
+    if telemetry_store.enabled:
+        telemetry_store.open()
+        tasks.append(asyncio.create_task(telemetry_store.sync_loop()))
+    if TB_WS_ENABLED:
+        tasks.append(asyncio.create_task(tb_stream.run()))
+    if publish_queue.enabled:
+        tasks.append(asyncio.create_task(publish_queue.run()))
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Let cancelled tasks unwind first: an interrupted publish flush puts its batch back
+        # so close() can flush it one last time.
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if publish_queue.enabled:
+            await publish_queue.close()
+        telemetry_store.close()
+        await tb_client.aclose()
+
+
+app = FastAPI(title="BIM-IOT Middleware", lifespan=lifespan, default_response_class=TimedJSONResponse)
 
 cors_origins = os.getenv("CORS_ORIGINS", "http://localhost:5173").split(",")
 app.add_middleware(
@@ -28,10 +271,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "ETag",
+        "X-Mapping-Version",
+        "Content-Range",
+        "Accept-Ranges",
+        "Last-Modified",
+        "Server-Timing",
+    ],
 )
+app.add_middleware(MetricsMiddleware)
 
 
-_mapping_cache: Optional[Dict[str, Any]] = None
+_mapping_index: Optional["MappingIndex"] = None
+_mapping_signature: Optional[Tuple[int, int]] = None
+_mapping_version = 0
+_mapping_lock = threading.Lock()
+_mapping_watch_error: Optional[str] = None
 
 
 def read_mapping_file() -> Dict[str, Any]:
@@ -41,19 +297,72 @@ def read_mapping_file() -> Dict[str, Any]:
         return json.load(handle)
 
 
-def load_mapping_cached() -> Dict[str, Any]:
-    if _mapping_cache is None:
+def mapping_file_signature() -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(DEVICE_MAPPING_PATH)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def current_mapping_index() -> Optional["MappingIndex"]:
+    return _mapping_index
+
+
+def load_mapping_index() -> "MappingIndex":
+    index = _mapping_index
+    if index is None:
         raise HTTPException(
             status_code=503,
             detail="Mapping not loaded. Call POST /refresh_mapping to load devices.ifc.json.",
         )
-    return _mapping_cache
+    return index
+
+
+def load_mapping_cached() -> Dict[str, Any]:
+    return load_mapping_index().mapping
 
 
 def refresh_mapping() -> Dict[str, Any]:
-    global _mapping_cache
-    _mapping_cache = read_mapping_file()
-    return _mapping_cache
+    """Read the mapping file, index it and swap it in as a whole."""
+    global _mapping_index, _mapping_signature, _mapping_version
+    with _mapping_lock:
+        signature = mapping_file_signature()
+        started = time.perf_counter()
+        mapping = read_mapping_file()
+        _mapping_version += 1
+        index = MappingIndex(mapping, _mapping_version)
+        elapsed = time.perf_counter() - started
+        index.load_ms = round(elapsed * 1000, 3)
+        mapping_reload_duration.observe(elapsed)
+        _mapping_index = index
+        _mapping_signature = signature
+    return mapping
+
+
+def load_mapping_at_startup() -> None:
+    global _mapping_watch_error
+    if not os.path.exists(DEVICE_MAPPING_PATH):
+        return
+    try:
+        refresh_mapping()
+    except Exception as exc:
+        _mapping_watch_error = exc.detail if isinstance(exc, HTTPException) else str(exc)
+
+
+async def watch_mapping() -> None:
+    """Reload the mapping whenever the file's mtime or size changes."""
+    global _mapping_watch_error
+    while True:
+        await asyncio.sleep(MAPPING_WATCH_SEC)
+        signature = mapping_file_signature()
+        if signature is None or signature == _mapping_signature:
+            continue
+        try:
+            await asyncio.to_thread(refresh_mapping)
+            _mapping_watch_error = None
+        except Exception as exc:
+            _mapping_watch_error = exc.detail if isinstance(exc, HTTPException) else str(exc)
 
 
 def resolve_model_path(filename: str) -> Path:
@@ -68,6 +377,414 @@ def resolve_model_path(filename: str) -> Path:
     return path
 
 
+def brotli_module() -> Any:
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def variant_marker(path: Path) -> Path:
+    """`<variant>.sha256`: the SHA-256 of the model bytes a compressed variant was made from."""
+    return path.with_name(path.name + ".sha256")
+
+
+class ModelAsset:
+    """Validators and precompressed variants of one version (mtime, size) of a model file."""
+
+    def __init__(self, path: Path, stat: os.stat_result, sha256: str) -> None:
+        self.path = path
+        self.stat = stat
+        self.size = stat.st_size
+        self.mtime_ns = stat.st_mtime_ns
+        self.mtime = stat.st_mtime
+        self.last_modified = formatdate(stat.st_mtime, usegmt=True)
+        self.sha256 = sha256
+        self.etag = f'"{sha256[:32]}"'
+        # (mtime_ns, size) of each sidecar already checked against its `.sha256` marker.
+        self._verified: Dict[str, Tuple[int, int]] = {}
+
+    def variant_path(self, encoding: str) -> Path:
+        suffix = {"gzip": ".gz", "br": ".br"}[encoding]
+        return self.path.with_name(self.path.name + suffix)
+
+    def variant(self, encoding: str) -> Optional[Path]:
+        """The compressed sidecar, if its `.sha256` marker says it was made from this content."""
+        path = self.variant_path(encoding)
+        try:
+            stat = path.stat()
+            signature = (stat.st_mtime_ns, stat.st_size)
+            if self._verified.get(encoding) == signature:
+                return path
+            source = variant_marker(path).read_text(encoding="utf-8").strip()
+        except OSError:
+            return None
+        if source != self.sha256:
+            return None
+        self._verified[encoding] = signature
+        return path
+
+    def variant_etag(self, encoding: str) -> str:
+        return f'"{self.sha256[:32]}-{"gz" if encoding == "gzip" else encoding}"'
+
+
+class ModelStore:
+    """Model files with cached content hashes, gzip/brotli sidecars and a bounded mmap cache.
+
+    The SHA-256 of each file version is kept in a `<file>.sha256` sidecar so restarts do
+    not rehash, compressed variants are generated once in the background next to the
+    file, and recently served files stay memory-mapped up to `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._assets: Dict[Path, ModelAsset] = {}
+        self._maps: "OrderedDict[Path, Tuple[Tuple[int, int, int], Any]]" = OrderedDict()
+        self._mapped_bytes = 0
+        self._compressing: set = set()
+        self._derived_cache: Dict[Tuple[Path, str], Tuple[str, Dict[str, Any]]] = {}
+        self._index_bodies: Dict[Path, Tuple[str, EncodedBody]] = {}
+        self._lock = threading.Lock()
+        self._index_lock = threading.Lock()
+
+    def asset(self, path: Path) -> ModelAsset:
+        stat = path.stat()
+        with self._lock:
+            cached = self._assets.get(path)
+        if cached and cached.mtime_ns == stat.st_mtime_ns and cached.size == stat.st_size:
+            return cached
+        asset = ModelAsset(path, stat, self._sha256(path, stat))
+        with self._lock:
+            self._assets[path] = asset
+        if MODEL_PRECOMPRESS:
+            self._precompress(asset)
+        return asset
+
+    def _sha256(self, path: Path, stat: os.stat_result) -> str:
+        sidecar = path.with_name(path.name + ".sha256")
+        signature = f"{stat.st_size} {stat.st_mtime_ns}"
+        try:
+            digest, _, stored = sidecar.read_text(encoding="utf-8").strip().partition(" ")
+            if stored == signature and digest:
+                return digest
+        except OSError:
+            pass
+        hasher = hashlib.sha256()
+        with path.open("rb") as handle:
+            for chunk in iter(lambda: handle.read(MODEL_CHUNK_BYTES), b""):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+        try:
+            sidecar.write_text(f"{digest} {signature}", encoding="utf-8")
+        except OSError:
+            pass
+        return digest
+
+    def _precompress(self, asset: ModelAsset) -> None:
+        encodings = ["gzip"] + (["br"] if brotli_module() else [])
+        pending = [enc for enc in encodings if asset.variant(enc) is None]
+        with self._lock:
+            pending = [enc for enc in pending if (asset.path, enc) not in self._compressing]
+            self._compressing.update((asset.path, enc) for enc in pending)
+        for encoding in pending:
+            threading.Thread(target=self._compress, args=(asset, encoding), daemon=True).start()
+
+    def _compress(self, asset: ModelAsset, encoding: str) -> None:
+        target = asset.variant_path(encoding)
+        marker = variant_marker(target)
+        tmp = target.with_name(target.name + ".tmp")
+        # Hash what is actually compressed: a model replaced mid-read yields a marker
+        # matching neither version, so the variant is never served.
+        hasher = hashlib.sha256()
+        try:
+            with asset.path.open("rb") as source:
+                chunks = iter(lambda: source.read(MODEL_CHUNK_BYTES), b"")
+                if encoding == "gzip":
+                    with tmp.open("wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as out:
+                        for chunk in chunks:
+                            hasher.update(chunk)
+                            out.write(chunk)
+                else:
+                    compressor = brotli_module().Compressor(quality=9)
+                    with tmp.open("wb") as out:
+                        for chunk in chunks:
+                            hasher.update(chunk)
+                            out.write(compressor.process(chunk))
+                        out.write(compressor.finish())
+            marker.unlink(missing_ok=True)
+            os.replace(tmp, target)
+            marker.write_text(hasher.hexdigest(), encoding="utf-8")
+        except OSError:
+            try:
+                tmp.unlink()
+            except OSError:
+                pass
+        finally:
+            with self._lock:
+                self._compressing.discard((asset.path, encoding))
+
+    def _derived(
+        self, path: Path, kind: str, build: Callable[[Any], Dict[str, Any]]
+    ) -> Tuple[ModelAsset, Dict[str, Any]]:
+        """Data extracted from a model, cached in memory and in a `<file>.<kind>.json` sidecar by hash."""
+        asset = self.asset(path)
+        with self._index_lock:
+            cached = self._derived_cache.get((path, kind))
+            if cached is not None and cached[0] == asset.sha256:
+                return asset, cached[1]
+            sidecar = path.with_name(f"{path.name}.{kind}.json")
+            payload = None
+            try:
+                stored = json.loads(sidecar.read_text(encoding="utf-8"))
+                if stored.get("sha256") == asset.sha256:
+                    payload = stored
+            except (OSError, ValueError):
+                pass
+            if payload is None:
+                payload = {"file": path.name, "sha256": asset.sha256, **build(self.view(path, asset.stat))}
+                tmp = sidecar.with_name(sidecar.name + ".tmp")
+                try:
+                    body = json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+                    tmp.write_text(body, encoding="utf-8")
+                    os.replace(tmp, sidecar)
+                except OSError:
+                    pass
+            self._derived_cache[(path, kind)] = (asset.sha256, payload)
+        return asset, payload
+
+    def index(self, path: Path) -> Tuple[ModelAsset, Dict[str, Any]]:
+        """GUID index of a model (see `extract_ifc_index`)."""
+        return self._derived(path, "index", extract_ifc_index)
+
+    def index_body(self, path: Path) -> "EncodedBody":
+        asset, payload = self.index(path)
+        with self._index_lock:
+            cached = self._index_bodies.get(path)
+            if cached is None or cached[0] != asset.sha256:
+                cached = (asset.sha256, EncodedBody(payload))
+                self._index_bodies[path] = cached
+        return cached[1]
+
+    def spatial(self, path: Path) -> Tuple[ModelAsset, Dict[str, Any]]:
+        """Spatial tree and element placement of a model (see `extract_ifc_spatial`)."""
+        _, index = self.index(path)
+        return self._derived(path, "spatial", partial(extract_ifc_spatial, index=index))
+
+    def view(self, path: Path, stat: os.stat_result) -> Any:
+        """Memory-mapped content of `path`, kept in an LRU bounded by total mapped bytes.
+
+        A map is reused only for the same (size, mtime, inode), so a file rewritten in place
+        or replaced with one of the same size is mapped afresh.
+        """
+        size = stat.st_size
+        if size == 0:
+            return b""
+        version = (size, stat.st_mtime_ns, stat.st_ino)
+        with self._lock:
+            cached = self._maps.get(path)
+            if cached is not None and cached[0] == version:
+                self._maps.move_to_end(path)
+                return cached[1]
+        with path.open("rb") as handle:
+            view = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        with self._lock:
+            previous = self._maps.pop(path, None)
+            if previous is not None:
+                self._mapped_bytes -= previous[0][0]
+            if size <= self.max_bytes:
+                self._maps[path] = (version, view)
+                self._mapped_bytes += size
+            # Evicted maps are only dereferenced: streams still reading them keep them alive.
+            while self._mapped_bytes > self.max_bytes and self._maps:
+                _, (evicted_version, _) = self._maps.popitem(last=False)
+                self._mapped_bytes -= evicted_version[0]
+        return view
+
+
+model_store = ModelStore(MODEL_CACHE_MAX_BYTES)
+
+
+# IfcRoot instances: `#id=IFCTYPE('GlobalId',#owner,'Name'|$,...`. Entities may span lines,
+# so the pattern runs over the mapped file instead of per line.
+IFC_ROOT_PATTERN = re.compile(
+    rb"#(\d+)\s*=\s*(IFC[A-Z0-9_]+)\s*\(\s*'([0-9A-Za-z_$]{22})'\s*,\s*[^,]*,\s*('(?:[^']|'')*'|\$)"
+)
+STEP_ESCAPE_PATTERN = re.compile(r"\\X2\\((?:[0-9A-F]{4})+)\\X0\\|\\X\\([0-9A-F]{2})|\\S\\(.)")
+
+
+def decode_step_string(raw: bytes) -> Optional[str]:
+    """Decode a quoted STEP string literal (`''`, `\\X2\\`, `\\X\\` and `\\S\\` escapes)."""
+    if raw == b"$":
+        return None
+    text = raw[1:-1].decode("latin-1").replace("''", "'")
+
+    def unescape(match: "re.Match[str]") -> str:
+        if match.group(1):
+            return bytes.fromhex(match.group(1)).decode("utf-16-be", errors="replace")
+        if match.group(2):
+            return chr(int(match.group(2), 16))
+        return chr(ord(match.group(3)) + 128)
+
+    return STEP_ESCAPE_PATTERN.sub(unescape, text) if "\\" in text else text
+
+
+def extract_ifc_index(view: Any) -> Dict[str, Any]:
+    """GlobalId -> expressID, IFC type and Name for every IfcRoot entity, as parallel arrays."""
+    types: Dict[str, int] = {}
+    guids: List[str] = []
+    ids: List[int] = []
+    type_ids: List[int] = []
+    names: List[Optional[str]] = []
+    for match in IFC_ROOT_PATTERN.finditer(view):
+        ifc_type = match.group(2).decode("ascii")
+        guids.append(match.group(3).decode("ascii"))
+        ids.append(int(match.group(1)))
+        type_ids.append(types.setdefault(ifc_type, len(types)))
+        names.append(decode_step_string(match.group(4)))
+    return {
+        "count": len(guids),
+        "types": list(types),
+        "guids": guids,
+        "ids": ids,
+        "typeIds": type_ids,
+        "names": names,
+    }
+
+
+STEP_TEXT = rb"(?:'(?:[^']|'')*'|\$)"
+IFC_REL_AGGREGATES_PATTERN = re.compile(
+    rb"=\s*IFCRELAGGREGATES\s*\(\s*'[^']*'\s*,[^,]*,\s*" + STEP_TEXT + rb"\s*,\s*" + STEP_TEXT
+    + rb"\s*,\s*#(\d+)\s*,\s*\(([^)]*)\)"
+)
+IFC_REL_CONTAINED_PATTERN = re.compile(
+    rb"=\s*IFCRELCONTAINEDINSPATIALSTRUCTURE\s*\(\s*'[^']*'\s*,[^,]*,\s*" + STEP_TEXT + rb"\s*,\s*"
+    + STEP_TEXT + rb"\s*,\s*\(([^)]*)\)\s*,\s*#(\d+)"
+)
+STEP_REF_PATTERN = re.compile(rb"#(\d+)")
+IFC_SPATIAL_TYPES = {
+    "IFCPROJECT",
+    "IFCSITE",
+    "IFCBUILDING",
+    "IFCBUILDINGSTOREY",
+    "IFCSPACE",
+    "IFCFACILITY",
+    "IFCFACILITYPART",
+    "IFCBRIDGE",
+    "IFCROAD",
+    "IFCRAILWAY",
+    "IFCMARINEFACILITY",
+    "IFCEXTERNALSPATIALELEMENT",
+    "IFCSPATIALZONE",
+}
+SPATIAL_LEVELS = {
+    "site": "IFCSITE",
+    "building": "IFCBUILDING",
+    "storey": "IFCBUILDINGSTOREY",
+    "space": "IFCSPACE",
+}
+
+
+def extract_ifc_spatial(view: Any, index: Dict[str, Any]) -> Dict[str, Any]:
+    """Spatial tree (IfcRelAggregates) and the spatial node holding each element.
+
+    Elements are placed by IfcRelContainedInSpatialStructure; parts aggregated into an
+    element inherit the container of their whole.
+    """
+    kinds = {eid: index["types"][type_id] for eid, type_id in zip(index["ids"], index["typeIds"])}
+    position = {eid: i for i, eid in enumerate(index["ids"])}
+    parent: Dict[int, int] = {}
+    for match in IFC_REL_AGGREGATES_PATTERN.finditer(view):
+        whole = int(match.group(1))
+        for part in STEP_REF_PATTERN.findall(match.group(2)):
+            parent.setdefault(int(part), whole)
+    container: Dict[int, int] = {}
+    for match in IFC_REL_CONTAINED_PATTERN.finditer(view):
+        structure = int(match.group(2))
+        for element in STEP_REF_PATTERN.findall(match.group(1)):
+            container.setdefault(int(element), structure)
+
+    spatial = {eid for eid, kind in kinds.items() if kind in IFC_SPATIAL_TYPES}
+    nodes = []
+    for eid in sorted(spatial):
+        up = parent.get(eid, container.get(eid))
+        i = position[eid]
+        nodes.append(
+            {
+                "id": eid,
+                "guid": index["guids"][i],
+                "type": kinds[eid],
+                "name": index["names"][i],
+                "parent": up if up in spatial else None,
+            }
+        )
+
+    element_ids: List[int] = []
+    element_nodes: List[int] = []
+    for eid in kinds:
+        if eid in spatial:
+            continue
+        current: Optional[int] = eid
+        seen = set()
+        while current is not None and current not in seen:
+            seen.add(current)
+            if current in container:
+                element_ids.append(eid)
+                element_nodes.append(container[current])
+                break
+            current = parent.get(current)
+            if current in spatial:
+                element_ids.append(eid)
+                element_nodes.append(current)
+                break
+    return {"nodes": nodes, "elementIds": element_ids, "elementNodes": element_nodes}
+
+
+def parse_byte_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Inclusive (start, end) of a single `bytes=` range; None when absent or unsupported."""
+    if not header or not header.strip().lower().startswith("bytes="):
+        return None
+    spec = header.strip()[6:].strip()
+    if "," in spec:
+        return None
+    first, _, last = spec.partition("-")
+    try:
+        if first == "":
+            suffix = int(last)
+            start, end = max(0, size - suffix), size - 1
+            if suffix == 0:
+                start = size
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable.",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, end
+
+
+def not_modified_since(header: Optional[str], mtime: float) -> bool:
+    if not header:
+        return False
+    try:
+        return int(mtime) <= parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+def iter_view(view: Any, start: int, end: int) -> Iterator[bytes]:
+    position = start
+    while position <= end:
+        stop = min(end + 1, position + MODEL_CHUNK_BYTES)
+        yield view[position:stop]
+        position = stop
+
+
 def get_device(mapping: Dict[str, Any], device_id: str) -> Dict[str, Any]:
     devices = mapping.get("devices", {})
     device = devices.get(device_id)
@@ -76,7 +793,146 @@ def get_device(mapping: Dict[str, Any], device_id: str) -> Dict[str, Any]:
     return device
 
 
+def list_tb_originators(mapping: Dict[str, Any]) -> List[Tuple[str, str, str]]:
+    """(device id, entity type, ThingsBoard id) for every ThingsBoard-connected device."""
+    devices = mapping.get("devices", {}) if isinstance(mapping, dict) else {}
+    originators: List[Tuple[str, str, str]] = []
+    for device_id, data in devices.items():
+        connector = data.get("connector", {}) if isinstance(data, dict) else {}
+        if connector.get("type") != "thingsboard":
+            continue
+        device_tb_id = connector.get("deviceId")
+        if not device_tb_id:
+            continue
+        entity_type = (connector.get("entityType") or "DEVICE").upper()
+        if entity_type not in {"DEVICE", "ASSET"}:
+            continue
+        originators.append((device_id, entity_type, device_tb_id))
+    return originators
+
+
+class EncodedBody:
+    """A JSON payload serialised once, with its gzip variant and strong ETag."""
+
+    def __init__(self, payload: Any) -> None:
+        self.identity = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        self.gzip = gzip.compress(self.identity, compresslevel=6, mtime=0)
+        digest = hashlib.sha256(self.identity).hexdigest()[:32]
+        self.etag = f'"{digest}"'
+        self.gzip_etag = f'"{digest}-gz"'
+
+
+def etag_matches(if_none_match: Optional[str], *etags: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or any(etag in candidates for etag in etags)
+
+
+def accepted_encodings(request: Request) -> Dict[str, float]:
+    """Accept-Encoding as coding -> q-value."""
+    weights: Dict[str, float] = {}
+    for part in request.headers.get("accept-encoding", "").split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding] = weight
+    return weights
+
+
+def encoding_weight(weights: Dict[str, float], encoding: str) -> float:
+    """q-value of `encoding`; 0 means refused (`q=0`, or not listed and not covered by `*`)."""
+    return weights.get(encoding, weights.get("*", 0.0))
+
+
+def accepts_gzip(request: Request) -> bool:
+    return encoding_weight(accepted_encodings(request), "gzip") > 0
+
+
+def encoded_json_response(request: Request, body: EncodedBody, headers: Dict[str, str]) -> Response:
+    """Serve a precomputed body, answering 304 when the client already holds it."""
+    use_gzip = accepts_gzip(request)
+    headers = {
+        **headers,
+        "ETag": body.gzip_etag if use_gzip else body.etag,
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if etag_matches(request.headers.get("if-none-match"), body.etag, body.gzip_etag):
+        return Response(status_code=304, headers=headers)
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+        return Response(body.gzip, media_type="application/json", headers=headers)
+    return Response(body.identity, media_type="application/json", headers=headers)
+
+
+class MappingIndex:
+    """A loaded mapping plus the lookup tables the hot endpoints use."""
+
+    def __init__(self, mapping: Dict[str, Any], version: int) -> None:
+        self.mapping = mapping
+        self.version = version
+        self.loaded_ts = int(time.time() * 1000)
+        self.load_ms = 0.0
+        devices = mapping.get("devices", {}) if isinstance(mapping, dict) else {}
+        self.devices: Dict[str, Any] = devices if isinstance(devices, dict) else {}
+        self.tb_settings = parse_tb_settings(mapping)
+        self.tb_originators = list_tb_originators(mapping)
+        self.by_tb_id: Dict[str, List[str]] = {}
+        for device_id, _, device_tb_id in self.tb_originators:
+            self.by_tb_id.setdefault(device_tb_id, []).append(device_id)
+        self.by_type: Dict[str, List[str]] = {}
+        self.by_guid: Dict[str, str] = {}
+        self.device_list: List[Dict[str, Any]] = []
+        for device_id, data in self.devices.items():
+            if not isinstance(data, dict):
+                continue
+            self.by_type.setdefault(str(data.get("type")), []).append(device_id)
+            for guid in data.get("ifcGuids") or []:
+                self.by_guid.setdefault(str(guid), device_id)
+            self.device_list.append(
+                {
+                    "id": device_id,
+                    "type": data.get("type"),
+                    "connector": data.get("connector", {}),
+                }
+            )
+        self.mapping_body = EncodedBody(mapping)
+        self.devices_body = EncodedBody({"devices": self.device_list})
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"X-Mapping-Version": str(self.version)}
+
+
+async def gather_bounded(calls: List[Callable[[], Awaitable[Any]]], limit: int) -> List[Any]:
+    """Run calls concurrently, at most `limit` at a time; exceptions are returned in place."""
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(call: Callable[[], Awaitable[Any]]) -> Any:
+        async with semaphore:
+            return await call()
+
+    return await asyncio.gather(*(run(call) for call in calls), return_exceptions=True)
+
+
 def get_tb_settings(mapping: Dict[str, Any]) -> Dict[str, str]:
+    index = _mapping_index
+    if index is not None and index.mapping is mapping:
+        return index.tb_settings
+    return parse_tb_settings(mapping)
+
+
+def parse_tb_settings(mapping: Dict[str, Any]) -> Dict[str, str]:
     tb = mapping.get("backend", {}).get("thingsboard", {}) if isinstance(mapping, dict) else {}
     return {
         "baseUrl": str(tb.get("baseUrl") or "").rstrip("/"),
@@ -119,16 +975,257 @@ def parse_interval_ms(value: Optional[str]) -> Optional[int]:
     )
 
 
+def http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class SeriesColumns:
+    """One series as parallel int64 ts / float64 value arrays (NaN where a value is not numeric).
+
+    `text` keeps the original values (floats where numeric) when some of them are not.
+    """
+
+    __slots__ = ("ts", "value", "text")
+
+    def __init__(self, ts: np.ndarray, value: np.ndarray, text: Optional[np.ndarray] = None) -> None:
+        self.ts = ts
+        self.value = value
+        self.text = text
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    @classmethod
+    def from_points(cls, points: List[Dict[str, Any]]) -> "SeriesColumns":
+        ts = np.fromiter((p["ts"] for p in points), dtype=np.int64, count=len(points))
+        values = np.fromiter((numeric_value(p["value"]) for p in points), dtype=np.float64, count=len(points))
+        text = None
+        if np.isnan(values).any():
+            text = np.fromiter((p["value"] for p in points), dtype=object, count=len(points))
+        return cls(ts, values, text)
+
+    @classmethod
+    def concat(cls, parts: List["SeriesColumns"]) -> "SeriesColumns":
+        if len(parts) == 1:
+            return parts[0]
+        text = None
+        if any(part.text is not None for part in parts):
+            text = np.concatenate([part.value.astype(object) if part.text is None else part.text for part in parts])
+        return cls(np.concatenate([part.ts for part in parts]), np.concatenate([part.value for part in parts]), text)
+
+    def select(self, index: Any) -> "SeriesColumns":
+        """The points at `index` (a slice, mask or index array)."""
+        return SeriesColumns(self.ts[index], self.value[index], None if self.text is None else self.text[index])
+
+    def values_list(self) -> List[Any]:
+        return (self.value if self.text is None else self.text).tolist()
+
+    def points(self) -> List[Dict[str, Any]]:
+        return [{"ts": ts, "value": value} for ts, value in zip(self.ts.tolist(), self.values_list())]
+
+
+def parse_tb_columns(raw_points: List[Dict[str, Any]]) -> SeriesColumns:
+    """ThingsBoard `[{ts, value: "str"}]` straight into ts-ordered arrays, without per-point dicts."""
+    ts = np.fromiter((item["ts"] for item in raw_points), dtype=np.int64, count=len(raw_points))
+    raw_values = [item.get("value") for item in raw_points]
+    text = None
+    try:
+        if None in raw_values:
+            raise ValueError
+        values = np.asarray(raw_values, dtype=np.float64)
+    except (TypeError, ValueError):
+        values = np.fromiter(
+            (numeric_value(value) for value in raw_values), dtype=np.float64, count=len(raw_values)
+        )
+        text = np.fromiter(raw_values, dtype=object, count=len(raw_values))
+        numeric = ~np.isnan(values)
+        text[numeric] = values[numeric].tolist()
+    return SeriesColumns(ts, values, text).select(np.argsort(ts, kind="stable"))
+
+
+def parse_tb_points(raw_points: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """ThingsBoard `[{ts, value: "str"}]` as ts-ordered points with numeric values where possible."""
+    return parse_tb_columns(raw_points).points()
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open (fail fast) -> half-open (probes) -> closed."""
+
+    def __init__(self, failure_threshold: int, reset_sec: float, probes: int) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_sec = reset_sec
+        self.probes = max(1, probes)
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened = 0
+        self.rejected = 0
+        self._probing = 0
+
+    def before(self) -> bool:
+        """Admit a call or raise 503; returns True when the call is a half-open probe."""
+        if self.failure_threshold <= 0 or self.state == "closed":
+            return False
+        if self.state == "open":
+            remaining = self.opened_at + self.reset_sec - time.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail="ThingsBoard unavailable (circuit open).",
+                    headers={"Retry-After": str(max(1, int(remaining + 0.999)))},
+                )
+            self.state = "half-open"
+        if self._probing >= self.probes:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="ThingsBoard unavailable (circuit half-open).",
+                headers={"Retry-After": "1"},
+            )
+        self._probing += 1
+        return True
+
+    def release(self, probe: bool) -> None:
+        """End a call that neither succeeded nor failed upstream (e.g. cancelled)."""
+        if probe:
+            self._probing -= 1
+
+    def record(self, ok: bool, probe: bool) -> None:
+        if probe:
+            self._probing -= 1
+        if ok:
+            self.failures = 0
+            self.state = "closed"
+            return
+        self.failures += 1
+        if self.failure_threshold > 0 and (probe or self.failures >= self.failure_threshold):
+            if self.state != "open":
+                self.opened += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutiveFailures": self.failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+tb_circuit = CircuitBreaker(TB_CIRCUIT_FAILURES, TB_CIRCUIT_RESET_SEC, TB_CIRCUIT_PROBES)
+
+
 class ThingsBoardClient:
     def __init__(self) -> None:
         self._token: Optional[str] = None
         self._token_exp: int = 0
+        self._token_exp_known = False
+        self._token_owner: Optional[Tuple[str, str]] = None
+        self._login_lock = asyncio.Lock()
+        self._http: Optional[httpx.AsyncClient] = None
+        self.logins = 0
+        self.refresh_error: Optional[str] = None
 
-    async def _get_auth_header(self, mapping: Dict[str, Any]) -> Dict[str, str]:
+    def start(self) -> httpx.AsyncClient:
+        if self._http is None or self._http.is_closed:
+            limits = httpx.Limits(
+                max_connections=TB_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=TB_HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=TB_HTTP_KEEPALIVE_EXPIRY,
+            )
+            self._http = httpx.AsyncClient(
+                limits=limits,
+                timeout=10,
+                http2=TB_HTTP2 and http2_available(),
+            )
+        return self._http
+
+    async def aclose(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        return self.start()
+
+    async def send(
+        self,
+        mapping: Dict[str, Any],
+        method: str,
+        url: str,
+        route: str,
+        **kwargs: Any,
+    ) -> httpx.Response:
+        """Authenticated request on the shared pool, retrying once with a fresh JWT on 401."""
+        timeout = TB_TIMEOUTS.get(route, 10)
+        headers = await self._get_auth_header(mapping)
+        response = await self.request(method, url, route, headers=headers, timeout=timeout, **kwargs)
+        if response.status_code == 401 and headers["X-Authorization"].startswith("Bearer "):
+            self.invalidate(headers["X-Authorization"][len("Bearer ") :])
+            headers = await self._get_auth_header(mapping)
+            response = await self.request(method, url, route, headers=headers, timeout=timeout, **kwargs)
+        return response
+
+    async def request(self, method: str, url: str, route: str, **kwargs: Any) -> httpx.Response:
+        """One upstream call through the circuit breaker; 5xx and transport errors count as failures."""
+        probe = tb_circuit.before()
+        started = time.perf_counter()
+        outcome = "cancelled"
+        in_flight["thingsboard"] += 1
+        try:
+            response = await self.http.request(method, url, **kwargs)
+            outcome = f"{response.status_code // 100}xx"
+        except httpx.TimeoutException:
+            outcome = "timeout"
+            tb_circuit.record(False, probe)
+            raise HTTPException(status_code=504, detail="ThingsBoard request timed out.")
+        except httpx.TransportError as exc:
+            outcome = "error"
+            tb_circuit.record(False, probe)
+            raise HTTPException(status_code=502, detail=f"ThingsBoard unreachable: {exc}")
+        except BaseException:
+            tb_circuit.release(probe)
+            raise
+        finally:
+            in_flight["thingsboard"] -= 1
+            elapsed = time.perf_counter() - started
+            upstream_duration.observe(elapsed, route, outcome)
+            if route != "login":
+                record_timing("upstream", elapsed)
+        tb_circuit.record(response.status_code < 500, probe)
+        return response
+
+    def invalidate(self, token: str) -> None:
+        """Drop `token` if it is still current; a newer token obtained meanwhile is kept."""
+        if self._token == token:
+            self._token = None
+
+    def _credentials(self, mapping: Dict[str, Any]) -> Tuple[str, str, str, str]:
         settings = get_tb_settings(mapping)
-        api_key = TB_API_KEY or settings.get("apiKey")
-        username = TB_USERNAME or settings.get("username")
-        password = TB_PASSWORD or settings.get("password")
+        return (
+            TB_API_KEY or settings.get("apiKey") or "",
+            TB_USERNAME or settings.get("username") or "",
+            TB_PASSWORD or settings.get("password") or "",
+            TB_BASE_URL or settings.get("baseUrl") or "",
+        )
+
+    def _valid_token(self, owner: Tuple[str, str], margin: int) -> Optional[str]:
+        if not self._token_exp_known:
+            # Without a readable `exp` the fallback expiry is already conservative.
+            margin = 0
+        if self._token and self._token_owner == owner and self._token_exp - int(time.time()) > margin:
+            return self._token
+        return None
+
+    async def _get_auth_header(self, mapping: Dict[str, Any]) -> Dict[str, str]:
+        api_key, username, password, base_url = self._credentials(mapping)
 
         if api_key:
             return {"X-Authorization": f"ApiKey {api_key}"}
@@ -139,28 +1236,69 @@ class ThingsBoardClient:
                 detail="Missing ThingsBoard credentials. Set TB_API_KEY or TB_USERNAME/TB_PASSWORD.",
             )
 
-        now = int(time.time())
-        if self._token and self._token_exp - now > 60:
-            return {"X-Authorization": f"Bearer {self._token}"}
+        owner = (base_url, username)
+        token = self._valid_token(owner, 60)
+        if token is None:
+            started = time.perf_counter()
+            try:
+                token = await self._login(owner, password, 60)
+            finally:
+                record_timing("auth", time.perf_counter() - started)
+        return {"X-Authorization": f"Bearer {token}"}
 
-        base_url = TB_BASE_URL or settings.get("baseUrl")
-        if not base_url:
-            raise HTTPException(status_code=500, detail="Missing TB_BASE_URL.")
+    async def _login(self, owner: Tuple[str, str], password: str, margin: int) -> str:
+        """Single-flight login: concurrent callers wait for one request and share its token."""
+        async with self._login_lock:
+            token = self._valid_token(owner, margin)
+            if token is not None:
+                return token
+            base_url, username = owner
+            if not base_url:
+                raise HTTPException(status_code=500, detail="Missing TB_BASE_URL.")
 
-        login_url = f"{base_url}/api/auth/login"
-        async with httpx.AsyncClient(timeout=10) as client:
-            response = await client.post(
-                login_url, json={"username": username, "password": password}
+            login_url = f"{base_url}/api/auth/login"
+            self.logins += 1
+            response = await self.request(
+                "POST",
+                login_url,
+                "login",
+                json={"username": username, "password": password},
+                timeout=TB_TIMEOUTS["login"],
             )
-        if response.status_code != 200:
-            raise HTTPException(status_code=502, detail="ThingsBoard login failed.")
-        data = response.json()
-        token = data.get("token")
-        if not token:
-            raise HTTPException(status_code=502, detail="ThingsBoard login missing token.")
-        self._token = token
-        self._token_exp = parse_jwt_exp(token)
-        return {"X-Authorization": f"Bearer {token}"}
+            if response.status_code != 200:
+                raise HTTPException(status_code=502, detail="ThingsBoard login failed.")
+            data = response.json()
+            token = data.get("token")
+            if not token:
+                raise HTTPException(status_code=502, detail="ThingsBoard login missing token.")
+            self._token = token
+            exp = parse_jwt_exp(token)
+            self._token_exp_known = exp > 0
+            self._token_exp = exp if exp > 0 else int(time.time()) + TB_TOKEN_FALLBACK_TTL_SEC
+            self._token_owner = owner
+            return token
+
+    async def refresh_loop(self) -> None:
+        """Log in ahead of the JWT `exp` so requests never wait for authentication."""
+        failures = 0
+        while True:
+            delay = 60.0
+            index = current_mapping_index()
+            if index is not None:
+                api_key, username, password, base_url = self._credentials(index.mapping)
+                if not api_key and username and password:
+                    try:
+                        await self._login((base_url, username), password, TB_TOKEN_REFRESH_SEC)
+                        self.refresh_error = None
+                        failures = 0
+                        remaining = self._token_exp - int(time.time())
+                        lead = TB_TOKEN_REFRESH_SEC if self._token_exp_known else 0
+                        delay = min(60.0, max(5.0, remaining - lead))
+                    except Exception as exc:
+                        self.refresh_error = str(getattr(exc, "detail", exc))
+                        failures += 1
+                        delay = min(TB_TOKEN_RETRY_MAX_SEC, 10.0 * 2 ** (failures - 1))
+            await asyncio.sleep(delay)
 
     async def fetch_timeseries(
         self,
@@ -174,7 +1312,10 @@ class ThingsBoardClient:
         start_ts: Optional[int] = None,
         end_ts: Optional[int] = None,
         interval: Optional[int] = None,
-    ) -> Dict[str, List[Dict[str, Any]]]:
+        order_by: Optional[str] = None,
+        columns: bool = False,
+    ) -> Dict[str, Any]:
+        """Points per key; `columns=True` parses them into SeriesColumns instead of point dicts."""
         settings = get_tb_settings(mapping)
         base_url = TB_BASE_URL or settings.get("baseUrl")
         if not base_url:
@@ -193,16 +1334,11 @@ class ThingsBoardClient:
         }
         if interval:
             params["interval"] = interval
+        if order_by:
+            params["orderBy"] = order_by
 
         url = f"{base_url}/api/plugins/telemetry/{entity_type}/{device_id}/values/timeseries"
-        headers = await self._get_auth_header(mapping)
-
-        async with httpx.AsyncClient(timeout=10) as client:
-            response = await client.get(url, params=params, headers=headers)
-            if response.status_code == 401 and not (TB_API_KEY or settings.get("apiKey")):
-                self._token = None
-                headers = await self._get_auth_header(mapping)
-                response = await client.get(url, params=params, headers=headers)
+        response = await self.send(mapping, "GET", url, "timeseries", params=params)
 
         if response.status_code != 200:
             detail = "ThingsBoard telemetry fetch failed."
@@ -218,20 +1354,63 @@ class ThingsBoardClient:
             raise HTTPException(status_code=502, detail=detail)
 
         payload = response.json()
-        series: Dict[str, List[Dict[str, Any]]] = {}
-        for key, raw_points in payload.items():
-            points = []
-            for item in raw_points:
-                ts = item.get("ts")
-                value = item.get("value")
-                try:
-                    value = float(value)
-                except (TypeError, ValueError):
-                    pass
-                points.append({"ts": ts, "value": value})
-            points.sort(key=lambda item: item["ts"])
-            series[key] = points
-        return series
+        parse = parse_tb_columns if columns else parse_tb_points
+        return {key: parse(raw_points) for key, raw_points in payload.items()}
+
+    async def fetch_window(
+        self,
+        device_id: str,
+        keys: List[str],
+        start_ts: int,
+        end_ts: int,
+        max_points: int,
+        mapping: Dict[str, Any],
+        entity_type: str = "DEVICE",
+        columns: bool = False,
+    ) -> Dict[str, Any]:
+        """Raw points of the whole window, paged forward `TELEMETRY_PAGE_POINTS` at a time.
+
+        Each key stops after `max_points` points; keys whose next page starts at the same
+        ts share one request. Pages are kept as SeriesColumns and joined at the end.
+        """
+        parts: Dict[str, List[SeriesColumns]] = {key: [] for key in keys}
+        counts = {key: 0 for key in keys}
+        cursors = {key: start_ts for key in keys}
+        while cursors:
+            groups: Dict[int, List[str]] = {}
+            for key, cursor in cursors.items():
+                groups.setdefault(cursor, []).append(key)
+            for cursor, group in groups.items():
+                page = min(TELEMETRY_PAGE_POINTS, max(max_points - min(counts[k] for k in group), 1))
+                fetched = await self.fetch_timeseries(
+                    device_id=device_id,
+                    keys=",".join(group),
+                    limit=page,
+                    hours=0,
+                    mapping=mapping,
+                    entity_type=entity_type,
+                    start_ts=cursor,
+                    end_ts=end_ts,
+                    order_by="ASC",
+                    columns=True,
+                )
+                for key in group:
+                    fetched_page = fetched.get(key)
+                    fetched_count = len(fetched_page) if fetched_page is not None else 0
+                    if fetched_count:
+                        keep = max_points - counts[key]
+                        if fetched_count > keep:
+                            fetched_page = fetched_page.select(slice(keep))
+                        parts[key].append(fetched_page)
+                        counts[key] += len(fetched_page)
+                    if fetched_count < page or counts[key] >= max_points:
+                        cursors.pop(key)
+                    else:
+                        cursors[key] = int(fetched_page.ts[-1]) + 1
+        series = {key: SeriesColumns.concat(pages) for key, pages in parts.items() if pages}
+        if columns:
+            return series
+        return {key: points.points() for key, points in series.items()}
 
     async def fetch_alarm_page(
         self,
@@ -257,13 +1436,7 @@ class ThingsBoardClient:
         if search_status:
             params["searchStatus"] = str(search_status).upper()
 
-        headers = await self._get_auth_header(mapping)
-        async with httpx.AsyncClient(timeout=10) as client:
-            response = await client.get(url, params=params, headers=headers)
-            if response.status_code == 401 and not (TB_API_KEY or settings.get("apiKey")):
-                self._token = None
-                headers = await self._get_auth_header(mapping)
-                response = await client.get(url, params=params, headers=headers)
+        response = await self.send(mapping, "GET", url, "alarms", params=params)
 
         if response.status_code != 200:
             detail = "ThingsBoard alarm fetch failed."
@@ -296,17 +1469,10 @@ class ThingsBoardClient:
             raise HTTPException(status_code=400, detail="Invalid alarm action.")
 
         url = f"{base_url}/api/alarm/{alarm_id}/{action}"
-        headers = await self._get_auth_header(mapping)
-        async with httpx.AsyncClient(timeout=10) as client:
-            response = await client.post(url, headers=headers)
-            if response.status_code == 401 and not (TB_API_KEY or settings.get("apiKey")):
-                self._token = None
-                headers = await self._get_auth_header(mapping)
-                response = await client.post(url, headers=headers)
-
-            if response.status_code in {404, 405} and action == "clear":
-                alt_url = f"{base_url}/api/alarm/{alarm_id}/clear"
-                response = await client.post(alt_url, headers=headers)
+        response = await self.send(mapping, "POST", url, "alarms")
+        if response.status_code in {404, 405} and action == "clear":
+            alt_url = f"{base_url}/api/alarm/{alarm_id}/clear"
+            response = await self.send(mapping, "POST", alt_url, "alarms")
 
         if response.status_code not in {200, 202, 204}:
             detail = "ThingsBoard alarm action failed."
@@ -332,17 +1498,836 @@ class ThingsBoardClient:
 tb_client = ThingsBoardClient()
 
 
-async def build_telemetry(
-    mapping: Dict[str, Any],
-    device_id: str,
-    key: Optional[str],
-    limit: int,
-    hours: int,
-    agg: Optional[str] = None,
+class UpstreamCache:
+    """Read-through cache for ThingsBoard responses.
+
+    Entries are fresh for `ttl_sec`; for `stale_sec` after that they are returned at
+    once, marked stale, while a background fetch revalidates them. When the upstream
+    fetch fails, any entry still held is served stale instead of the error. Entries are
+    evicted least-recently-used once either `max_entries` or `max_points` (a proxy for
+    memory) is exceeded, and concurrent misses on the same key share a single fetch.
+    Keys of relative windows move with time, so a lookup may name a `family` (the key
+    without its window) whose latest entry stands in when the upstream fails.
+    """
+
+    def __init__(self, ttl_sec: float, max_entries: int, max_points: int, stale_sec: float = 0) -> None:
+        self.ttl_sec = ttl_sec
+        self.stale_sec = stale_sec
+        self.max_entries = max_entries
+        self.max_points = max_points
+        self._entries: "OrderedDict[Tuple[Any, ...], Tuple[float, int, Dict[str, Any]]]" = OrderedDict()
+        self._inflight: Dict[Tuple[Any, ...], "asyncio.Task[Dict[str, Any]]"] = {}
+        self._families: Dict[Tuple[Any, ...], Tuple[Any, ...]] = {}
+        self._points = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.stale_hits = 0
+        self.stale_on_error = 0
+        self.revalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_sec > 0 and self.max_entries > 0
+
+    async def lookup(
+        self,
+        key: Tuple[Any, ...],
+        fetch: Callable[[], Awaitable[Dict[str, Any]]],
+        family: Optional[Tuple[Any, ...]] = None,
+    ) -> Tuple[Dict[str, Any], Optional[float]]:
+        """Value for `key`, plus its age in seconds when it is served stale."""
+        if not self.enabled:
+            return await fetch(), None
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry[0]
+            if age <= self.ttl_sec:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2], None
+            if age <= self.ttl_sec + self.stale_sec:
+                self._entries.move_to_end(key)
+                self.stale_hits += 1
+                if key not in self._inflight:
+                    self.revalidations += 1
+                    self._start(key, fetch, family)
+                return entry[2], round(age, 1)
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = self._start(key, fetch, family)
+        else:
+            self.coalesced += 1
+        try:
+            return await asyncio.shield(task), None
+        except (HTTPException, httpx.HTTPError):
+            entry = self._entries.get(key)
+            if entry is None and family is not None:
+                entry = self._entries.get(self._families.get(family, ()))
+            if entry is None:
+                raise
+            self.stale_on_error += 1
+            return entry[2], round(time.monotonic() - entry[0], 1)
+
+    def _start(
+        self,
+        key: Tuple[Any, ...],
+        fetch: Callable[[], Awaitable[Dict[str, Any]]],
+        family: Optional[Tuple[Any, ...]],
+    ) -> "asyncio.Task[Dict[str, Any]]":
+        task = asyncio.create_task(self._load(key, fetch, family))
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self._inflight[key] = task
+        return task
+
+    async def _load(
+        self,
+        key: Tuple[Any, ...],
+        fetch: Callable[[], Awaitable[Dict[str, Any]]],
+        family: Optional[Tuple[Any, ...]],
+    ) -> Dict[str, Any]:
+        try:
+            value = await fetch()
+            self._store(key, value)
+            if family is not None and key in self._entries:
+                self._families[family] = key
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def _store(self, key: Tuple[Any, ...], value: Dict[str, Any]) -> None:
+        weight = 1 + sum(len(points) for points in value.values() if isinstance(points, (list, SeriesColumns)))
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._points -= previous[1]
+        if weight > self.max_points:
+            return
+        self._entries[key] = (time.monotonic(), weight, value)
+        self._points += weight
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._points > self.max_points
+        ):
+            _, (_, evicted_weight, _) = self._entries.popitem(last=False)
+            self._points -= evicted_weight
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._families.clear()
+        self._points = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced + self.stale_hits
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "points": self._points,
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "staleHits": self.stale_hits,
+            "staleOnError": self.stale_on_error,
+            "revalidations": self.revalidations,
+            "evictions": self.evictions,
+            "hitRatio": (
+                round((self.hits + self.coalesced + self.stale_hits) / lookups, 4) if lookups else None
+            ),
+        }
+
+
+telemetry_cache = UpstreamCache(
+    TELEMETRY_CACHE_TTL_SEC,
+    TELEMETRY_CACHE_MAX_ENTRIES,
+    TELEMETRY_CACHE_MAX_POINTS,
+    TELEMETRY_CACHE_STALE_SEC,
+)
+alarms_cache = UpstreamCache(ALARMS_CACHE_TTL_SEC, 4096, 1_000_000, TELEMETRY_CACHE_STALE_SEC)
+
+
+def resolve_window(
+    hours: int,
+    start_ts: Optional[int] = None,
+    end_ts: Optional[int] = None,
+    quantum_ms: int = 0,
+) -> Tuple[int, int]:
+    """Absolute [start, end] in ms; an implicit "now" end is floored to `quantum_ms`."""
+    if end_ts is None:
+        end_ts = int(time.time() * 1000)
+        if quantum_ms > 0:
+            end_ts -= end_ts % quantum_ms
+    if start_ts is None:
+        start_ts = end_ts - (hours * 60 * 60 * 1000)
+    return start_ts, end_ts
+
+
+class RecentPointsBuffer:
+    """Tail of raw points per (entity, device, key), used to answer `sinceTs` deltas.
+
+    Each series records `from`, the oldest ts from which the buffer is known to be
+    complete, and `until`, the ts up to which it is synced with ThingsBoard. Syncs read
+    forward (`orderBy=ASC`) from `until`, one page of `max_points` at a time, so a
+    full page leaves `partial` set and the next call continues where it stopped
+    instead of skipping points. Clients polling the same device within `refresh_ms`
+    share one sync.
+    """
+
+    def __init__(self, max_points: int, max_series: int, refresh_ms: int) -> None:
+        self.max_points = max(1, max_points)
+        self.max_series = max(1, max_series)
+        self.refresh_ms = refresh_ms
+        self._series: "OrderedDict[Tuple[str, str, str], Dict[str, Any]]" = OrderedDict()
+        # Per-device locks, dropped once no request holds or awaits them.
+        self._locks: Dict[Tuple[str, str], List[Any]] = {}
+
+    @asynccontextmanager
+    async def _device_lock(self, device: Tuple[str, str]):
+        holder = self._locks.setdefault(device, [asyncio.Lock(), 0])
+        holder[1] += 1
+        try:
+            async with holder[0]:
+                yield
+        finally:
+            holder[1] -= 1
+            if holder[1] == 0:
+                self._locks.pop(device, None)
+
+    def _get(self, key: Tuple[str, str, str]) -> Optional[Dict[str, Any]]:
+        entry = self._series.get(key)
+        if entry is not None:
+            self._series.move_to_end(key)
+        return entry
+
+    def _put(
+        self,
+        key: Tuple[str, str, str],
+        points: List[Dict[str, Any]],
+        covered_from: int,
+        synced_until: int,
+        partial_sync: bool = False,
+    ) -> None:
+        tail = deque(points[-self.max_points :], maxlen=self.max_points)
+        if len(points) > self.max_points:
+            covered_from = tail[0]["ts"]
+        self._series[key] = {
+            "points": tail,
+            "from": covered_from,
+            "until": synced_until,
+            "partial": partial_sync,
+        }
+        self._series.move_to_end(key)
+        while len(self._series) > self.max_series:
+            self._series.popitem(last=False)
+
+    def _extend(
+        self,
+        entry: Dict[str, Any],
+        points: List[Dict[str, Any]],
+        synced_until: int,
+        partial_sync: bool = False,
+    ) -> None:
+        tail: deque = entry["points"]
+        for point in points:
+            if not tail or point["ts"] > tail[-1]["ts"]:
+                tail.append(point)
+                continue
+            # Late or out-of-order point: insert it in place unless it is older than the
+            # covered range or already buffered.
+            if point["ts"] < entry["from"]:
+                continue
+            position = len(tail)
+            while position > 0 and tail[position - 1]["ts"] > point["ts"]:
+                position -= 1
+            if position > 0 and tail[position - 1]["ts"] == point["ts"]:
+                continue
+            if len(tail) == tail.maxlen:
+                if position == 0:
+                    continue
+                tail.popleft()
+                position -= 1
+            tail.insert(position, point)
+        if len(tail) == tail.maxlen:
+            entry["from"] = max(entry["from"], tail[0]["ts"])
+        entry["until"] = synced_until
+        entry["partial"] = partial_sync
+
+    def _covers(self, entry: Optional[Dict[str, Any]], since_ts: int) -> bool:
+        return entry is not None and entry["from"] <= since_ts
+
+    def seed(
+        self,
+        entity_type: str,
+        device_tb_id: str,
+        series: Dict[str, List[Dict[str, Any]]],
+        start_ts: int,
+        end_ts: int,
+        limit: int,
+    ) -> None:
+        """Reuse a raw full-window fetch so later deltas on it start warm.
+
+        A window ending in the future is only synced up to now: later points are still to come.
+        """
+        synced_until = min(end_ts, int(time.time() * 1000))
+        for key, points in series.items():
+            entry = self._series.get((entity_type, device_tb_id, key))
+            if entry is not None and entry["until"] >= synced_until:
+                continue
+            covered_from = start_ts if len(points) < limit else (points[0]["ts"] if points else synced_until)
+            self._put((entity_type, device_tb_id, key), list(points), covered_from, synced_until)
+
+    async def _sync_forward(
+        self,
+        mapping: Dict[str, Any],
+        entity_type: str,
+        device_tb_id: str,
+        keys: List[str],
+        after_ts: int,
+        now: int,
+    ) -> Dict[str, Tuple[List[Dict[str, Any]], int, bool]]:
+        """Per key: the oldest `max_points` points after `after_ts`, the synced-until ts, a full-page flag."""
+        series = await tb_client.fetch_timeseries(
+            device_id=device_tb_id,
+            keys=",".join(keys),
+            limit=self.max_points,
+            hours=0,
+            mapping=mapping,
+            entity_type=entity_type,
+            start_ts=after_ts + 1,
+            end_ts=now,
+            order_by="ASC",
+        )
+        result = {}
+        for key in keys:
+            points = series.get(key, [])
+            full = len(points) >= self.max_points
+            result[key] = (points, points[-1]["ts"] if full else now, full)
+        return result
+
+    async def delta(
+        self,
+        mapping: Dict[str, Any],
+        entity_type: str,
+        device_tb_id: str,
+        keys: List[str],
+        since_ts: int,
+        limit: int,
+    ) -> Tuple[Dict[str, List[Dict[str, Any]]], bool]:
+        """Points newer than `since_ts` (oldest first, at most `limit` per key) and whether more remain.
+
+        When more remain, every key is cut at the same ts so that the cursor derived from
+        the result never skips points of a truncated key.
+        """
+        async with self._device_lock((entity_type, device_tb_id)):
+            now = int(time.time() * 1000)
+            entries = {key: self._get((entity_type, device_tb_id, key)) for key in keys}
+            # Points already buffered after the cursor, read before any sync can evict them.
+            have = {
+                key: [p for p in entry["points"] if p["ts"] > since_ts] if self._covers(entry, since_ts) else []
+                for key, entry in entries.items()
+            }
+            cold = [key for key, entry in entries.items() if not self._covers(entry, since_ts)]
+            due = [
+                key
+                for key, entry in entries.items()
+                if key not in cold
+                and len(have[key]) <= limit
+                and (entry["partial"] or now - entry["until"] >= self.refresh_ms)
+            ]
+            fetched: Dict[str, List[Dict[str, Any]]] = {}
+            if cold:
+                synced = await self._sync_forward(mapping, entity_type, device_tb_id, cold, since_ts, now)
+                for key, (points, until, full) in synced.items():
+                    self._put((entity_type, device_tb_id, key), points, since_ts, until, full)
+                    fetched[key] = points
+            if due:
+                synced_from = min(entries[key]["until"] for key in due)
+                synced = await self._sync_forward(mapping, entity_type, device_tb_id, due, synced_from, now)
+                for key, (points, until, full) in synced.items():
+                    last_ts = have[key][-1]["ts"] if have[key] else since_ts
+                    fetched[key] = [p for p in points if p["ts"] > max(last_ts, entries[key]["until"])]
+                    self._extend(entries[key], points, until, full)
+
+            result: Dict[str, List[Dict[str, Any]]] = {}
+            cut: Optional[int] = None
+            for key in keys:
+                combined = have[key] + fetched.get(key, [])
+                entry = self._series.get((entity_type, device_tb_id, key))
+                if len(combined) > limit or (entry is not None and entry["partial"]):
+                    combined = combined[:limit]
+                    last = combined[-1]["ts"] if combined else since_ts
+                    cut = last if cut is None else min(cut, last)
+                result[key] = combined[:limit]
+            if cut is not None:
+                result = {key: [p for p in points if p["ts"] <= cut] for key, points in result.items()}
+            return result, cut is not None
+
+
+recent_buffer = RecentPointsBuffer(
+    TELEMETRY_BUFFER_MAX_POINTS, TELEMETRY_BUFFER_MAX_SERIES, TELEMETRY_BUFFER_REFRESH_MS
+)
+
+
+class TelemetryStore:
+    """SQLite mirror of the mapped devices' raw telemetry.
+
+    `sync_loop` keeps every (entity, device, key) series of the mapping synced from
+    ThingsBoard, paging forward from the last synced ts. `read` answers raw range
+    queries from the mirror when the range is covered; only the live tail after the
+    last sync still goes upstream.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS points (
+            entity_type TEXT NOT NULL,
+            device_id TEXT NOT NULL,
+            key TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            value,
+            PRIMARY KEY (entity_type, device_id, key, ts)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS sync_state (
+            entity_type TEXT NOT NULL,
+            device_id TEXT NOT NULL,
+            key TEXT NOT NULL,
+            synced_from INTEGER NOT NULL,
+            synced_until INTEGER NOT NULL,
+            PRIMARY KEY (entity_type, device_id, key)
+        );
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._state: Dict[Tuple[str, str, str], Tuple[int, int]] = {}
+        self.last_sync_ts: Optional[int] = None
+        self.last_sync_error: Optional[str] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def open(self) -> None:
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(self.SCHEMA)
+        rows = conn.execute(
+            "SELECT entity_type, device_id, key, synced_from, synced_until FROM sync_state"
+        ).fetchall()
+        self._state = {(row[0], row[1], row[2]): (row[3], row[4]) for row in rows}
+        self._conn = conn
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _write(
+        self,
+        series_key: Tuple[str, str, str],
+        points: List[Dict[str, Any]],
+        synced_from: int,
+        synced_until: int,
+    ) -> None:
+        with self._lock:
+            if self._conn is None:
+                return
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO points VALUES (?, ?, ?, ?, ?)",
+                    [(*series_key, point["ts"], point["value"]) for point in points],
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?, ?)",
+                    (*series_key, synced_from, synced_until),
+                )
+            self._state[series_key] = (synced_from, synced_until)
+
+    def _read(
+        self,
+        series_key: Tuple[str, str, str],
+        start_ts: int,
+        end_ts: int,
+        limit: int,
+    ) -> List[Dict[str, Any]]:
+        with self._lock:
+            if self._conn is None:
+                return []
+            rows = self._conn.execute(
+                "SELECT ts, value FROM points WHERE entity_type = ? AND device_id = ? AND key = ? "
+                "AND ts BETWEEN ? AND ? ORDER BY ts DESC LIMIT ?",
+                (*series_key, start_ts, end_ts, limit),
+            ).fetchall()
+        rows.reverse()
+        return [{"ts": ts, "value": value} for ts, value in rows]
+
+    async def read(
+        self,
+        mapping: Dict[str, Any],
+        entity_type: str,
+        device_tb_id: str,
+        keys: List[str],
+        start_ts: int,
+        end_ts: int,
+        limit: int,
+    ) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+        """Newest `limit` raw points per key in [start, end], or None if not mirrored."""
+        states = {key: self._state.get((entity_type, device_tb_id, key)) for key in keys}
+        if not keys or any(state is None or state[0] > start_ts for state in states.values()):
+            return None
+
+        series: Dict[str, List[Dict[str, Any]]] = {}
+        for key, (_, synced_until) in states.items():
+            series[key] = await asyncio.to_thread(
+                self._read,
+                (entity_type, device_tb_id, key),
+                start_ts,
+                min(end_ts, synced_until),
+                limit,
+            )
+
+        tail_from = min(state[1] for state in states.values())
+        if end_ts > tail_from:
+            tail = await tb_client.fetch_timeseries(
+                device_id=device_tb_id,
+                keys=",".join(keys),
+                limit=limit,
+                hours=0,
+                mapping=mapping,
+                entity_type=entity_type,
+                start_ts=max(start_ts, tail_from + 1),
+                end_ts=end_ts,
+            )
+            for key, (_, synced_until) in states.items():
+                fresh = [p for p in tail.get(key, []) if p["ts"] > synced_until]
+                series[key] = (series[key] + fresh)[-limit:]
+        return series
+
+    async def sync_series(
+        self,
+        mapping: Dict[str, Any],
+        entity_type: str,
+        device_tb_id: str,
+        key: str,
+    ) -> None:
+        series_key = (entity_type, device_tb_id, key)
+        now = int(time.time() * 1000)
+        state = self._state.get(series_key)
+        if state is None:
+            synced_from = now - TELEMETRY_SYNC_BACKFILL_HOURS * 60 * 60 * 1000
+            cursor = synced_from
+        else:
+            synced_from = state[0]
+            cursor = max(synced_from, state[1] - TELEMETRY_SYNC_OVERLAP_MS)
+
+        while True:
+            series = await tb_client.fetch_timeseries(
+                device_id=device_tb_id,
+                keys=key,
+                limit=TELEMETRY_SYNC_PAGE_POINTS,
+                hours=0,
+                mapping=mapping,
+                entity_type=entity_type,
+                start_ts=cursor,
+                end_ts=now,
+                order_by="ASC",
+            )
+            points = series.get(key, [])
+            if len(points) < TELEMETRY_SYNC_PAGE_POINTS:
+                await asyncio.to_thread(self._write, series_key, points, synced_from, now)
+                return
+            last_ts = points[-1]["ts"]
+            await asyncio.to_thread(self._write, series_key, points, synced_from, last_ts)
+            cursor = last_ts + 1
+
+    async def sync_once(self) -> None:
+        index = current_mapping_index()
+        if index is None:
+            return
+        mapping = index.mapping
+        calls = []
+        for device_id, entity_type, device_tb_id in index.tb_originators:
+            device = index.devices.get(device_id) or {}
+            telemetry_key = (device.get("connector") or {}).get("telemetryKey") or device.get("type")
+            for key in str(telemetry_key or "").split(","):
+                if key.strip():
+                    calls.append(partial(self.sync_series, mapping, entity_type, device_tb_id, key.strip()))
+        results = await gather_bounded(calls, TELEMETRY_SYNC_CONCURRENCY)
+        errors = [str(result) for result in results if isinstance(result, BaseException)]
+        self.last_sync_ts = int(time.time() * 1000)
+        self.last_sync_error = errors[0] if errors else None
+
+    async def sync_loop(self) -> None:
+        while True:
+            try:
+                await self.sync_once()
+            except Exception as exc:
+                self.last_sync_error = str(exc)
+            await asyncio.sleep(max(1.0, TELEMETRY_SYNC_INTERVAL_SEC))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "series": len(self._state),
+            "lastSyncTs": self.last_sync_ts,
+            "lastSyncError": self.last_sync_error,
+        }
+
+
+telemetry_store = TelemetryStore(TELEMETRY_STORE_PATH)
+
+
+async def fetch_series(
+    mapping: Dict[str, Any],
+    entity_type: str,
+    device_tb_id: str,
+    keys: str,
+    limit: int,
+    start_ts: int,
+    end_ts: int,
+    agg: str,
+    interval: Optional[int],
+    columns: bool = False,
+) -> Dict[str, Any]:
+    """Raw ranges come from the local mirror when it covers them, everything else upstream.
+
+    A raw `limit` above one upstream page means the whole window is wanted: it is paged.
+    `columns=True` returns SeriesColumns; a single upstream page is parsed straight into them.
+    """
+    series = None
+    if telemetry_store.enabled and agg == "NONE" and not interval:
+        key_list = [k.strip() for k in keys.split(",") if k.strip()]
+        series = await telemetry_store.read(
+            mapping, entity_type, device_tb_id, key_list, start_ts, end_ts, limit
+        )
+    if series is None and agg == "NONE" and not interval and limit > TELEMETRY_PAGE_POINTS:
+        key_list = [k.strip() for k in keys.split(",") if k.strip()]
+        return await tb_client.fetch_window(
+            device_tb_id, key_list, start_ts, end_ts, limit, mapping, entity_type, columns
+        )
+    if series is not None:
+        if columns:
+            return {key: SeriesColumns.from_points(points) for key, points in series.items()}
+        return series
+    return await tb_client.fetch_timeseries(
+        device_id=device_tb_id,
+        keys=keys,
+        limit=limit,
+        hours=0,
+        mapping=mapping,
+        entity_type=entity_type,
+        agg=agg,
+        start_ts=start_ts,
+        end_ts=end_ts,
+        interval=interval,
+        columns=columns,
+    )
+
+
+DOWNSAMPLE_MODES = {"lttb", "minmax"}
+
+
+def lttb_indices(ts: np.ndarray, values: np.ndarray, threshold: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: indices of `threshold` shape-preserving points."""
+    n = len(ts)
+    x = ts.astype(np.float64)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    anchor = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            next_x = x[end : edges[bucket + 2]].mean()
+            next_y = values[end : edges[bucket + 2]].mean()
+        else:
+            next_x, next_y = x[-1], values[-1]
+        area = np.abs(
+            (x[anchor] - next_x) * (values[start:end] - values[anchor])
+            - (x[anchor] - x[start:end]) * (next_y - values[anchor])
+        )
+        anchor = start + int(np.argmax(area))
+        selected[bucket + 1] = anchor
+    return selected
+
+
+def minmax_indices(values: np.ndarray, max_points: int) -> np.ndarray:
+    """Indices of the min and max point of `max_points // 2` equal-count buckets.
+
+    Buckets whose min and max are the same point, and the spare slot of an odd
+    `max_points`, are topped up with evenly spaced points so exactly `max_points`
+    (for `len(values) > max_points`) are returned.
+    """
+    n = len(values)
+    starts = np.unique(np.linspace(0, n, max(1, max_points // 2) + 1).astype(np.int64)[:-1])
+    bucket_ids = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, n)))
+    picks = []
+    for reduced in (np.minimum.reduceat(values, starts), np.maximum.reduceat(values, starts)):
+        hits = np.flatnonzero(values == reduced[bucket_ids])
+        _, first = np.unique(bucket_ids[hits], return_index=True)
+        picks.append(hits[first])
+    selected = np.unique(np.concatenate(picks))
+    missing = min(max_points, n) - len(selected)
+    if missing > 0:
+        remaining = np.setdiff1d(np.arange(n), selected)
+        spread = np.round(np.linspace(0, len(remaining) - 1, missing)).astype(np.int64)
+        selected = np.union1d(selected, remaining[spread])
+    return selected
+
+
+def downsample_points(points: Any, max_points: int, mode: str) -> Any:
+    """Point dicts or SeriesColumns reduced to at most `max_points`; non-numeric series are kept whole."""
+    if len(points) <= max_points:
+        return points
+    if isinstance(points, SeriesColumns):
+        ts, values = points.ts, points.value
+        if np.isnan(values).any():
+            return points
+    else:
+        try:
+            ts = np.array([p["ts"] for p in points], dtype=np.int64)
+            values = np.array([p["value"] for p in points], dtype=np.float64)
+        except (TypeError, ValueError):
+            return points
+    if mode == "minmax":
+        indices = minmax_indices(values, max_points)
+    else:
+        indices = lttb_indices(ts, values, max_points)
+    if isinstance(points, SeriesColumns):
+        return points.select(indices)
+    return [points[i] for i in indices.tolist()]
+
+
+def downsample_fetch_limit(
+    limit: int, max_points: Optional[int], agg: Optional[str], interval: Optional[int], since_ts: Optional[int]
+) -> int:
+    """Upstream limit: a downsampled raw window is fetched whole rather than its newest `limit` points."""
+    if not max_points or since_ts is not None or interval or (agg or "NONE").upper() != "NONE":
+        return limit
+    return max(limit, TELEMETRY_RAW_MAX_POINTS)
+
+
+def downsample_telemetry(
+    result: Dict[str, Any], max_points: Optional[int], mode: str, fetch_limit: Optional[int] = None
+) -> Dict[str, Any]:
+    """Copy of a build_telemetry result with every series reduced to at most `max_points`.
+
+    A series that filled `fetch_limit` is missing its oldest points: the result is marked truncated.
+    """
+    if not max_points:
+        return result
+    mode = (mode or "lttb").lower()
+    if mode not in DOWNSAMPLE_MODES:
+        raise HTTPException(status_code=400, detail="Invalid downsample mode. Use lttb or minmax.")
+    reduced = dict(result)
+    if fetch_limit:
+        series = [result["points"]] if "points" in result else list(result.get("series", {}).values())
+        if any(len(points) >= fetch_limit for points in series):
+            reduced["truncated"] = True
+    if "points" in result:
+        reduced["points"] = downsample_points(result["points"], max_points, mode)
+    if "series" in result:
+        reduced["series"] = {
+            key: downsample_points(points, max_points, mode) for key, points in result["series"].items()
+        }
+    return reduced
+
+
+TELEMETRY_FORMATS = {"json", "columnar", "binary"}
+BINARY_TELEMETRY_MAGIC = b"BIMT"
+BINARY_TELEMETRY_VERSION = 1
+
+
+def columnar_series(points: Any) -> Dict[str, List[Any]]:
+    if isinstance(points, SeriesColumns):
+        return {"ts": points.ts.tolist(), "value": points.values_list()}
+    return {"ts": [p["ts"] for p in points], "value": [p["value"] for p in points]}
+
+
+def columnar_telemetry(result: Dict[str, Any]) -> Dict[str, Any]:
+    """A build_telemetry result with `{ts: [...], value: [...]}` arrays instead of point dicts."""
+    encoded = {key: value for key, value in result.items() if key not in {"points", "series"}}
+    encoded["format"] = "columnar"
+    if "points" in result:
+        encoded.update(columnar_series(result["points"]))
+    if "series" in result:
+        encoded["series"] = {key: columnar_series(points) for key, points in result["series"].items()}
+    return encoded
+
+
+def binary_telemetry(result: Dict[str, Any]) -> bytes:
+    """Pack a build_telemetry result as typed arrays.
+
+    Layout: `BIMT`, u8 version, 3 pad bytes, u32 LE header length, a UTF-8 JSON header
+    padded to 8 bytes, then for each entry of `header.series`, `count` little-endian int64
+    timestamps followed by `count` float64 values (NaN where a value is not numeric).
+    """
+    if "series" in result:
+        series = result["series"]
+    else:
+        series = {result.get("key") or "value": result.get("points") or []}
+    header = {key: value for key, value in result.items() if key not in {"points", "series"}}
+    header["series"] = [{"key": key, "count": len(points)} for key, points in series.items()]
+    header_bytes = json.dumps(header, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    header_bytes += b" " * (-(len(header_bytes) + 12) % 8)
+    parts = [
+        BINARY_TELEMETRY_MAGIC,
+        struct.pack("<B3xI", BINARY_TELEMETRY_VERSION, len(header_bytes)),
+        header_bytes,
+    ]
+    for points in series.values():
+        if not isinstance(points, SeriesColumns):
+            points = SeriesColumns.from_points(points)
+        parts.append(points.ts.astype("<i8", copy=False).tobytes())
+        parts.append(points.value.astype("<f8", copy=False).tobytes())
+    return b"".join(parts)
+
+
+def encode_telemetry(result: Dict[str, Any], fmt: Optional[str]) -> Any:
+    fmt = (fmt or "json").lower()
+    if fmt not in TELEMETRY_FORMATS:
+        raise HTTPException(status_code=400, detail="Invalid format. Use json, columnar or binary.")
+    if fmt == "columnar":
+        # Already plain lists: rendered directly, without jsonable_encoder walking every element.
+        return TimedJSONResponse(columnar_telemetry(result))
+    if fmt == "binary":
+        return Response(
+            content=binary_telemetry(result),
+            media_type="application/octet-stream",
+            headers={"X-Telemetry-Format": f"binary;v={BINARY_TELEMETRY_VERSION}"},
+        )
+    return result
+
+
+def next_cursor(series: Dict[str, List[Dict[str, Any]]], since_ts: int) -> int:
+    cursor = since_ts
+    for points in series.values():
+        if points and isinstance(points[-1].get("ts"), int):
+            cursor = max(cursor, points[-1]["ts"])
+    return cursor
+
+
+async def build_telemetry(
+    mapping: Dict[str, Any],
+    device_id: str,
+    key: Optional[str],
+    limit: int,
+    hours: int,
+    agg: Optional[str] = None,
     start_ts: Optional[int] = None,
     end_ts: Optional[int] = None,
     interval: Optional[int] = None,
+    since_ts: Optional[int] = None,
+    columns: bool = False,
 ) -> Dict[str, Any]:
+    """`columns=True` lets ThingsBoard windows come back as SeriesColumns (see encode_telemetry)."""
     device = get_device(mapping, device_id)
 
     connector = device.get("connector", {})
@@ -362,24 +2347,61 @@ async def build_telemetry(
                 status_code=400,
                 detail="Invalid entityType in mapping. Use DEVICE or ASSET.",
             )
-        
-        series = await tb_client.fetch_timeseries(
-            device_id=device_tb_id,
-            keys=telemetry_key,
-            limit=limit,
-            hours=hours,
-            mapping=mapping,
-            entity_type=entity_type,
-            agg=(agg or "NONE"),
-            start_ts=start_ts,
-            end_ts=end_ts,
-            interval=interval,
+
+        agg = (agg or "NONE").upper()
+        if since_ts is not None:
+            if agg != "NONE" or interval:
+                raise HTTPException(status_code=400, detail="sinceTs requires agg=NONE.")
+            keys = [k.strip() for k in telemetry_key.split(",") if k.strip()]
+            series, has_more = await recent_buffer.delta(
+                mapping, entity_type, device_tb_id, keys, since_ts, limit
+            )
+            cursor = next_cursor(series, since_ts)
+            if "," in telemetry_key:
+                return {"deviceId": device_id, "series": series, "cursor": cursor, "hasMore": has_more}
+            return {
+                "deviceId": device_id,
+                "key": keys[0],
+                "points": series[keys[0]],
+                "cursor": cursor,
+                "hasMore": has_more,
+            }
+
+        quantum = TELEMETRY_CACHE_QUANTUM_MS if telemetry_cache.enabled else 0
+        relative = end_ts is None
+        start_ts, end_ts = resolve_window(hours, start_ts, end_ts, quantum)
+        cache_key = (entity_type, device_tb_id, telemetry_key, start_ts, end_ts, agg, interval, limit, columns)
+        family = None
+        if relative:
+            family = (entity_type, device_tb_id, telemetry_key, hours, agg, interval, limit, columns)
+        series, stale_age = await telemetry_cache.lookup(
+            cache_key,
+            partial(
+                fetch_series,
+                mapping,
+                entity_type,
+                device_tb_id,
+                telemetry_key,
+                limit,
+                start_ts,
+                end_ts,
+                agg,
+                interval,
+                columns,
+            ),
+            family,
         )
+        if stale_age is not None:
+            result: Dict[str, Any] = {"deviceId": device_id, "stale": True, "staleAgeSec": stale_age}
+        else:
+            result = {"deviceId": device_id}
+            if agg == "NONE" and not interval and not columns:
+                recent_buffer.seed(entity_type, device_tb_id, series, start_ts, end_ts, limit)
         if "," in telemetry_key:
-            return {"deviceId": device_id, "series": series}
+            return {**result, "series": series}
         only_key = telemetry_key.split(",")[0].strip()
         points = series.get(only_key, [])
-        return {"deviceId": device_id, "key": only_key, "points": points}
+        return {**result, "key": only_key, "points": points}
 
     if connector_type == "mock":
         now = int(time.time() * 1000)
@@ -392,29 +2414,442 @@ async def build_telemetry(
             for i in range(limit):
                 ts = now - (limit - 1 - i) * 60 * 60 * 1000
                 value = i
+                if since_ts is not None and ts <= since_ts:
+                    continue
                 points.append({"ts": ts, "value": value})
             series[key_name] = points
+        extra = {"cursor": next_cursor(series, since_ts)} if since_ts is not None else {}
         if len(keys) > 1:
-            return {"deviceId": device_id, "series": series}
-        return {"deviceId": device_id, "key": keys[0], "points": series[keys[0]]}
+            return {"deviceId": device_id, "series": series, **extra}
+        return {"deviceId": device_id, "key": keys[0], "points": series[keys[0]], **extra}
 
     raise HTTPException(status_code=400, detail=f"Unsupported connector type: {connector_type}")
 
 
+class TelemetryHub:
+    """Fans new telemetry out to stream subscribers.
+
+    Subscribers of the same (device, keys) topic share one poller, which pulls deltas
+    through `build_telemetry(..., since_ts=cursor)` and pushes each non-empty batch to
+    every subscriber queue. The poller stops with its last subscriber.
+    """
+
+    def __init__(self, poll_ms: int, queue_size: int) -> None:
+        self.poll_ms = poll_ms
+        self.queue_size = queue_size
+        self._topics: Dict[Tuple[str, Optional[str]], Dict[str, Any]] = {}
+
+    def subscribe(self, device_id: str, key: Optional[str]) -> "asyncio.Queue[Dict[str, Any]]":
+        topic = (device_id, key)
+        queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=self.queue_size)
+        state = self._topics.get(topic)
+        if state is None:
+            state = {"queues": set(), "cursor": int(time.time() * 1000)}
+            state["task"] = asyncio.create_task(self._poll(topic, state))
+            self._topics[topic] = state
+        state["queues"].add(queue)
+        return queue
+
+    def unsubscribe(self, device_id: str, key: Optional[str], queue: "asyncio.Queue[Dict[str, Any]]") -> None:
+        topic = (device_id, key)
+        state = self._topics.get(topic)
+        if state is None:
+            return
+        state["queues"].discard(queue)
+        if not state["queues"]:
+            state["task"].cancel()
+            self._topics.pop(topic, None)
+
+    def publish(self, device_id: str, key: Optional[str], event: Dict[str, Any]) -> None:
+        state = self._topics.get((device_id, key))
+        if state is None:
+            return
+        for queue in state["queues"]:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    def topics_for(self, device_id: str) -> List[Optional[str]]:
+        return [key for (topic_device, key) in self._topics if topic_device == device_id]
+
+    async def _poll(self, topic: Tuple[str, Optional[str]], state: Dict[str, Any]) -> None:
+        device_id, key = topic
+        more = False
+        while True:
+            # A delta cut at its limit is followed up at once instead of after a poll period.
+            await asyncio.sleep(0 if more else self.poll_ms / 1000)
+            more = False
+            if tb_stream.covers(device_id):
+                state["cursor"] = int(time.time() * 1000)
+                continue
+            try:
+                mapping = load_mapping_cached()
+                delta = await build_telemetry(
+                    mapping, device_id, key, 1000, 24, since_ts=state["cursor"]
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                detail = exc.detail if isinstance(exc, HTTPException) else str(exc)
+                self.publish(device_id, key, {"event": "error", "data": {"deviceId": device_id, "detail": detail}})
+                continue
+            state["cursor"] = delta.get("cursor", state["cursor"])
+            more = bool(delta.get("hasMore"))
+            points = delta.get("points")
+            series = delta.get("series")
+            if points or (series and any(series.values())):
+                self.publish(device_id, key, {"event": "telemetry", "data": delta})
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "topics": len(self._topics),
+            "subscribers": sum(len(state["queues"]) for state in self._topics.values()),
+        }
+
+
+telemetry_hub = TelemetryHub(TELEMETRY_STREAM_POLL_MS, TELEMETRY_STREAM_QUEUE_SIZE)
+
+
+def ws_url_from_base(base_url: str) -> str:
+    if base_url.startswith("https://"):
+        return "wss://" + base_url[len("https://") :] + "/api/ws"
+    if base_url.startswith("http://"):
+        return "ws://" + base_url[len("http://") :] + "/api/ws"
+    return base_url + "/api/ws"
+
+
+class ThingsBoardStream:
+    """One ThingsBoard WebSocket subscribed to LATEST_TELEMETRY of every mapped device.
+
+    Updates land in `latest` (ThingsBoard id -> key -> (ts, value)) and are pushed to
+    the telemetry hub's subscribers, whose pollers stand down while the socket is up.
+    Subscriptions follow mapping refreshes and are replayed after a reconnect.
+    """
+
+    def __init__(self) -> None:
+        self.latest: Dict[str, Dict[str, Tuple[int, Any]]] = {}
+        self.connected = False
+        self.reconnects = 0
+        self.messages = 0
+        self.last_error: Optional[str] = None
+        self._index: Optional[MappingIndex] = None
+        self._next_cmd_id = 1
+        self._cmd_ids: Dict[Tuple[str, str], int] = {}
+        self._by_cmd_id: Dict[int, Tuple[str, str]] = {}
+        self._covered: set = set()
+
+    def covers(self, device_id: str) -> bool:
+        return self.connected and device_id in self._covered
+
+    def latest_for(self, device_tb_id: str) -> Dict[str, Dict[str, Any]]:
+        values = self.latest.get(device_tb_id) or {}
+        return {key: {"ts": ts, "value": value} for key, (ts, value) in values.items()}
+
+    async def run(self) -> None:
+        backoff = 1.0
+        while True:
+            index = current_mapping_index()
+            if index is None:
+                await asyncio.sleep(1)
+                continue
+            try:
+                await self._session(index.mapping)
+                backoff = 1.0
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                self.last_error = str(exc)
+            self.connected = False
+            self.reconnects += 1
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, TB_WS_RECONNECT_MAX_SEC)
+
+    async def _session(self, mapping: Dict[str, Any]) -> None:
+        settings = get_tb_settings(mapping)
+        url = TB_WS_URL or ws_url_from_base(TB_BASE_URL or settings.get("baseUrl", ""))
+        auth = await tb_client._get_auth_header(mapping)
+        scheme, _, credential = auth["X-Authorization"].partition(" ")
+        headers = {} if scheme == "Bearer" else auth
+        async with ws_connect(url, additional_headers=headers, max_size=None) as ws:
+            if scheme == "Bearer":
+                await ws.send(json.dumps({"authCmd": {"cmdId": 0, "token": credential}, "cmds": []}))
+            self._cmd_ids.clear()
+            self._by_cmd_id.clear()
+            self._index = None
+            self.connected = True
+            while True:
+                index = current_mapping_index()
+                if index is not None and index is not self._index:
+                    await self._sync_subscriptions(ws, index)
+                try:
+                    raw = await asyncio.wait_for(ws.recv(), timeout=1)
+                except asyncio.TimeoutError:
+                    continue
+                self._handle(json.loads(raw))
+
+    async def _sync_subscriptions(self, ws: Any, index: MappingIndex) -> None:
+        self._index = index
+        wanted = {(entity_type, device_tb_id): None for _, entity_type, device_tb_id in index.tb_originators}
+        self._covered = {device_id for device_id, _, _ in index.tb_originators}
+
+        cmds: List[Dict[str, Any]] = []
+        for entity in [entity for entity in self._cmd_ids if entity not in wanted]:
+            cmd_id = self._cmd_ids.pop(entity)
+            self._by_cmd_id.pop(cmd_id, None)
+            self.latest.pop(entity[1], None)
+            cmds.append(self._timeseries_cmd(entity, cmd_id, unsubscribe=True))
+        for entity in wanted:
+            if entity in self._cmd_ids:
+                continue
+            cmd_id = self._next_cmd_id
+            self._next_cmd_id += 1
+            self._cmd_ids[entity] = cmd_id
+            self._by_cmd_id[cmd_id] = entity
+            cmds.append(self._timeseries_cmd(entity, cmd_id))
+        for offset in range(0, len(cmds), max(1, TB_WS_CMDS_PER_MESSAGE)):
+            await ws.send(json.dumps({"cmds": cmds[offset : offset + TB_WS_CMDS_PER_MESSAGE]}))
+
+    @staticmethod
+    def _timeseries_cmd(entity: Tuple[str, str], cmd_id: int, unsubscribe: bool = False) -> Dict[str, Any]:
+        cmd: Dict[str, Any] = {
+            "type": "TIMESERIES",
+            "entityType": entity[0],
+            "entityId": entity[1],
+            "scope": "LATEST_TELEMETRY",
+            "cmdId": cmd_id,
+        }
+        if unsubscribe:
+            cmd["unsubscribe"] = True
+        return cmd
+
+    def _handle(self, message: Dict[str, Any]) -> None:
+        self.messages += 1
+        if message.get("errorCode"):
+            self.last_error = str(message.get("errorMsg") or message.get("errorCode"))
+            return
+        entity = self._by_cmd_id.get(message.get("subscriptionId"))
+        data = message.get("data")
+        if entity is None or not isinstance(data, dict):
+            return
+        device_tb_id = entity[1]
+        table = self.latest.setdefault(device_tb_id, {})
+        updates: Dict[str, List[Dict[str, Any]]] = {}
+        for key, samples in data.items():
+            points = []
+            for sample in samples or []:
+                if not isinstance(sample, list) or len(sample) < 2:
+                    continue
+                ts, value = sample[0], sample[1]
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    pass
+                points.append({"ts": ts, "value": value})
+                if key not in table or ts >= table[key][0]:
+                    table[key] = (ts, value)
+            if points:
+                updates[key] = sorted(points, key=lambda item: item["ts"])
+        if updates:
+            self._fan_out(device_tb_id, updates)
+
+    def _fan_out(self, device_tb_id: str, updates: Dict[str, List[Dict[str, Any]]]) -> None:
+        if self._index is None:
+            return
+        for device_id in self._index.by_tb_id.get(device_tb_id, []):
+            device = self._index.devices.get(device_id) or {}
+            default_key = (device.get("connector") or {}).get("telemetryKey") or device.get("type")
+            for topic_key in telemetry_hub.topics_for(device_id):
+                telemetry_key = topic_key or default_key or ""
+                keys = [k.strip() for k in telemetry_key.split(",") if k.strip()]
+                series = {k: updates[k] for k in keys if k in updates}
+                if not series:
+                    continue
+                cursor = next_cursor(series, 0)
+                if len(keys) > 1:
+                    event = {"deviceId": device_id, "series": series, "cursor": cursor}
+                else:
+                    event = {"deviceId": device_id, "key": keys[0], "points": series[keys[0]], "cursor": cursor}
+                telemetry_hub.publish(device_id, topic_key, {"event": "telemetry", "data": event})
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": TB_WS_ENABLED,
+            "connected": self.connected,
+            "subscriptions": len(self._cmd_ids),
+            "devices": len(self.latest),
+            "messages": self.messages,
+            "reconnects": self.reconnects,
+            "lastError": self.last_error,
+        }
+
+
+tb_stream = ThingsBoardStream()
+
+
+class SpatialIndex:
+    """A model's spatial tree with the mapped devices placed on its nodes."""
+
+    def __init__(
+        self, spatial: Dict[str, Any], guid_index: Dict[str, Any], mapping_index: MappingIndex
+    ) -> None:
+        self.file = spatial["file"]
+        self.key = (spatial["sha256"], mapping_index.version)
+        self.nodes: Dict[int, Dict[str, Any]] = {
+            node["id"]: {**node, "children": [], "devices": []} for node in spatial["nodes"]
+        }
+        for node in self.nodes.values():
+            if node["parent"] in self.nodes:
+                self.nodes[node["parent"]]["children"].append(node["id"])
+        self.by_guid = {node["guid"]: node_id for node_id, node in self.nodes.items()}
+
+        id_by_guid = dict(zip(guid_index["guids"], guid_index["ids"]))
+        element_nodes = dict(zip(spatial["elementIds"], spatial["elementNodes"]))
+        self.device_node: Dict[str, int] = {}
+        self.unplaced: List[str] = []
+        for device_id, data in mapping_index.devices.items():
+            placed = None
+            for guid in (data.get("ifcGuids") if isinstance(data, dict) else None) or []:
+                element = id_by_guid.get(str(guid))
+                placed = element if element in self.nodes else element_nodes.get(element)
+                if placed in self.nodes:
+                    break
+            if placed in self.nodes:
+                self.device_node[device_id] = placed
+                self.nodes[placed]["devices"].append(device_id)
+            else:
+                self.unplaced.append(device_id)
+
+    def ancestors(self, node_id: int) -> Iterator[int]:
+        """`node_id` and its parents up to the root."""
+        seen = set()
+        while node_id in self.nodes and node_id not in seen:
+            seen.add(node_id)
+            yield node_id
+            node_id = self.nodes[node_id]["parent"]
+
+    def tree(self) -> Dict[str, Any]:
+        counts = {node_id: 0 for node_id in self.nodes}
+        for node_id in self.device_node.values():
+            for ancestor in self.ancestors(node_id):
+                counts[ancestor] += 1
+        nodes = [{**node, "deviceCount": counts[node_id]} for node_id, node in self.nodes.items()]
+        return {"file": self.file, "nodes": nodes, "unplaced": self.unplaced}
+
+    def groups(self, level: str, scope_guid: Optional[str]) -> Dict[int, List[str]]:
+        """Devices under `scope_guid` (or the whole model) grouped by their ancestor at `level`."""
+        level_type = SPATIAL_LEVELS.get(level)
+        if level_type is None:
+            raise HTTPException(
+                status_code=422, detail=f"Invalid level. Use one of: {', '.join(SPATIAL_LEVELS)}."
+            )
+        scope = None
+        if scope_guid:
+            scope = self.by_guid.get(scope_guid)
+            if scope is None:
+                raise HTTPException(status_code=404, detail="Spatial node not found.")
+        groups: Dict[int, List[str]] = {}
+        for device_id, node_id in self.device_node.items():
+            chain = list(self.ancestors(node_id))
+            if scope is not None and scope not in chain:
+                continue
+            group = next((a for a in chain if self.nodes[a]["type"] == level_type), None)
+            if group is not None:
+                groups.setdefault(group, []).append(device_id)
+        return groups
+
+    def describe(self, node_id: int) -> Dict[str, Any]:
+        node = self.nodes[node_id]
+        return {"id": node_id, "guid": node["guid"], "type": node["type"], "name": node["name"]}
+
+
+_spatial_index: Optional[SpatialIndex] = None
+_spatial_lock = threading.Lock()
+
+
+def build_spatial_index() -> SpatialIndex:
+    global _spatial_index
+    mapping_index = load_mapping_index()
+    model_file = (mapping_index.mapping.get("model") or {}).get("file")
+    if not model_file:
+        raise HTTPException(status_code=404, detail="No model file in mapping.")
+    path = resolve_model_path(str(model_file))
+    _, spatial = model_store.spatial(path)
+    _, guid_index = model_store.index(path)
+    with _spatial_lock:
+        if _spatial_index is None or _spatial_index.key != (spatial["sha256"], mapping_index.version):
+            _spatial_index = SpatialIndex(spatial, guid_index, mapping_index)
+        return _spatial_index
+
+
+def numeric_value(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def aggregate_groups(groups: np.ndarray, values: np.ndarray, size: int) -> Dict[str, np.ndarray]:
+    """count/mean/min/max of `values` per group id in [0, size)."""
+    count = np.bincount(groups, minlength=size)
+    total = np.bincount(groups, weights=values, minlength=size)
+    low = np.full(size, np.inf)
+    high = np.full(size, -np.inf)
+    np.minimum.at(low, groups, values)
+    np.maximum.at(high, groups, values)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / count
+    return {"count": count, "mean": mean, "min": low, "max": high}
+
+
+def primary_points(mapping: Dict[str, Any], device_id: str, result: Dict[str, Any]) -> Any:
+    """Points (or SeriesColumns) of the device's own telemetry key from a `build_telemetry` result."""
+    if "points" in result:
+        return result["points"] or []
+    device = mapping["devices"][device_id]
+    key = (device.get("connector") or {}).get("telemetryKey") or device.get("type") or ""
+    key = key.split(",")[0].strip()
+    return (result.get("series") or {}).get(key) or []
+
+
+def format_sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def unseen_telemetry(delta: Dict[str, Any], seen: Dict[str, int]) -> Optional[Dict[str, Any]]:
+    """`delta` without the points at or before the newest ts already sent per key (None if empty).
+
+    `seen` is updated with the newest ts of the points kept.
+    """
+    if "series" in delta:
+        series = delta["series"]
+    else:
+        series = {delta.get("key"): delta.get("points") or []}
+    fresh = {}
+    for key, points in series.items():
+        last = seen.get(key)
+        kept = points if last is None else [p for p in points if p["ts"] > last]
+        if kept:
+            seen[key] = max(p["ts"] for p in kept)
+            fresh[key] = kept
+    if not fresh:
+        return None
+    if "series" in delta:
+        return {**delta, "series": fresh}
+    return {**delta, "points": fresh[delta.get("key")]}
+
+
 async def publish_telemetry(
     mapping: Dict[str, Any],
     device_id: str,
     entity_type: str,
-    telemetry: Dict[str, Any],
+    telemetry: Any,
 ) -> None:
     settings = get_tb_settings(mapping)
     base_url = TB_BASE_URL or settings.get("baseUrl")
     if not base_url:
         raise HTTPException(status_code=500, detail="Missing TB_BASE_URL.")
     url = f"{base_url}/api/plugins/telemetry/{entity_type}/{device_id}/timeseries"
-    headers = await tb_client._get_auth_header(mapping)
-    async with httpx.AsyncClient(timeout=10) as client:
-        response = await client.post(url, json=telemetry, headers=headers)
+    response = await tb_client.send(mapping, "POST", url, "publish", json=telemetry)
     if response.status_code not in {200, 202, 204}:
         raise HTTPException(status_code=502, detail="ThingsBoard telemetry publish failed.")
 
@@ -432,20 +2867,477 @@ async def publish_attributes(
         raise HTTPException(status_code=500, detail="Missing TB_BASE_URL.")
     scope = (scope or "SERVER_SCOPE").upper()
     url = f"{base_url}/api/plugins/telemetry/{entity_type}/{device_id}/attributes/{scope}"
-    headers = await tb_client._get_auth_header(mapping)
-    async with httpx.AsyncClient(timeout=10) as client:
-        response = await client.post(url, json=attributes, headers=headers)
+    response = await tb_client.send(mapping, "POST", url, "publish", json=attributes)
     if response.status_code not in {200, 202, 204}:
         raise HTTPException(status_code=502, detail="ThingsBoard attributes publish failed.")
 
 
+def is_timestamped(entry: Dict[str, Any]) -> bool:
+    return "ts" in entry and isinstance(entry.get("values"), dict)
+
+
+def telemetry_entries(telemetry: Any) -> List[Dict[str, Any]]:
+    """ThingsBoard telemetry payload (`{k: v}`, `{ts, values}` or a list of them) as a list.
+
+    Values without a `ts` keep the plain `{k: v}` form so ThingsBoard stamps them on receipt.
+    """
+    entries = telemetry if isinstance(telemetry, list) else [telemetry]
+    result = []
+    for entry in entries:
+        if not isinstance(entry, dict) or not entry:
+            continue
+        if is_timestamped(entry):
+            result.append({"ts": entry["ts"], "values": entry["values"]})
+        else:
+            result.append(entry)
+    return result
+
+
+async def publish_entity(
+    mapping: Dict[str, Any],
+    entity_type: str,
+    device_id: str,
+    telemetry: List[Dict[str, Any]],
+    attributes: Dict[str, Any],
+) -> List[str]:
+    """Publish merged telemetry and attributes of one entity; returns the failed parts."""
+    calls = []
+    parts = []
+    if telemetry:
+        calls.append(publish_telemetry(mapping, device_id, entity_type, telemetry))
+        parts.append("telemetry")
+    if attributes:
+        calls.append(publish_attributes(mapping, device_id, entity_type, attributes))
+        parts.append("attributes")
+    results = await asyncio.gather(*calls, return_exceptions=True)
+    errors = []
+    for part, result in zip(parts, results):
+        if isinstance(result, BaseException):
+            detail = result.detail if isinstance(result, HTTPException) else str(result)
+            errors.append(f"{part}: {detail}")
+    return errors
+
+
+def record_points(record: Dict[str, Any]) -> int:
+    return len(record.get("telemetry") or []) + (1 if record.get("attributes") else 0)
+
+
+class PublishJournal:
+    """Append-only JSONL file of acknowledged publishes.
+
+    `<file>.offset` holds the byte offset up to which records have been published. The
+    file is removed once everything in it is published, and compacted once its published
+    head outweighs the rest. The offset file is always removed before the journal is
+    rewritten, so a crash replays published records rather than skipping unpublished
+    ones. Methods block; callers run them in a thread, and a lock serialises them.
+    """
+
+    COMPACT_BYTES = 1 << 20
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.offset_path = path.with_name(path.name + ".offset")
+        self._lock = threading.Lock()
+
+    def _offset(self) -> int:
+        try:
+            return int(self.offset_path.read_text(encoding="utf-8").strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def append(self, records: List[Dict[str, Any]]) -> None:
+        """Write `records` and fsync them: once this returns they survive a crash."""
+        data = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records)
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a+b") as handle:
+                size = handle.seek(0, os.SEEK_END)
+                if size:
+                    # A record torn by a crash stays on its own line and is skipped.
+                    handle.seek(size - 1)
+                    if handle.read(1) != b"\n":
+                        data = "\n" + data
+                handle.write(data.encode("utf-8"))
+                handle.flush()
+                os.fsync(handle.fileno())
+
+    def read(self, budget: Optional[int]) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """Unpublished records, up to `budget` entries (but at least one record).
+
+        Also returns the offset just past them, or None when nothing was read.
+        """
+        with self._lock:
+            start = offset = self._offset()
+            records: List[Dict[str, Any]] = []
+            try:
+                handle = self.path.open("rb")
+            except FileNotFoundError:
+                return [], None
+            with handle:
+                handle.seek(offset)
+                for line in handle:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        offset += len(line)
+                        continue
+                    points = record_points(record)
+                    if budget is not None and records and points > budget:
+                        break
+                    records.append(record)
+                    offset += len(line)
+                    if budget is not None:
+                        budget -= points
+            return records, (offset if offset > start else None)
+
+    def commit(self, offset: int) -> None:
+        """Mark everything before `offset` as published."""
+        with self._lock:
+            try:
+                size = self.path.stat().st_size
+            except FileNotFoundError:
+                self.offset_path.unlink(missing_ok=True)
+                return
+            if offset >= size:
+                self.offset_path.unlink(missing_ok=True)
+                self.path.unlink()
+                return
+            if offset >= self.COMPACT_BYTES and offset * 2 >= size:
+                rest = self.path.with_name(self.path.name + ".tmp")
+                with self.path.open("rb") as source, rest.open("wb") as target:
+                    source.seek(offset)
+                    shutil.copyfileobj(source, target)
+                    target.flush()
+                    os.fsync(target.fileno())
+                self.offset_path.unlink(missing_ok=True)
+                os.replace(rest, self.path)
+                return
+            pending = self.offset_path.with_name(self.offset_path.name + ".tmp")
+            pending.write_text(str(offset), encoding="utf-8")
+            os.replace(pending, self.offset_path)
+
+    def recover(self) -> None:
+        """Merge a `.replay` file left by an older version back in front of the journal."""
+        replaying = self.path.with_name(self.path.name + ".replay")
+        with self._lock:
+            if not replaying.exists():
+                return
+            if self.path.exists():
+                with replaying.open("ab") as target, self.path.open("rb") as source:
+                    shutil.copyfileobj(source, target)
+            self.offset_path.unlink(missing_ok=True)
+            os.replace(replaying, self.path)
+
+
+class PublishQueue:
+    """Write-behind buffer for ThingsBoard publishes.
+
+    Writes are coalesced per entity into one `[{ts, values}]` telemetry payload and one
+    attributes object, flushed every `flush_ms` or once `flush_points` entries are
+    pending, and retried with exponential backoff. With a journal path, every write is
+    appended (and fsynced) to the journal before it is acknowledged, and only the
+    journal's unpublished head is held in memory, up to half of `max_pending` entries.
+    That head is marked published once a flush succeeds, so a crash or a slow
+    ThingsBoard loses nothing and never grows memory. Without a journal the backlog
+    lives in memory, `max_pending` is a hard bound (`reserve` answers 429 beyond it)
+    and whatever is left at shutdown is dropped after one last flush.
+    """
+
+    def __init__(
+        self,
+        enabled: bool,
+        journal_path: str,
+        flush_ms: int,
+        flush_points: int,
+        max_pending: int,
+        max_attempts: int,
+        retry_max_sec: float,
+    ) -> None:
+        self.enabled = enabled
+        self.journal = PublishJournal(Path(journal_path)) if journal_path else None
+        self.flush_ms = flush_ms
+        self.flush_points = flush_points
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.retry_max_sec = retry_max_sec
+        self._pending: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._pending_points = 0
+        # Journal offset just past the records loaded into `_pending`, committed after a flush.
+        self._loaded_until: Optional[int] = None
+        self._journal_points = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self.queued = 0
+        self.flushed = 0
+        self.requests = 0
+        self.retries = 0
+        self.dropped = 0
+        self.journaled = 0
+        self.last_error: Optional[str] = None
+        self.last_flush_ms: Optional[float] = None
+
+    def reserve(self, points: int) -> None:
+        """Raise 429 if `points` more entries would overflow a queue without a journal."""
+        if self.journal or not self.max_pending:
+            return
+        if self._pending_points + points > self.max_pending:
+            raise HTTPException(
+                status_code=429,
+                detail="Publish queue is full; retry later or send \"wait\": true.",
+                headers={"Retry-After": str(max(1, round(self.flush_ms / 1000)))},
+            )
+
+    async def enqueue(self, writes: List[Tuple[str, str, List[Dict[str, Any]], Dict[str, Any]]]) -> None:
+        """Queue (entity type, device id, telemetry, attributes) writes; journaled ones are on disk on return."""
+        if self.journal:
+            records = [
+                {"entityType": entity_type, "deviceId": device_id, "telemetry": telemetry,
+                 "attributes": attributes, "attempts": 0}
+                for entity_type, device_id, telemetry, attributes in writes
+            ]
+            await asyncio.to_thread(self.journal.append, records)
+            self.journaled += len(records)
+            self._journal_points += sum(record_points(record) for record in records)
+        else:
+            for entity_type, device_id, telemetry, attributes in writes:
+                self._merge(entity_type, device_id, telemetry, attributes, attempts=0)
+        self.queued += len(writes)
+        if self._wakeup is not None and self._pending_points + self._journal_points >= self.flush_points:
+            self._wakeup.set()
+
+    def _merge(
+        self,
+        entity_type: str,
+        device_id: str,
+        telemetry: List[Dict[str, Any]],
+        attributes: Dict[str, Any],
+        attempts: int,
+    ) -> None:
+        entry = self._pending.setdefault(
+            (entity_type, device_id), {"telemetry": [], "attributes": {}, "attempts": attempts}
+        )
+        entry["telemetry"].extend(telemetry)
+        entry["attributes"].update(attributes)
+        entry["attempts"] = max(entry["attempts"], attempts)
+        self._pending_points += len(telemetry) + (1 if attributes else 0)
+
+    async def _load(self) -> None:
+        """Load the journal's unpublished head into the pending set, up to half of `max_pending`."""
+        if not self.journal or self._loaded_until is not None:
+            return
+        budget = self.max_pending // 2 - self._pending_points if self.max_pending else None
+        records, offset = await asyncio.to_thread(self.journal.read, budget)
+        for record in records:
+            self._merge(
+                record["entityType"],
+                record["deviceId"],
+                record.get("telemetry") or [],
+                record.get("attributes") or {},
+                int(record.get("attempts") or 0),
+            )
+        self._journal_points = max(0, self._journal_points - sum(record_points(r) for r in records))
+        self._loaded_until = offset
+
+    async def _commit(self) -> None:
+        if self._loaded_until is None:
+            return
+        offset, self._loaded_until = self._loaded_until, None
+        await asyncio.to_thread(self.journal.commit, offset)
+
+    @staticmethod
+    def coalesce(entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Merge entries sharing a timestamp, ordered by ts; un-timestamped values are merged first."""
+        untimed: Dict[str, Any] = {}
+        by_ts: Dict[Any, Dict[str, Any]] = {}
+        for entry in entries:
+            if is_timestamped(entry):
+                by_ts.setdefault(entry["ts"], {}).update(entry["values"])
+            else:
+                untimed.update(entry)
+        merged = [{"ts": ts, "values": values} for ts, values in sorted(by_ts.items())]
+        return [untimed, *merged] if untimed else merged
+
+    async def flush(self) -> bool:
+        """Publish everything pending; failed entities are requeued. True if all succeeded."""
+        if not self._pending:
+            await self._commit()
+            return True
+        mapping = load_mapping_cached()
+        batch, self._pending = self._pending, OrderedDict()
+        self._pending_points = 0
+        started = time.perf_counter()
+        keys = list(batch)
+        calls = [
+            partial(
+                publish_entity,
+                mapping,
+                entity_type,
+                device_id,
+                self.coalesce(batch[(entity_type, device_id)]["telemetry"]),
+                batch[(entity_type, device_id)]["attributes"],
+            )
+            for entity_type, device_id in keys
+        ]
+        try:
+            outcomes = await gather_bounded(calls, PREDICTIONS_CONCURRENCY)
+        except asyncio.CancelledError:
+            # Shutdown mid-flush: keep the batch (at-least-once). Journaled writes are also
+            # still uncommitted on disk and are published again by the next process.
+            for (entity_type, device_id), entry in batch.items():
+                self._merge(
+                    entity_type, device_id, entry["telemetry"], entry["attributes"], entry["attempts"]
+                )
+            raise
+        ok = True
+        for key, outcome in zip(keys, outcomes):
+            entry = batch[key]
+            if isinstance(outcome, BaseException):
+                outcome = [str(getattr(outcome, "detail", outcome))]
+            self.requests += (1 if entry["telemetry"] else 0) + (1 if entry["attributes"] else 0)
+            if not outcome:
+                self.flushed += 1
+                continue
+            ok = False
+            self.last_error = f"{key[1]}: {'; '.join(outcome)}"
+            if entry["attempts"] + 1 >= self.max_attempts:
+                self.dropped += 1
+                continue
+            self.retries += 1
+            self._merge(key[0], key[1], entry["telemetry"], entry["attributes"], entry["attempts"] + 1)
+        self.last_flush_ms = round((time.perf_counter() - started) * 1000, 2)
+        if ok:
+            await self._commit()
+        return ok
+
+    async def run(self) -> None:
+        self._wakeup = asyncio.Event()
+        if self.journal:
+            await asyncio.to_thread(self.journal.recover)
+        backoff = self.flush_ms / 1000
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=backoff)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self._load()
+                ok = await self.flush()
+            except Exception as exc:
+                self.last_error = str(getattr(exc, "detail", exc))
+                ok = False
+            if ok:
+                backoff = self.flush_ms / 1000
+            else:
+                backoff = min(max(backoff * 2, 1.0), self.retry_max_sec)
+
+    async def close(self) -> None:
+        if self.journal:
+            # Unpublished writes are already in the journal.
+            return
+        try:
+            await self.flush()
+        except Exception:
+            pass
+        self.dropped += len(self._pending)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "pendingEntities": len(self._pending),
+            "pendingPoints": self._pending_points + self._journal_points,
+            "journal": bool(self.journal and self.journal.path.exists()),
+            "queued": self.queued,
+            "flushedEntities": self.flushed,
+            "requests": self.requests,
+            "retries": self.retries,
+            "dropped": self.dropped,
+            "journaled": self.journaled,
+            "lastError": self.last_error,
+            "lastFlushMs": self.last_flush_ms,
+        }
+
+
+publish_queue = PublishQueue(
+    PUBLISH_QUEUE_ENABLED,
+    PUBLISH_QUEUE_PATH,
+    PUBLISH_FLUSH_MS,
+    PUBLISH_FLUSH_POINTS,
+    PUBLISH_MAX_PENDING,
+    PUBLISH_MAX_ATTEMPTS,
+    PUBLISH_RETRY_MAX_SEC,
+)
+
+
+@app.get("/metrics")
+def metrics() -> PlainTextResponse:
+    lines: List[str] = []
+    for histogram in (http_duration, http_response_size, upstream_duration, mapping_reload_duration):
+        lines.extend(histogram.render())
+    lines.extend(
+        render_gauge(
+            "bimiot_requests_in_flight",
+            "Requests currently being served or sent upstream.",
+            [({"side": side}, count) for side, count in in_flight.items()],
+        )
+    )
+    caches = {"telemetry": telemetry_cache.stats(), "alarms": alarms_cache.stats()}
+    for name, help_text in (
+        ("hits", "Fresh cache hits."),
+        ("misses", "Cache misses."),
+        ("coalesced", "Lookups that joined an in-flight fetch."),
+        ("staleHits", "Expired entries served while revalidating."),
+        ("staleOnError", "Entries served because ThingsBoard failed."),
+        ("evictions", "LRU evictions."),
+    ):
+        metric = "bimiot_cache_" + re.sub(r"(?<!^)(?=[A-Z])", "_", name).lower() + "_total"
+        samples = [({"cache": cache}, stats[name]) for cache, stats in caches.items()]
+        lines.extend(render_gauge(metric, help_text, samples, "counter"))
+    lines.extend(
+        render_gauge(
+            "bimiot_cache_hit_ratio",
+            "Share of lookups answered without waiting for ThingsBoard.",
+            [({"cache": cache}, stats["hitRatio"] or 0) for cache, stats in caches.items()],
+        )
+    )
+    lines.extend(
+        render_gauge(
+            "bimiot_cache_entries",
+            "Entries held per cache.",
+            [({"cache": cache}, stats["entries"]) for cache, stats in caches.items()],
+        )
+    )
+    circuit_states = {"closed": 0, "half-open": 1, "open": 2}
+    lines.extend(
+        render_gauge(
+            "bimiot_thingsboard_circuit_state",
+            "Circuit breaker state (0 closed, 1 half-open, 2 open).",
+            [({}, circuit_states[tb_circuit.state])],
+        )
+    )
+    index = current_mapping_index()
+    lines.extend(
+        render_gauge(
+            "bimiot_mapping_version", "Loaded mapping version.", [({}, index.version if index else 0)]
+        )
+    )
+    lines.extend(
+        render_gauge(
+            "bimiot_publish_queue_pending_points",
+            "Writes waiting in the publish queue.",
+            [({}, publish_queue.stats()["pendingPoints"])],
+        )
+    )
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+
 @app.get("/health")
 def health() -> Dict[str, str]:
     return {"status": "ok"}
 
 
-@app.get("/thingsboard/health")
-async def thingsboard_health() -> Dict[str, Any]:
+async def probe_thingsboard() -> Dict[str, Any]:
     mapping = load_mapping_cached()
     settings = get_tb_settings(mapping)
     base_url = TB_BASE_URL or settings.get("baseUrl")
@@ -459,8 +3351,10 @@ async def thingsboard_health() -> Dict[str, Any]:
         return {"status": "error", "connected": False, "detail": str(exc)}
 
     try:
-        async with httpx.AsyncClient(timeout=10) as client:
-            response = await client.get(f"{base_url}/api/system/info", headers=headers)
+        # Through the breaker: an open circuit answers without calling ThingsBoard.
+        response = await tb_client.request(
+            "GET", f"{base_url}/api/system/info", "health", headers=headers, timeout=TB_TIMEOUTS["health"]
+        )
         if response.status_code == 200:
             return {"status": "ok", "connected": True}
         return {
@@ -468,50 +3362,70 @@ async def thingsboard_health() -> Dict[str, Any]:
             "connected": False,
             "detail": f"ThingsBoard response: {response.status_code}",
         }
+    except HTTPException as exc:
+        return {"status": "error", "connected": False, "detail": exc.detail}
     except Exception as exc:
         return {"status": "error", "connected": False, "detail": str(exc)}
 
 
+@app.get("/thingsboard/health")
+async def thingsboard_health() -> Dict[str, Any]:
+    return {**await probe_thingsboard(), "circuit": tb_circuit.stats()}
+
+
+async def cached_alarm_page(
+    mapping: Dict[str, Any], entity_type: str, device_tb_id: str, status: Optional[str], page_size: int
+) -> Tuple[Dict[str, Any], Optional[float]]:
+    fetch = partial(
+        tb_client.fetch_alarm_page,
+        mapping=mapping,
+        entity_type=entity_type,
+        entity_id=device_tb_id,
+        search_status=status,
+        page_size=page_size,
+        page=0,
+    )
+    return await alarms_cache.lookup((entity_type, device_tb_id, status, page_size), fetch)
+
+
+def stale_marker(stale_ages: List[float]) -> Dict[str, Any]:
+    if not stale_ages:
+        return {}
+    return {"stale": True, "staleAgeSec": max(stale_ages), "staleOriginators": len(stale_ages)}
+
+
 @app.get("/alarms/summary")
 async def alarms_summary(
     status: Optional[str] = Query(default="ACTIVE"),
     page_size: int = Query(default=1, ge=1, le=100),
 ) -> Dict[str, Any]:
-    mapping = load_mapping_cached()
-    devices = mapping.get("devices", {}) if isinstance(mapping, dict) else {}
+    index = load_mapping_index()
+    mapping = index.mapping
+    originators = index.tb_originators
+    calls = [
+        partial(cached_alarm_page, mapping, entity_type, device_tb_id, status, page_size)
+        for _, entity_type, device_tb_id in originators
+    ]
     total = 0
     failed = 0
-    originators = 0
-
-    for _, data in devices.items():
-        connector = data.get("connector", {}) if isinstance(data, dict) else {}
-        if connector.get("type") != "thingsboard":
-            continue
-        device_tb_id = connector.get("deviceId")
-        if not device_tb_id:
-            continue
-        entity_type = (connector.get("entityType") or "DEVICE").upper()
-        if entity_type not in {"DEVICE", "ASSET"}:
-            continue
-        originators += 1
+    stale_ages = []
+    for result in await gather_bounded(calls, ALARMS_CONCURRENCY):
         try:
-            page = await tb_client.fetch_alarm_page(
-                mapping=mapping,
-                entity_type=entity_type,
-                entity_id=device_tb_id,
-                search_status=status,
-                page_size=page_size,
-                page=0,
-            )
+            if isinstance(result, BaseException):
+                raise result
+            page, stale_age = result
             total += int(page.get("totalElements") or 0)
+            if stale_age is not None:
+                stale_ages.append(stale_age)
         except Exception:
             failed += 1
 
     return {
         "status": "ok",
         "total": total,
-        "originators": originators,
+        "originators": len(originators),
         "failed": failed,
+        **stale_marker(stale_ages),
     }
 
 
@@ -521,33 +3435,26 @@ async def alarms_recent(
     limit: int = Query(default=8, ge=1, le=50),
     per_device: int = Query(default=5, ge=1, le=50),
 ) -> Dict[str, Any]:
-    mapping = load_mapping_cached()
-    devices = mapping.get("devices", {}) if isinstance(mapping, dict) else {}
+    index = load_mapping_index()
+    mapping = index.mapping
+    originators = index.tb_originators
+    calls = [
+        partial(cached_alarm_page, mapping, entity_type, device_tb_id, status, per_device)
+        for _, entity_type, device_tb_id in originators
+    ]
     alarms: List[Dict[str, Any]] = []
     total = 0
     failed = 0
-    originators = 0
 
-    for device_id, data in devices.items():
-        connector = data.get("connector", {}) if isinstance(data, dict) else {}
-        if connector.get("type") != "thingsboard":
-            continue
-        device_tb_id = connector.get("deviceId")
-        if not device_tb_id:
-            continue
-        entity_type = (connector.get("entityType") or "DEVICE").upper()
-        if entity_type not in {"DEVICE", "ASSET"}:
-            continue
-        originators += 1
+    stale_ages = []
+    results = await gather_bounded(calls, ALARMS_CONCURRENCY)
+    for (device_id, entity_type, device_tb_id), result in zip(originators, results):
         try:
-            page = await tb_client.fetch_alarm_page(
-                mapping=mapping,
-                entity_type=entity_type,
-                entity_id=device_tb_id,
-                search_status=status,
-                page_size=per_device,
-                page=0,
-            )
+            if isinstance(result, BaseException):
+                raise result
+            page, stale_age = result
+            if stale_age is not None:
+                stale_ages.append(stale_age)
             total += int(page.get("totalElements") or 0)
             for alarm in page.get("data", []) or []:
                 alarm_id = alarm.get("id")
@@ -579,9 +3486,10 @@ async def alarms_recent(
         "status": "ok",
         "alarms": alarms,
         "total": total,
-        "originators": originators,
+        "originators": len(originators),
         "failed": failed,
         "timestamp": int(time.time() * 1000),
+        **stale_marker(stale_ages),
     }
 
 
@@ -589,6 +3497,7 @@ async def alarms_recent(
 async def alarm_action(alarm_id: str, action: str) -> Dict[str, Any]:
     mapping = load_mapping_cached()
     result = await tb_client.action_alarm(mapping, alarm_id, action)
+    alarms_cache.clear()
     return {"status": "ok", "result": result}
 
 
@@ -598,58 +3507,396 @@ async def predictions_apply(payload: Dict[str, Any]) -> Dict[str, Any]:
     items = payload.get("items") or []
     if not isinstance(items, list):
         raise HTTPException(status_code=400, detail="Invalid items payload.")
-    published = 0
-    for item in items:
-        if not isinstance(item, dict):
-            continue
-        device_id = item.get("deviceId")
-        entity_type = (item.get("entityType") or "DEVICE").upper()
-        telemetry = item.get("telemetry") or {}
-        attributes = item.get("attributes") or {}
+
+    # Items for the same entity are merged so each entity costs at most one telemetry
+    # and one attributes request, whatever the number of predictors writing to it.
+    entities: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    results: List[Dict[str, Any]] = []
+    for position, item in enumerate(items):
+        device_id = item.get("deviceId") if isinstance(item, dict) else None
+        entity_type = (item.get("entityType") or "DEVICE").upper() if isinstance(item, dict) else None
+        results.append({"index": position, "deviceId": device_id, "status": "skipped"})
         if not device_id or entity_type not in {"DEVICE", "ASSET"}:
+            results[-1]["detail"] = "Missing deviceId or invalid entityType."
             continue
-        if telemetry:
-            await publish_telemetry(mapping, device_id, entity_type, telemetry)
-        if attributes:
-            await publish_attributes(mapping, device_id, entity_type, attributes)
-        published += 1
-    return {"status": "ok", "published": published}
+        telemetry = telemetry_entries(item.get("telemetry"))
+        attributes = item.get("attributes") if isinstance(item.get("attributes"), dict) else {}
+        if not telemetry and not attributes:
+            results[-1]["detail"] = "Nothing to publish."
+            continue
+        entity = entities.setdefault(
+            (entity_type, device_id), {"telemetry": [], "attributes": {}, "items": []}
+        )
+        entity["telemetry"].extend(telemetry)
+        entity["attributes"].update(attributes)
+        entity["items"].append(position)
+
+    keys = list(entities)
+    if publish_queue.enabled and not payload.get("wait"):
+        publish_queue.reserve(
+            sum(len(entity["telemetry"]) + (1 if entity["attributes"] else 0) for entity in entities.values())
+        )
+        await publish_queue.enqueue(
+            [(key[0], key[1], entities[key]["telemetry"], entities[key]["attributes"]) for key in keys]
+        )
+        for key in keys:
+            for position in entities[key]["items"]:
+                results[position]["status"] = "queued"
+        queued = sum(len(entities[key]["items"]) for key in keys)
+        return {
+            "status": "queued",
+            "queued": queued,
+            "skipped": len(items) - queued,
+            "entities": len(keys),
+            "items": results,
+        }
+
+    calls = [
+        partial(
+            publish_entity,
+            mapping,
+            entity_type,
+            device_id,
+            entities[(entity_type, device_id)]["telemetry"],
+            entities[(entity_type, device_id)]["attributes"],
+        )
+        for entity_type, device_id in keys
+    ]
+    published = 0
+    failed = 0
+    for key, outcome in zip(keys, await gather_bounded(calls, PREDICTIONS_CONCURRENCY)):
+        if isinstance(outcome, BaseException):
+            outcome = [outcome.detail if isinstance(outcome, HTTPException) else str(outcome)]
+        for position in entities[key]["items"]:
+            if outcome:
+                results[position].update({"status": "error", "detail": "; ".join(outcome)})
+                failed += 1
+            else:
+                results[position]["status"] = "ok"
+                published += 1
+    skipped = len(items) - published - failed
+    return {
+        "status": "ok",
+        "published": published,
+        "failed": failed,
+        "skipped": skipped,
+        "entities": len(keys),
+        "items": results,
+    }
+
+
+@app.get("/publish/queue/stats")
+def publish_queue_stats() -> Dict[str, Any]:
+    return publish_queue.stats()
 
 
 @app.get("/devices")
-def list_devices() -> Dict[str, Any]:
-    mapping = load_mapping_cached()
-    devices = []
-    for device_id, data in mapping.get("devices", {}).items():
-        devices.append(
-            {
-                "id": device_id,
-                "type": data.get("type"),
-                "connector": data.get("connector", {}),
-            }
-        )
-    return {"devices": devices}
+def list_devices(
+    request: Request,
+    type: Optional[str] = Query(default=None, description="Only devices of this type"),
+) -> Any:
+    index = load_mapping_index()
+    if type is None:
+        return encoded_json_response(request, index.devices_body, index.headers)
+    wanted = set(index.by_type.get(type, []))
+    return {"devices": [device for device in index.device_list if device["id"] in wanted]}
+
+
+@app.get("/devices/by-guid/{guid}")
+def device_by_guid(guid: str) -> Dict[str, Any]:
+    index = load_mapping_index()
+    device_id = index.by_guid.get(guid)
+    if device_id is None:
+        raise HTTPException(status_code=404, detail=f"No device linked to GUID: {guid}")
+    return {"id": device_id, **index.devices[device_id]}
 
 
 @app.get("/devices.ifc.json")
-def get_mapping() -> Dict[str, Any]:
-    return load_mapping_cached()
+def get_mapping(request: Request) -> Response:
+    index = load_mapping_index()
+    return encoded_json_response(request, index.mapping_body, index.headers)
 
 
 @app.post("/refresh_mapping")
-def refresh_mapping_endpoint() -> Dict[str, Any]:
-    mapping = refresh_mapping()
+def refresh_mapping_endpoint(
+    force: bool = Query(default=False, description="Reload even if the file's mtime and size are unchanged"),
+) -> Dict[str, Any]:
+    index = current_mapping_index()
+    unchanged = index is not None and not force and mapping_file_signature() == _mapping_signature
+    if not unchanged:
+        refresh_mapping()
+        index = load_mapping_index()
     return {
-        "status": "ok",
+        "status": "unchanged" if unchanged else "ok",
         "path": DEVICE_MAPPING_PATH,
-        "deviceCount": len(mapping.get("devices", {})),
+        "deviceCount": len(index.devices),
+        "version": index.version,
     }
 
 
+@app.get("/mapping/status")
+def mapping_status() -> Dict[str, Any]:
+    index = current_mapping_index()
+    return {
+        "loaded": index is not None,
+        "path": DEVICE_MAPPING_PATH,
+        "version": index.version if index else None,
+        "loadedTs": index.loaded_ts if index else None,
+        "loadMs": index.load_ms if index else None,
+        "deviceCount": len(index.devices) if index else 0,
+        "watchSec": MAPPING_WATCH_SEC,
+        "lastError": _mapping_watch_error,
+    }
+
+
+@app.get("/model/{filename}/index")
+async def get_model_index(request: Request, filename: str) -> Response:
+    path = resolve_model_path(filename)
+    body = await asyncio.to_thread(model_store.index_body, path)
+    return encoded_json_response(request, body, {})
+
+
 @app.get("/model/{filename}")
-def get_model(filename: str) -> FileResponse:
+async def get_model(request: Request, filename: str) -> Response:
     path = resolve_model_path(filename)
-    return FileResponse(path, media_type="application/octet-stream", filename=path.name)
+    asset = await asyncio.to_thread(model_store.asset, path)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Last-Modified": asset.last_modified,
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+        "Content-Disposition": f'attachment; filename="{path.name}"',
+    }
+
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if if_range is None or if_range in {asset.etag, asset.last_modified}:
+        byte_range = parse_byte_range(request.headers.get("range"), asset.size)
+
+    encoding = None
+    if byte_range is None:
+        weights = accepted_encodings(request)
+        # Highest q-value first, br before gzip on a tie.
+        for candidate in sorted(("br", "gzip"), key=lambda enc: -encoding_weight(weights, enc)):
+            if encoding_weight(weights, candidate) > 0 and asset.variant(candidate) is not None:
+                encoding = candidate
+                break
+    headers["ETag"] = asset.variant_etag(encoding) if encoding else asset.etag
+
+    if_none_match = request.headers.get("if-none-match")
+    validators = [asset.etag] + [asset.variant_etag(enc) for enc in ("gzip", "br")]
+    if etag_matches(if_none_match, *validators) or (
+        if_none_match is None and not_modified_since(request.headers.get("if-modified-since"), asset.mtime)
+    ):
+        return Response(status_code=304, headers=headers)
+
+    if encoding:
+        variant = asset.variant(encoding)
+        variant_stat = variant.stat()
+        size = variant_stat.st_size
+        view = await asyncio.to_thread(model_store.view, variant, variant_stat)
+        headers["Content-Encoding"] = encoding
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(
+            iter_view(view, 0, size - 1), media_type="application/octet-stream", headers=headers
+        )
+
+    view = await asyncio.to_thread(model_store.view, path, asset.stat)
+    if byte_range is None:
+        headers["Content-Length"] = str(asset.size)
+        return StreamingResponse(
+            iter_view(view, 0, asset.size - 1), media_type="application/octet-stream", headers=headers
+        )
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{asset.size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        iter_view(view, start, end),
+        status_code=206,
+        media_type="application/octet-stream",
+        headers=headers,
+    )
+
+
+def parse_bounded_int(value: Any, default: int, low: int, high: int, name: str) -> int:
+    if value is None or value == "":
+        return default
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=422, detail=f"Invalid {name}: expected an integer.")
+    if number < low or number > high:
+        raise HTTPException(status_code=422, detail=f"Invalid {name}: must be within {low}-{high}.")
+    return number
+
+
+def parse_optional_int(value: Any, name: str) -> Optional[int]:
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=422, detail=f"Invalid {name}: expected an integer.")
+
+
+async def build_batch_item(mapping: Dict[str, Any], item: Any) -> Dict[str, Any]:
+    if not isinstance(item, dict):
+        raise HTTPException(status_code=422, detail="Invalid batch item.")
+    device_id = item.get("deviceId")
+    if not device_id or not isinstance(device_id, str):
+        raise HTTPException(status_code=422, detail="Missing deviceId.")
+    keys = item.get("keys", item.get("key"))
+    if isinstance(keys, list):
+        keys = ",".join(str(k).strip() for k in keys if str(k).strip())
+    limit = parse_bounded_int(item.get("limit"), 24, 1, 1000, "limit")
+    hours = parse_bounded_int(item.get("hours"), 24, 1, TELEMETRY_MAX_HOURS, "hours")
+    start_ts = parse_optional_int(item.get("startTs"), "startTs")
+    end_ts = parse_optional_int(item.get("endTs"), "endTs")
+    since_ts = parse_optional_int(item.get("sinceTs"), "sinceTs")
+    interval = item.get("interval")
+    max_points = parse_bounded_int(item.get("maxPoints"), 0, 3, 100_000, "maxPoints")
+    fmt = str(item.get("format") or "json").lower()
+    if fmt not in {"json", "columnar"}:
+        raise HTTPException(status_code=400, detail="Invalid format. Use json or columnar.")
+    interval_ms = parse_interval_ms(str(interval) if interval is not None else None)
+    fetch_limit = downsample_fetch_limit(limit, max_points, item.get("agg"), interval_ms, since_ts)
+    result = await build_telemetry(
+        mapping,
+        device_id,
+        keys or None,
+        fetch_limit,
+        hours,
+        item.get("agg"),
+        start_ts,
+        end_ts,
+        interval_ms,
+        since_ts,
+        fmt == "columnar",
+    )
+    result = downsample_telemetry(result, max_points, str(item.get("downsample") or "lttb"), fetch_limit)
+    return columnar_telemetry(result) if fmt == "columnar" else result
+
+
+@app.post("/telemetry/batch")
+async def telemetry_batch(payload: Dict[str, Any]) -> Response:
+    mapping = load_mapping_cached()
+    items = payload.get("items")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Invalid items payload.")
+    if len(items) > TELEMETRY_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many batch items (max {TELEMETRY_BATCH_MAX_ITEMS}).",
+        )
+
+    calls = [partial(build_batch_item, mapping, item) for item in items]
+    results: List[Dict[str, Any]] = []
+    failed = 0
+    for item, result in zip(items, await gather_bounded(calls, TELEMETRY_BATCH_CONCURRENCY)):
+        if isinstance(result, BaseException):
+            failed += 1
+            code = result.status_code if isinstance(result, HTTPException) else 500
+            detail = result.detail if isinstance(result, HTTPException) else str(result)
+            device_id = item.get("deviceId") if isinstance(item, dict) else None
+            results.append({"deviceId": device_id, "status": "error", "code": code, "detail": detail})
+            continue
+        results.append({"status": "ok", **result})
+    # Items hold only JSON-native values, columnar ones long lists: skip jsonable_encoder.
+    return TimedJSONResponse({"status": "ok", "items": results, "failed": failed})
+
+
+@app.get("/devices/{device_id}/telemetry/stream")
+async def device_telemetry_stream(
+    request: Request,
+    device_id: str,
+    key: Optional[str] = Query(default=None, description="Single key or comma-separated keys"),
+    since_ts: Optional[int] = Query(
+        default=None, alias="sinceTs", description="Replay points newer than this cursor first"
+    ),
+) -> StreamingResponse:
+    mapping = load_mapping_cached()
+    get_device(mapping, device_id)
+
+    async def events():
+        queue = telemetry_hub.subscribe(device_id, key)
+        # Newest ts sent per key: the shared poller may push points the backlog already had.
+        seen: Dict[str, int] = {}
+        try:
+            cursor = since_ts
+            while cursor is not None:
+                # The response has started by now: a failed replay is reported in-stream and
+                # live updates carry on.
+                try:
+                    backlog = await build_telemetry(mapping, device_id, key, 1000, 24, since_ts=cursor)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as exc:
+                    detail = exc.detail if isinstance(exc, HTTPException) else str(exc)
+                    yield format_sse("error", {"deviceId": device_id, "detail": detail, "sinceTs": cursor})
+                    break
+                unseen_telemetry(backlog, seen)
+                yield format_sse("telemetry", backlog)
+                more = backlog.get("hasMore") and backlog.get("cursor", cursor) > cursor
+                cursor = backlog["cursor"] if more else None
+            while not await request.is_disconnected():
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=TELEMETRY_STREAM_HEARTBEAT_SEC)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                data = message["data"]
+                if message["event"] == "telemetry":
+                    data = unseen_telemetry(data, seen)
+                    if data is None:
+                        continue
+                yield format_sse(message["event"], data)
+        finally:
+            telemetry_hub.unsubscribe(device_id, key, queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/telemetry/stream/stats")
+def telemetry_stream_stats() -> Dict[str, Any]:
+    return {**telemetry_hub.stats(), "thingsboard": tb_stream.stats()}
+
+
+@app.get("/devices/latest")
+def devices_latest() -> Dict[str, Any]:
+    index = load_mapping_index()
+    values = {
+        device_id: tb_stream.latest_for(device_tb_id)
+        for device_id, _, device_tb_id in index.tb_originators
+        if device_tb_id in tb_stream.latest
+    }
+    return {"connected": tb_stream.connected, "devices": values}
+
+
+@app.get("/devices/{device_id}/latest")
+async def device_latest(device_id: str) -> Dict[str, Any]:
+    mapping = load_mapping_cached()
+    device = get_device(mapping, device_id)
+    device_tb_id = (device.get("connector") or {}).get("deviceId")
+    if tb_stream.covers(device_id) and device_tb_id in tb_stream.latest:
+        return {"deviceId": device_id, "values": tb_stream.latest_for(device_tb_id), "source": "stream"}
+    result = await build_telemetry(mapping, device_id, None, 1, 24)
+    series = result.get("series") or {result.get("key"): result.get("points") or []}
+    values = {key: points[-1] for key, points in series.items() if points}
+    return {"deviceId": device_id, "values": values, "source": "poll"}
+
+
+@app.get("/telemetry/store/stats")
+def telemetry_store_stats() -> Dict[str, Any]:
+    return telemetry_store.stats()
+
+
+@app.get("/telemetry/cache/stats")
+def telemetry_cache_stats() -> Dict[str, Any]:
+    return telemetry_cache.stats()
 
 
 @app.get("/devices/{device_id}/telemetry")
@@ -657,17 +3904,204 @@ async def device_telemetry(
     device_id: str,
     key: Optional[str] = Query(default=None, description="Single key or comma-separated keys"),
     limit: int = Query(default=24, ge=1, le=1000),
-    hours: int = Query(default=24, ge=1, le=168),
+    hours: int = Query(default=24, ge=1, le=TELEMETRY_MAX_HOURS),
     agg: Optional[str] = Query(default=None),
     start_ts: Optional[int] = Query(default=None, alias="startTs"),
     end_ts: Optional[int] = Query(default=None, alias="endTs"),
     interval: Optional[str] = Query(
         default=None, description="Aggregation interval (minute/hour/day/week/month/year or ms)"
     ),
-) -> Dict[str, Any]:
+    since_ts: Optional[int] = Query(
+        default=None, alias="sinceTs", description="Only return points newer than this cursor"
+    ),
+    max_points: Optional[int] = Query(
+        default=None, alias="maxPoints", ge=3, le=100_000, description="Downsample each series to this size"
+    ),
+    downsample: str = Query(default="lttb", description="Downsampling mode: lttb or minmax"),
+    fmt: Optional[str] = Query(default=None, alias="format", description="json, columnar or binary"),
+) -> Any:
     mapping = load_mapping_cached()
     interval_ms = parse_interval_ms(interval)
-    return await build_telemetry(mapping, device_id, key, limit, hours, agg, start_ts, end_ts, interval_ms)
+    fetch_limit = downsample_fetch_limit(limit, max_points, agg, interval_ms, since_ts)
+    # Columnar and binary responses are encoded from arrays, so they skip the per-point dicts.
+    columns = (fmt or "").lower() in {"columnar", "binary"}
+    result = await build_telemetry(
+        mapping, device_id, key, fetch_limit, hours, agg, start_ts, end_ts, interval_ms, since_ts, columns
+    )
+    return encode_telemetry(downsample_telemetry(result, max_points, downsample, fetch_limit), fmt)
+
+
+def spatial_scope(
+    index: SpatialIndex, mapping: Dict[str, Any], level: str, node: Optional[str], device_type: Optional[str]
+) -> Tuple[List[int], List[str], List[Tuple[str, int, int]]]:
+    """Groups at `level`, the device types present, and (device, group, type) rows."""
+    group_ids = sorted(index.groups(level, node).items())
+    types: List[str] = []
+    rows: List[Tuple[str, int, int]] = []
+    for position, (_, device_ids) in enumerate(group_ids):
+        for device_id in device_ids:
+            kind = str(mapping["devices"][device_id].get("type"))
+            if device_type and kind != device_type:
+                continue
+            if kind not in types:
+                types.append(kind)
+            rows.append((device_id, position, types.index(kind)))
+    return [group for group, _ in group_ids], types, rows
+
+
+@app.get("/spatial")
+async def spatial_tree() -> Dict[str, Any]:
+    index = await asyncio.to_thread(build_spatial_index)
+    return index.tree()
+
+
+@app.get("/spatial/latest")
+async def spatial_latest(
+    level: str = Query(default="storey", description="site, building, storey or space"),
+    node: Optional[str] = Query(default=None, description="GlobalId of a spatial node to restrict to"),
+    device_type: Optional[str] = Query(default=None, alias="type"),
+) -> Dict[str, Any]:
+    mapping = load_mapping_cached()
+    index = await asyncio.to_thread(build_spatial_index)
+    groups, types, rows = spatial_scope(index, mapping, level, node, device_type)
+
+    async def latest(device_id: str) -> Tuple[int, float]:
+        device = mapping["devices"][device_id]
+        connector = device.get("connector") or {}
+        device_tb_id = connector.get("deviceId")
+        if tb_stream.covers(device_id) and device_tb_id in tb_stream.latest:
+            key = (connector.get("telemetryKey") or device.get("type") or "").split(",")[0].strip()
+            sample = tb_stream.latest_for(device_tb_id).get(key)
+            if sample is not None:
+                return sample["ts"], numeric_value(sample["value"])
+        points = primary_points(mapping, device_id, await build_telemetry(mapping, device_id, None, 1, 24))
+        if not points:
+            return 0, float("nan")
+        return points[-1]["ts"], numeric_value(points[-1]["value"])
+
+    calls = [partial(latest, device_id) for device_id, _, _ in rows]
+    results = await gather_bounded(calls, TELEMETRY_BATCH_CONCURRENCY)
+    failed = sum(1 for result in results if isinstance(result, BaseException))
+    samples = [(r, row) for r, row in zip(results, rows) if not isinstance(r, BaseException)]
+    values = np.array([value for (_, value), _ in samples], dtype=float)
+    ts = np.array([ts for (ts, _), _ in samples], dtype=np.int64)
+    cells = np.array([row[1] * len(types) + row[2] for _, row in samples], dtype=np.int64)
+    valid = np.isfinite(values)
+    size = len(groups) * len(types)
+    stats = aggregate_groups(cells[valid], values[valid], size)
+    newest = np.zeros(size, dtype=np.int64)
+    np.maximum.at(newest, cells[valid], ts[valid])
+
+    nodes = []
+    for position, group in enumerate(groups):
+        summary = {}
+        for type_index, kind in enumerate(types):
+            cell = position * len(types) + type_index
+            if stats["count"][cell]:
+                summary[kind] = {
+                    "count": int(stats["count"][cell]),
+                    "mean": float(stats["mean"][cell]),
+                    "min": float(stats["min"][cell]),
+                    "max": float(stats["max"][cell]),
+                    "ts": int(newest[cell]),
+                }
+        devices = sum(1 for _, row in samples if row[1] == position)
+        nodes.append({**index.describe(group), "devices": devices, "types": summary})
+    return {"level": level, "nodes": nodes, "failed": failed}
+
+
+@app.get("/spatial/telemetry")
+async def spatial_telemetry(
+    level: str = Query(default="storey", description="site, building, storey or space"),
+    node: Optional[str] = Query(default=None, description="GlobalId of a spatial node to restrict to"),
+    device_type: Optional[str] = Query(default=None, alias="type"),
+    hours: int = Query(default=24, ge=1, le=TELEMETRY_MAX_HOURS),
+    start_ts: Optional[int] = Query(default=None, alias="startTs"),
+    end_ts: Optional[int] = Query(default=None, alias="endTs"),
+    interval: str = Query(default="hour", description="Bucket size (minute/hour/day/week/month/year or ms)"),
+    limit: int = Query(
+        default=SPATIAL_RAW_MAX_POINTS,
+        ge=1,
+        le=TELEMETRY_RAW_MAX_POINTS,
+        description="Raw points fetched per device; the window is paged upstream",
+    ),
+) -> Dict[str, Any]:
+    mapping = load_mapping_cached()
+    index = await asyncio.to_thread(build_spatial_index)
+    groups, types, rows = spatial_scope(index, mapping, level, node, device_type)
+    bucket_ms = parse_interval_ms(interval)
+    if not bucket_ms:
+        raise HTTPException(status_code=422, detail="Invalid interval.")
+    quantum = TELEMETRY_CACHE_QUANTUM_MS if telemetry_cache.enabled else 0
+    start_ts, end_ts = resolve_window(hours, start_ts, end_ts, quantum)
+    buckets = max(1, -(-(end_ts - start_ts) // bucket_ms))
+    if buckets > SPATIAL_MAX_BUCKETS:
+        raise HTTPException(
+            status_code=422, detail=f"Too many buckets (max {SPATIAL_MAX_BUCKETS}); use a larger interval."
+        )
+
+    calls = [
+        partial(build_telemetry, mapping, device_id, None, limit, hours, None, start_ts, end_ts, columns=True)
+        for device_id, _, _ in rows
+    ]
+    results = await gather_bounded(calls, TELEMETRY_BATCH_CONCURRENCY)
+    failed = 0
+    truncated: List[str] = []
+    ts_parts, value_parts, cell_parts = [], [], []
+    for (device_id, position, type_index), result in zip(rows, results):
+        if isinstance(result, BaseException):
+            failed += 1
+            continue
+        points = primary_points(mapping, device_id, result)
+        if not isinstance(points, SeriesColumns):
+            points = SeriesColumns.from_points(points)
+        if len(points) >= limit:
+            truncated.append(device_id)
+        ts_parts.append(points.ts)
+        value_parts.append(points.value)
+        cell_parts.append(np.full(len(points), position * len(types) + type_index, dtype=np.int64))
+
+    ts = np.concatenate(ts_parts) if ts_parts else np.zeros(0, dtype=np.int64)
+    values = np.concatenate(value_parts) if value_parts else np.zeros(0)
+    cells = np.concatenate(cell_parts) if cell_parts else np.zeros(0, dtype=np.int64)
+    valid = np.isfinite(values) & (ts >= start_ts) & (ts <= end_ts)
+    ts, values, cells = ts[valid], values[valid], cells[valid]
+    size = len(groups) * len(types)
+    bucket = np.minimum((ts - start_ts) // bucket_ms, buckets - 1)
+    summary = aggregate_groups(cells, values, size)
+    series = aggregate_groups(cells * buckets + bucket, values, size * buckets)
+
+    nodes = []
+    for position, group in enumerate(groups):
+        by_type = {}
+        for type_index, kind in enumerate(types):
+            cell = position * len(types) + type_index
+            if not summary["count"][cell]:
+                continue
+            window = slice(cell * buckets, (cell + 1) * buckets)
+            filled = np.nonzero(series["count"][window])[0]
+            by_type[kind] = {
+                "count": int(summary["count"][cell]),
+                "mean": float(summary["mean"][cell]),
+                "min": float(summary["min"][cell]),
+                "max": float(summary["max"][cell]),
+                "ts": (start_ts + filled * bucket_ms).tolist(),
+                "bucketMean": series["mean"][window][filled].tolist(),
+                "bucketMin": series["min"][window][filled].tolist(),
+                "bucketMax": series["max"][window][filled].tolist(),
+                "bucketCount": series["count"][window][filled].tolist(),
+            }
+        devices = sum(1 for row in rows if row[1] == position)
+        nodes.append({**index.describe(group), "devices": devices, "types": by_type})
+    return {
+        "level": level,
+        "startTs": start_ts,
+        "endTs": end_ts,
+        "intervalMs": bucket_ms,
+        "nodes": nodes,
+        "failed": failed,
+        "truncated": truncated,
+    }
 
 
 if __name__ == "__main__":
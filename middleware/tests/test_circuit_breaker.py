@@ -0,0 +1,92 @@
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+def expire(breaker):
+    breaker.opened_at = time.monotonic() - breaker.reset_sec - 1
+
+
+def test_breaker_opens_probes_and_closes():
+    breaker = app.CircuitBreaker(failure_threshold=2, reset_sec=30, probes=1)
+    assert breaker.before() is False
+    breaker.record(False, False)
+    assert breaker.state == "closed"
+    breaker.record(False, False)
+    assert breaker.state == "open"
+
+    with pytest.raises(HTTPException) as raised:
+        breaker.before()
+    assert raised.value.status_code == 503
+    assert 1 <= int(raised.value.headers["Retry-After"]) <= 30
+
+    # Once reset_sec has passed, one probe is admitted and the others are still rejected.
+    expire(breaker)
+    assert breaker.before() is True
+    assert breaker.state == "half-open"
+    with pytest.raises(HTTPException):
+        breaker.before()
+
+    # A failed probe reopens straight away, whatever the failure count.
+    breaker.record(False, True)
+    assert breaker.state == "open"
+    expire(breaker)
+    probe = breaker.before()
+    breaker.record(True, probe)
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+    assert breaker.stats()["opened"] == 2
+    assert breaker.stats()["rejected"] == 2
+
+
+def test_cancelled_probe_frees_its_slot():
+    breaker = app.CircuitBreaker(failure_threshold=1, reset_sec=30, probes=1)
+    breaker.record(False, False)
+    expire(breaker)
+    probe = breaker.before()
+    breaker.release(probe)
+    assert breaker.before() is True
+
+
+def test_disabled_breaker_never_opens():
+    breaker = app.CircuitBreaker(failure_threshold=0, reset_sec=30, probes=1)
+    for _ in range(10):
+        breaker.record(False, breaker.before())
+    assert breaker.before() is False
+
+
+def test_health_probe_goes_through_the_breaker(monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(503)
+
+    client = app.ThingsBoardClient()
+    client._http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    breaker = app.CircuitBreaker(failure_threshold=2, reset_sec=30, probes=1)
+    monkeypatch.setattr(app, "tb_client", client)
+    monkeypatch.setattr(app, "tb_circuit", breaker)
+    monkeypatch.setattr(app, "TB_BASE_URL", "http://tb")
+    monkeypatch.setattr(app, "TB_API_KEY", "key")
+    monkeypatch.setattr(app, "load_mapping_cached", lambda: {})
+
+    async def probe_three_times():
+        results = [await app.probe_thingsboard() for _ in range(3)]
+        await client._http.aclose()
+        return results
+
+    results = asyncio.run(probe_three_times())
+    assert calls == ["/api/system/info", "/api/system/info"]
+    assert breaker.state == "open"
+    assert [result["connected"] for result in results] == [False, False, False]
+    assert "circuit open" in results[2]["detail"]
@@ -0,0 +1,85 @@
+import asyncio
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+def make_points(count):
+    return [{"ts": 1_000 * i, "value": float(np.sin(i / 7.0))} for i in range(count)]
+
+
+@pytest.mark.parametrize("mode", ["lttb", "minmax"])
+@pytest.mark.parametrize("max_points", [3, 4, 5, 7, 100])
+def test_downsample_hits_target_count(mode, max_points):
+    points = make_points(1_000)
+    reduced = app.downsample_points(points, max_points, mode)
+    assert len(reduced) == max_points
+    assert [p["ts"] for p in reduced] == sorted({p["ts"] for p in reduced})
+
+
+def test_minmax_flat_series_hits_target_count():
+    points = [{"ts": i, "value": 1.0} for i in range(50)]
+    assert len(app.downsample_points(points, 3, "minmax")) == 3
+
+
+def test_minmax_keeps_extremes():
+    points = make_points(1_000)
+    values = [p["value"] for p in points]
+    reduced = [p["value"] for p in app.downsample_points(points, 3, "minmax")]
+    assert min(values) in reduced
+    assert max(values) in reduced
+
+
+def test_fetch_limit_covers_whole_window_only_for_raw_downsampling():
+    assert app.downsample_fetch_limit(24, 500, None, None, None) == app.TELEMETRY_RAW_MAX_POINTS
+    assert app.downsample_fetch_limit(24, None, None, None, None) == 24
+    assert app.downsample_fetch_limit(24, 500, "AVG", 60_000, None) == 24
+    assert app.downsample_fetch_limit(24, 500, None, None, 123) == 24
+
+
+def test_truncated_flag():
+    result = {"deviceId": "d", "key": "t", "points": make_points(10)}
+    assert "truncated" not in app.downsample_telemetry(result, 3, "lttb", 11)
+    assert app.downsample_telemetry(result, 3, "lttb", 10)["truncated"] is True
+
+
+class PagedClient(app.ThingsBoardClient):
+    """Serves an in-memory series with ThingsBoard's limit/orderBy semantics."""
+
+    def __init__(self, series):
+        self.series = series
+        self.calls = 0
+
+    async def fetch_timeseries(self, device_id, keys, limit, hours, mapping, entity_type="DEVICE", agg="NONE",
+                               start_ts=None, end_ts=None, interval=None, order_by=None, columns=False):
+        self.calls += 1
+        result = {}
+        for key in keys.split(","):
+            points = [p for p in self.series[key] if start_ts <= p["ts"] < end_ts]
+            points = points[:limit] if order_by == "ASC" else points[-limit:]
+            result[key] = app.SeriesColumns.from_points(points) if columns else points
+        return result
+
+
+def test_fetch_window_pages_through_every_point(monkeypatch):
+    monkeypatch.setattr(app, "TELEMETRY_PAGE_POINTS", 100)
+    client = PagedClient({"a": make_points(1_050), "b": make_points(30)})
+    series = asyncio.run(client.fetch_window("dev", ["a", "b"], 0, 10**9, 10_000, {}))
+    assert [p["ts"] for p in series["a"]] == [p["ts"] for p in make_points(1_050)]
+    assert len(series["b"]) == 30
+    assert client.calls == 11
+
+
+def test_fetch_window_stops_at_max_points(monkeypatch):
+    monkeypatch.setattr(app, "TELEMETRY_PAGE_POINTS", 100)
+    client = PagedClient({"a": make_points(1_050)})
+    series = asyncio.run(client.fetch_window("dev", ["a"], 0, 10**9, 250, {}))
+    assert len(series["a"]) == 250
+    columns = asyncio.run(client.fetch_window("dev", ["a"], 0, 10**9, 250, {}, columns=True))
+    assert columns["a"].ts.tolist() == [p["ts"] for p in series["a"]]
@@ -0,0 +1,76 @@
+import gzip
+import os
+import sys
+
+import pytest
+from starlette.requests import Request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+def request_with(accept_encoding):
+    headers = [(b"accept-encoding", accept_encoding.encode())] if accept_encoding is not None else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("gzip, deflate, br", True),
+        ("GZIP", True),
+        ("gzip;q=0.5", True),
+        ("gzip;q=0", False),
+        ("gzip; q=0.0, br", False),
+        ("*", True),
+        ("*;q=0", False),
+        ("br, *;q=0", False),
+        ("gzip;q=1, *;q=0", True),
+        ("identity", False),
+        (None, False),
+    ],
+)
+def test_accepts_gzip_honours_q_values(header, expected):
+    assert app.accepts_gzip(request_with(header)) is expected
+
+
+def test_view_remaps_a_same_size_replacement(tmp_path):
+    store = app.ModelStore(1 << 20)
+    path = tmp_path / "model.ifc"
+    path.write_bytes(b"first")
+    assert bytes(store.view(path, path.stat())) == b"first"
+
+    replacement = tmp_path / "model.ifc.new"
+    replacement.write_bytes(b"other")
+    os.utime(replacement, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns))
+    os.replace(replacement, path)
+    assert bytes(store.view(path, path.stat())) == b"other"
+
+
+def test_view_reuses_an_unchanged_file(tmp_path):
+    store = app.ModelStore(1 << 20)
+    path = tmp_path / "model.ifc"
+    path.write_bytes(b"content")
+    assert store.view(path, path.stat()) is store.view(path, path.stat())
+
+
+def test_variant_is_not_served_for_a_replacement_with_an_older_mtime(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "MODEL_PRECOMPRESS", False)
+    store = app.ModelStore(1 << 20)
+    path = tmp_path / "model.ifc"
+    path.write_bytes(b"ISO-10303-21; first version")
+    first = store.asset(path)
+    store._compress(first, "gzip")
+    assert first.variant("gzip") is not None
+
+    # Like `cp -p` of an older file: new content, mtime before the existing sidecar.
+    path.write_bytes(b"ISO-10303-21; restored backup!")
+    os.utime(path, ns=(0, first.mtime_ns - 10**9))
+    second = store.asset(path)
+    assert second.sha256 != first.sha256
+    assert second.variant("gzip") is None
+
+    store._compress(second, "gzip")
+    assert second.variant("gzip") is not None
+    assert gzip.decompress(second.variant("gzip").read_bytes()) == b"ISO-10303-21; restored backup!"
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+from fastapi import HTTPException
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+def make_queue(journal_path="", max_pending=50_000):
+    return app.PublishQueue(True, journal_path, 10, 1, max_pending, 3, 1.0)
+
+
+def write(device_id, value, ts=1_000):
+    return ("DEVICE", device_id, [{"ts": ts, "values": {"pred": value}}], {})
+
+
+def journal_devices(path):
+    offset = 0
+    offset_path = path.with_name(path.name + ".offset")
+    if offset_path.exists():
+        offset = int(offset_path.read_text())
+    with path.open("rb") as handle:
+        handle.seek(offset)
+        return [json.loads(line)["deviceId"] for line in handle]
+
+
+def recording_publisher(published, failing=False):
+    async def publish(mapping, entity_type, device_id, telemetry, attributes):
+        published.append(device_id)
+        return ["upstream down"] if failing else []
+
+    return publish
+
+
+def test_acknowledged_writes_survive_a_crash(tmp_path, monkeypatch):
+    journal = tmp_path / "publish.jsonl"
+    queue = make_queue(str(journal))
+    asyncio.run(queue.enqueue([write("tb-1", 1.5), write("tb-2", 2.5)]))
+    # No close(): the process dies right after acknowledging.
+    assert journal_devices(journal) == ["tb-1", "tb-2"]
+
+    published = []
+    monkeypatch.setattr(app, "publish_entity", recording_publisher(published))
+    monkeypatch.setattr(app, "load_mapping_cached", lambda: {})
+    restarted = make_queue(str(journal))
+
+    async def drain():
+        await restarted._load()
+        return await restarted.flush()
+
+    assert asyncio.run(drain())
+    assert published == ["tb-1", "tb-2"]
+    assert not journal.exists()
+
+
+def test_shutdown_during_flush_keeps_the_inflight_batch(tmp_path, monkeypatch):
+    journal = tmp_path / "publish.jsonl"
+    queue = make_queue(str(journal))
+
+    async def scenario():
+        publishing = asyncio.Event()
+
+        async def stuck_publish(mapping, entity_type, device_id, telemetry, attributes):
+            publishing.set()
+            await asyncio.sleep(60)
+
+        monkeypatch.setattr(app, "publish_queue", queue)
+        monkeypatch.setattr(app, "publish_entity", stuck_publish)
+        monkeypatch.setattr(app, "load_mapping_cached", lambda: {})
+        monkeypatch.setattr(app, "MAPPING_WATCH_SEC", 0)
+        monkeypatch.setattr(app, "DEVICE_MAPPING_PATH", str(tmp_path / "missing.json"))
+
+        async with app.lifespan(app.app):
+            await queue.enqueue([("DEVICE", "tb-1", [{"ts": 1_000, "values": {"pred": 1.5}}], {"model": "v1"})])
+            await asyncio.wait_for(publishing.wait(), timeout=5)
+
+    asyncio.run(scenario())
+    records = [json.loads(line) for line in journal.read_text().splitlines()]
+    assert [(r["entityType"], r["deviceId"]) for r in records] == [("DEVICE", "tb-1")]
+    assert records[0]["telemetry"] == [{"ts": 1_000, "values": {"pred": 1.5}}]
+    assert records[0]["attributes"] == {"model": "v1"}
+
+
+def test_full_queue_without_journal_pushes_back():
+    queue = make_queue(max_pending=3)
+    queue.reserve(2)
+    asyncio.run(queue.enqueue([("DEVICE", "tb-1", [{"ts": 1, "values": {"a": 1}}, {"ts": 2, "values": {"a": 2}}], {})]))
+    with pytest.raises(HTTPException) as raised:
+        queue.reserve(2)
+    assert raised.value.status_code == 429
+    queue.reserve(1)
+
+
+def test_journaled_queue_never_pushes_back(tmp_path):
+    queue = make_queue(str(tmp_path / "publish.jsonl"), max_pending=1)
+    queue.reserve(100)
+
+
+def test_load_takes_only_what_fits_and_commits_after_a_successful_flush(tmp_path, monkeypatch):
+    journal = tmp_path / "publish.jsonl"
+    queue = make_queue(str(journal), max_pending=8)
+    monkeypatch.setattr(app, "load_mapping_cached", lambda: {})
+    published = []
+
+    async def scenario():
+        await queue.enqueue([write(f"tb-{index}", index) for index in range(10)])
+        await queue._load()
+        assert queue._pending_points == 4
+
+        monkeypatch.setattr(app, "publish_entity", recording_publisher(published, failing=True))
+        assert not await queue.flush()
+        # The unconfirmed head is neither committed nor loaded twice.
+        await queue._load()
+        assert queue._pending_points == 4
+        assert journal_devices(journal) == [f"tb-{index}" for index in range(10)]
+
+        monkeypatch.setattr(app, "publish_entity", recording_publisher(published))
+        published.clear()
+        assert await queue.flush()
+        assert published == ["tb-0", "tb-1", "tb-2", "tb-3"]
+        assert journal_devices(journal) == [f"tb-{index}" for index in range(4, 10)]
+
+        # Writes acknowledged meanwhile follow the older ones.
+        await queue.enqueue([write("tb-new", 1)])
+        while journal.exists():
+            await queue._load()
+            assert await queue.flush()
+
+    asyncio.run(scenario())
+    assert published[4:] == [f"tb-{index}" for index in range(4, 10)] + ["tb-new"]
+
+
+def test_torn_record_is_skipped_without_losing_the_next(tmp_path):
+    journal_path = tmp_path / "publish.jsonl"
+    journal_path.write_text(json.dumps({"entityType": "DEVICE", "deviceId": "tb-0"}) + "\n" + '{"entityTy')
+    journal = app.PublishJournal(journal_path)
+    journal.append([{"entityType": "DEVICE", "deviceId": "tb-1", "telemetry": [], "attributes": {"a": 1}}])
+    records, offset = journal.read(None)
+    assert [record["deviceId"] for record in records] == ["tb-0", "tb-1"]
+    journal.commit(offset)
+    assert not journal_path.exists()
+
+
+def test_compaction_keeps_unpublished_records(tmp_path, monkeypatch):
+    monkeypatch.setattr(app.PublishJournal, "COMPACT_BYTES", 10)
+    journal_path = tmp_path / "publish.jsonl"
+    journal = app.PublishJournal(journal_path)
+    journal.append([{"entityType": "DEVICE", "deviceId": f"tb-{index}"} for index in range(4)])
+    offset = len(json.dumps({"entityType": "DEVICE", "deviceId": "tb-0"}, separators=(",", ":"))) * 3 + 3
+    journal.commit(offset)
+    assert not journal.offset_path.exists()
+    assert journal_devices(journal_path) == ["tb-3"]
+
+
+def test_startup_recovers_a_leftover_replay_file(tmp_path):
+    journal_path = tmp_path / "publish.jsonl"
+    leftover = tmp_path / "publish.jsonl.replay"
+    leftover.write_text("".join(json.dumps({"entityType": "DEVICE", "deviceId": f"old-{i}"}) + "\n" for i in range(2)))
+    journal_path.write_text(json.dumps({"entityType": "DEVICE", "deviceId": "new"}) + "\n")
+    app.PublishJournal(journal_path).recover()
+    assert not leftover.exists()
+    assert journal_devices(journal_path) == ["old-0", "old-1", "new"]
+
+
+def test_untimestamped_values_are_left_for_thingsboard_to_stamp(monkeypatch):
+    queue = make_queue()
+    sent = []
+
+    async def publish(mapping, entity_type, device_id, telemetry, attributes):
+        sent.append(telemetry)
+        return []
+
+    monkeypatch.setattr(app, "publish_entity", publish)
+    monkeypatch.setattr(app, "load_mapping_cached", lambda: {})
+    telemetry = app.telemetry_entries([{"a": 1}, {"ts": 5, "values": {"b": 2}}, {"c": 3}])
+    assert telemetry == [{"a": 1}, {"ts": 5, "values": {"b": 2}}, {"c": 3}]
+
+    async def scenario():
+        await queue.enqueue([("DEVICE", "tb-1", telemetry, {})])
+        return await queue.flush()
+
+    assert asyncio.run(scenario())
+    assert sent == [[{"a": 1, "c": 3}, {"ts": 5, "values": {"b": 2}}]]
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import os
+import sys
+
+from websockets.asyncio.server import serve
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+MAPPING = {
+    "devices": {
+        "sensor-1": {"type": "temperature", "connector": {"type": "thingsboard", "deviceId": "tb-1"}},
+        "sensor-2": {"type": "humidity", "connector": {"type": "thingsboard", "deviceId": "tb-2"}},
+    }
+}
+
+
+class FakeThingsboardSocket:
+    """Answers subscriptions with one update; drops the first connection after it."""
+
+    def __init__(self):
+        self.connections = 0
+        self.subscriptions = []
+        self.headers = []
+        self.dropped = asyncio.Event()
+        self.resubscribed = asyncio.Event()
+
+    async def handler(self, ws):
+        self.connections += 1
+        connection = self.connections
+        self.headers.append(ws.request.headers.get("X-Authorization"))
+        subscribed = []
+        async for raw in ws:
+            for cmd in json.loads(raw).get("cmds", []):
+                subscribed.append(cmd["entityId"])
+                ts = 1_000 * connection
+                await ws.send(json.dumps({
+                    "subscriptionId": cmd["cmdId"],
+                    "data": {"temperature": [[ts, str(20 + connection)]]},
+                }))
+            if len(subscribed) == len(MAPPING["devices"]):
+                self.subscriptions.append(sorted(subscribed))
+                if connection == 1:
+                    await asyncio.sleep(0.3)
+                    self.dropped.set()
+                    return
+                self.resubscribed.set()
+
+
+def test_subscribe_reconnect_and_polling_fallback(monkeypatch):
+    polled = []
+
+    async def fake_build_telemetry(mapping, device_id, key, limit, hours, *args, since_ts=None, **kwargs):
+        polled.append(device_id)
+        return {"deviceId": device_id, "key": "temperature", "points": [], "cursor": since_ts}
+
+    async def fake_auth_header(mapping):
+        return {"X-Authorization": "ApiKey test-key"}
+
+    async def scenario():
+        fake = FakeThingsboardSocket()
+        stream = app.ThingsBoardStream()
+        hub = app.TelemetryHub(50, 10)
+        async with serve(fake.handler, "127.0.0.1", 0) as server:
+            port = server.sockets[0].getsockname()[1]
+            monkeypatch.setattr(app, "TB_WS_URL", f"ws://127.0.0.1:{port}")
+            monkeypatch.setattr(app, "_mapping_index", app.MappingIndex(MAPPING, 1))
+            monkeypatch.setattr(app, "tb_stream", stream)
+            monkeypatch.setattr(app, "telemetry_hub", hub)
+            monkeypatch.setattr(app, "build_telemetry", fake_build_telemetry)
+            monkeypatch.setattr(app.tb_client, "_get_auth_header", fake_auth_header)
+
+            queue = hub.subscribe("sensor-1", None)
+            task = asyncio.create_task(stream.run())
+            try:
+                # Subscribe: every mapped device gets a LATEST_TELEMETRY subscription and
+                # its updates reach the hub while the pollers stand down.
+                message = await asyncio.wait_for(queue.get(), timeout=5)
+                assert message["event"] == "telemetry"
+                assert message["data"]["points"] == [{"ts": 1000, "value": 21.0}]
+                assert stream.covers("sensor-1")
+                polled.clear()
+                await asyncio.sleep(0.2)
+                assert polled == []
+
+                # Drop: the hub falls back to polling until the socket is back.
+                await asyncio.wait_for(fake.dropped.wait(), timeout=5)
+                await asyncio.sleep(0.3)
+                assert not stream.connected
+                assert not stream.covers("sensor-1")
+                assert "sensor-1" in polled
+
+                # Reconnect: subscriptions are replayed on the new socket.
+                await asyncio.wait_for(fake.resubscribed.wait(), timeout=5)
+                assert fake.connections == 2
+                assert fake.subscriptions == [["tb-1", "tb-2"], ["tb-1", "tb-2"]]
+                assert fake.headers == ["ApiKey test-key", "ApiKey test-key"]
+                assert stream.reconnects == 1
+                while stream.latest_for("tb-1")["temperature"]["ts"] != 2000:
+                    await asyncio.sleep(0.05)
+                assert stream.latest_for("tb-2")["temperature"] == {"ts": 2000, "value": 22.0}
+                assert stream.covers("sensor-1")
+            finally:
+                task.cancel()
+                hub.unsubscribe("sensor-1", None, queue)
+                await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(scenario())
@@ -0,0 +1,115 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+MINUTE_MS = 60_000
+MAPPING = {
+    "devices": {
+        "dev": {"type": "t", "connector": {"type": "thingsboard", "deviceId": "tb-1", "telemetryKey": "a"}},
+        "multi": {"type": "t", "connector": {"type": "thingsboard", "deviceId": "tb-1", "telemetryKey": "a,b"}},
+    }
+}
+
+
+class FakeThingsBoard:
+    """In-memory series with ThingsBoard's startTs/endTs/limit/orderBy semantics."""
+
+    def __init__(self, series):
+        self.series = series
+        self.calls = 0
+
+    async def fetch_timeseries(self, device_id, keys, limit, hours, mapping, entity_type="DEVICE", agg="NONE",
+                               start_ts=None, end_ts=None, interval=None, order_by=None, columns=False):
+        self.calls += 1
+        result = {}
+        for key in keys.split(","):
+            points = [p for p in self.series.get(key, []) if start_ts <= p["ts"] <= end_ts]
+            result[key] = points[:limit] if order_by == "ASC" else points[-limit:]
+        return result
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    start = int(time.time() * 1000) - 3 * 24 * 3_600_000
+    series = {
+        "a": [{"ts": start + i * MINUTE_MS, "value": float(i)} for i in range(2_880)],
+        "b": [{"ts": start + i * 7 * MINUTE_MS, "value": float(i)} for i in range(300)],
+    }
+    fake = FakeThingsBoard(series)
+    monkeypatch.setattr(app.tb_client, "fetch_timeseries", fake.fetch_timeseries)
+    monkeypatch.setattr(app, "recent_buffer", app.RecentPointsBuffer(1_000, 100, 0))
+    return fake
+
+
+def poll_until_done(device_id, since_ts, limit):
+    async def pages():
+        collected = []
+        cursor = since_ts
+        while True:
+            page = await app.build_telemetry(MAPPING, device_id, None, limit, 24, since_ts=cursor)
+            collected.append(page)
+            assert page["cursor"] >= cursor
+            cursor = page["cursor"]
+            if not page["hasMore"]:
+                return collected
+
+    return asyncio.run(pages())
+
+
+def test_since_ts_pages_forward_through_the_whole_backlog(upstream):
+    pages = poll_until_done("dev", 0, 1_000)
+    assert [len(page["points"]) for page in pages] == [1_000, 1_000, 880]
+    ts = [p["ts"] for page in pages for p in page["points"]]
+    assert ts == [p["ts"] for p in upstream.series["a"]]
+    assert pages[-1]["cursor"] == ts[-1]
+
+
+def test_multi_key_pages_are_cut_at_one_ts(upstream):
+    pages = poll_until_done("multi", 0, 400)
+    for page in pages[:-1]:
+        newest = [points[-1]["ts"] for points in page["series"].values() if points]
+        assert page["cursor"] == max(newest)
+        assert all(p["ts"] <= page["cursor"] for points in page["series"].values() for p in points)
+    for key in ("a", "b"):
+        ts = [p["ts"] for page in pages for p in page["series"][key]]
+        assert ts == [p["ts"] for p in upstream.series[key]]
+
+
+def test_caught_up_cursor_returns_new_points_only(upstream):
+    cursor = poll_until_done("dev", 0, 1_000)[-1]["cursor"]
+    empty = asyncio.run(app.build_telemetry(MAPPING, "dev", None, 1_000, 24, since_ts=cursor))
+    assert empty["points"] == []
+    assert empty["cursor"] == cursor
+    assert empty["hasMore"] is False
+
+    # A live point, written after the buffer's last sync.
+    time.sleep(0.002)
+    live_ts = int(time.time() * 1000)
+    upstream.series["a"].append({"ts": live_ts, "value": 1.0})
+    time.sleep(0.002)
+    fresh = asyncio.run(app.build_telemetry(MAPPING, "dev", None, 1_000, 24, since_ts=cursor))
+    assert [p["ts"] for p in fresh["points"]] == [live_ts]
+    assert fresh["cursor"] == live_ts
+
+
+def test_window_ending_in_the_future_does_not_hide_later_points(upstream, monkeypatch):
+    monkeypatch.setattr(app, "recent_buffer", app.RecentPointsBuffer(1_000, 100, 50))
+    now = int(time.time() * 1000)
+    window = asyncio.run(
+        app.build_telemetry(MAPPING, "dev", None, 1_000, 24, start_ts=now - 3_600_000, end_ts=now + 3_600_000)
+    )
+    cursor = window["points"][-1]["ts"] if window["points"] else now - 3_600_000
+    time.sleep(0.002)
+    live_ts = int(time.time() * 1000)
+    upstream.series["a"].append({"ts": live_ts, "value": 1.0})
+    # Past the buffer's refresh period: the next poll must sync again.
+    time.sleep(0.06)
+    delta = asyncio.run(app.build_telemetry(MAPPING, "dev", None, 1_000, 24, since_ts=cursor))
+    assert [p["ts"] for p in delta["points"]] == [live_ts]
@@ -0,0 +1,70 @@
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+RAW = [
+    {"ts": 3_000, "value": "21.5"},
+    {"ts": 1_000, "value": "20"},
+    {"ts": 2_000, "value": "open"},
+    {"ts": 4_000, "value": None},
+]
+
+
+def test_parse_tb_columns_matches_point_parsing():
+    columns = app.parse_tb_columns(RAW)
+    points = app.parse_tb_points(RAW)
+    assert columns.ts.tolist() == [p["ts"] for p in points]
+    expected = [app.numeric_value(p["value"]) for p in points]
+    np.testing.assert_array_equal(columns.value, np.array(expected))
+
+
+def test_binary_is_identical_from_columns_and_points():
+    points = {"deviceId": "d", "key": "t", "points": app.parse_tb_points(RAW)}
+    columns = {"deviceId": "d", "key": "t", "points": app.parse_tb_columns(RAW)}
+    assert app.binary_telemetry(columns) == app.binary_telemetry(points)
+
+
+@pytest.mark.parametrize("mode", ["lttb", "minmax"])
+def test_downsampling_columns_matches_points(mode):
+    raw = [{"ts": 60_000 * i, "value": str(np.sin(i / 9.0))} for i in range(2_000)]
+    reduced_points = app.downsample_points(app.parse_tb_points(raw), 50, mode)
+    reduced_columns = app.downsample_points(app.parse_tb_columns(raw), 50, mode)
+    assert reduced_columns.ts.tolist() == [p["ts"] for p in reduced_points]
+    assert reduced_columns.value.tolist() == [p["value"] for p in reduced_points]
+
+
+def test_parse_tb_points_keeps_non_numeric_values():
+    assert app.parse_tb_points(RAW) == [
+        {"ts": 1_000, "value": 20.0},
+        {"ts": 2_000, "value": "open"},
+        {"ts": 3_000, "value": 21.5},
+        {"ts": 4_000, "value": None},
+    ]
+
+
+def test_columnar_is_identical_from_columns_and_points():
+    points = {"deviceId": "d", "series": {"t": app.parse_tb_points(RAW), "n": app.parse_tb_points(RAW[:2])}}
+    columns = {"deviceId": "d", "series": {"t": app.parse_tb_columns(RAW), "n": app.parse_tb_columns(RAW[:2])}}
+    assert app.columnar_telemetry(columns) == app.columnar_telemetry(points)
+    assert app.columnar_telemetry(columns)["series"]["n"] == {"ts": [1_000, 3_000], "value": [20.0, 21.5]}
+
+
+def test_columnar_is_rendered_without_the_response_encoder():
+    result = {"deviceId": "d", "key": "t", "points": app.parse_tb_columns(RAW)}
+    response = app.encode_telemetry(result, "columnar")
+    assert isinstance(response, app.Response)
+    assert response.media_type == "application/json"
+    assert json.loads(response.body) == {
+        "deviceId": "d",
+        "key": "t",
+        "format": "columnar",
+        "ts": [1_000, 2_000, 3_000, 4_000],
+        "value": [20.0, "open", 21.5, None],
+    }
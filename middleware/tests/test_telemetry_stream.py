@@ -0,0 +1,45 @@
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+class ConnectedRequest:
+    async def is_disconnected(self):
+        return False
+
+
+def test_stream_does_not_repeat_backlog_points(monkeypatch):
+    series = [{"ts": ts, "value": float(ts)} for ts in (1_000, 2_000, 3_000)]
+
+    async def fake_build_telemetry(mapping, device_id, key, limit, hours, *args, since_ts=None, **kwargs):
+        fresh = [p for p in series if p["ts"] > since_ts]
+        page = fresh[:2]
+        cursor = page[-1]["ts"] if page else since_ts
+        return {"deviceId": device_id, "key": "t", "points": page, "cursor": cursor, "hasMore": len(fresh) > 2}
+
+    monkeypatch.setattr(app, "build_telemetry", fake_build_telemetry)
+    monkeypatch.setattr(app, "load_mapping_cached", lambda: {"devices": {"dev": {"type": "t"}}})
+    monkeypatch.setattr(app, "telemetry_hub", app.TelemetryHub(10, 100))
+
+    async def scenario():
+        # An older subscriber keeps the shared poller's cursor behind the new client's backlog.
+        earlier = app.telemetry_hub.subscribe("dev", None)
+        app.telemetry_hub._topics[("dev", None)]["cursor"] = 0
+        response = await app.device_telemetry_stream(ConnectedRequest(), "dev", None, 0)
+        stream = response.body_iterator
+        frames = [await stream.__anext__(), await stream.__anext__()]
+        await asyncio.sleep(0.05)
+        series.append({"ts": 4_000, "value": 4.0})
+        frames.append(await asyncio.wait_for(stream.__anext__(), timeout=5))
+        await stream.aclose()
+        app.telemetry_hub.unsubscribe("dev", None, earlier)
+        return frames
+
+    frames = asyncio.run(scenario())
+    sent = [json.loads(frame.split("data: ", 1)[1]) for frame in frames]
+    assert [[p["ts"] for p in data["points"]] for data in sent] == [[1_000, 2_000], [3_000], [4_000]]
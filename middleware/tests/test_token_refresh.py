@@ -0,0 +1,66 @@
+import asyncio
+import os
+import sys
+import types
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+class StopLoop(Exception):
+    pass
+
+
+def run_refresh(monkeypatch, handler, iterations):
+    client = app.ThingsBoardClient()
+    client._http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    index = types.SimpleNamespace(mapping={})
+    monkeypatch.setattr(app, "current_mapping_index", lambda: index)
+    monkeypatch.setattr(app, "TB_BASE_URL", "http://tb")
+    monkeypatch.setattr(app, "TB_API_KEY", None)
+    monkeypatch.setattr(app, "TB_USERNAME", "user")
+    monkeypatch.setattr(app, "TB_PASSWORD", "secret")
+    monkeypatch.setattr(app, "tb_circuit", app.CircuitBreaker(failure_threshold=0, reset_sec=30, probes=1))
+    delays = []
+
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(delay):
+        delays.append(delay)
+        if len(delays) >= iterations:
+            raise StopLoop()
+
+    async def drive():
+        asyncio.sleep = fake_sleep
+        try:
+            await client.refresh_loop()
+        except StopLoop:
+            pass
+        finally:
+            asyncio.sleep = real_sleep
+            await client._http.aclose()
+
+    asyncio.run(drive())
+    return client, delays
+
+
+def test_token_without_exp_uses_fallback_ttl(monkeypatch):
+    def handler(request):
+        return httpx.Response(200, json={"token": "opaque-token"})
+
+    client, delays = run_refresh(monkeypatch, handler, 3)
+    assert client.logins == 1
+    assert all(delay >= app.TB_TOKEN_FALLBACK_TTL_SEC - 1 for delay in delays)
+    assert client._valid_token(("http://tb", "user"), 60) == "opaque-token"
+
+
+def test_failed_logins_back_off(monkeypatch):
+    def handler(request):
+        return httpx.Response(401)
+
+    client, delays = run_refresh(monkeypatch, handler, 7)
+    assert delays == [10.0, 20.0, 40.0, 80.0, 160.0, app.TB_TOKEN_RETRY_MAX_SEC, app.TB_TOKEN_RETRY_MAX_SEC]
+    assert client.refresh_error == "ThingsBoard login failed."
@@ -49,12 +49,7 @@ def _linear_regression(points):
 def _iso(ts_ms):
     return datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc).isoformat()
 
-def main():
-    try:
-        payload = json.load(sys.stdin)
-    except Exception:
-        return
-
+def _predict(payload):
     telemetry = payload.get("telemetry") or {}
     points = _filter_points(_get_points(telemetry))
 
@@ -70,8 +65,7 @@ def main():
             "telemetry": {"rh_threshold": threshold},
             "attributes": {"drying_status": "insufficient_data"},
         }
-        print(json.dumps(output))
-        return
+        return output
 
     points = points[-max_points:]
     last = points[-1]
@@ -92,8 +86,7 @@ def main():
                 "drying_eta_iso": _iso(last["ts"]),
             },
         }
-        print(json.dumps(output))
-        return
+        return output
 
     reg = _linear_regression(points)
     if not reg:
@@ -105,8 +98,7 @@ def main():
             },
             "attributes": {"drying_status": "insufficient_data"},
         }
-        print(json.dumps(output))
-        return
+        return output
 
     slope, _ = reg  # RH per ms
     slope_per_hour = slope * 3600 * 1000
@@ -121,8 +113,7 @@ def main():
             },
             "attributes": {"drying_status": "not_drying"},
         }
-        print(json.dumps(output))
-        return
+        return output
 
     time_to_threshold_ms = (threshold - current_rh) / slope
     eta_ts = int(last["ts"] + time_to_threshold_ms)
@@ -142,7 +133,22 @@ def main():
             "drying_eta_iso": _iso(eta_ts),
         },
     }
-    print(json.dumps(output))
+    return output
+
+def main():
+    try:
+        payload = json.load(sys.stdin)
+    except Exception:
+        return
+
+    # Batched contract: {"batch": [per-device payloads]} -> {"items": [outputs]}
+    batch = payload.get("batch")
+    if isinstance(batch, list):
+        items = [_predict(item) for item in batch if isinstance(item, dict)]
+        print(json.dumps({"items": items}))
+        return
+
+    print(json.dumps(_predict(payload)))
 
 if __name__ == "__main__":
     main()
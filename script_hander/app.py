@@ -1,13 +1,17 @@
 import hashlib
 import json
+import logging
 import os
+import queue
 import subprocess
 import threading
 import uuid
 import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from http.server import BaseHTTPRequestHandler, HTTPServer
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 
 import httpx
 
@@ -17,6 +21,55 @@ CACHE_DIR = Path(os.getenv("PREDICTOR_CACHE_DIR", "/app/cache"))
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
 HEALTH_PORT = int(os.getenv("SCRIPT_HANDLER_PORT", "8100"))
 MODE = os.getenv("SCRIPT_HANDLER_MODE", "server").strip().lower()
+# Must not exceed the middleware's TELEMETRY_BATCH_MAX_ITEMS, or POST /telemetry/batch answers 413.
+TELEMETRY_BATCH_MAX_ITEMS = max(1, int(os.getenv("TELEMETRY_BATCH_MAX_ITEMS", "500")))
+PREDICTOR_CONCURRENCY = max(1, int(os.getenv("PREDICTOR_CONCURRENCY", str(os.cpu_count() or 1))))
+SCRIPT_WORKERS_ENABLED = os.getenv("SCRIPT_WORKERS_ENABLED", "1").strip().lower() in {"1", "true", "yes"}
+SCRIPT_WORKER_MAX_CALLS = int(os.getenv("SCRIPT_WORKER_MAX_CALLS", "1000"))
+SCRIPT_WORKER_POOL_SIZE = int(os.getenv("SCRIPT_WORKER_POOL_SIZE", str(PREDICTOR_CONCURRENCY)))
+SCRIPT_WORKER_IDLE_SEC = int(os.getenv("SCRIPT_WORKER_IDLE_SEC", "600"))
+PREDICTOR_BATCH_SIZE = int(os.getenv("PREDICTOR_BATCH_SIZE", "100"))
+
+# Runs a predictor script repeatedly in one interpreter. The script is compiled once; each
+# NDJSON request line {"payload": ...} on stdin executes it as __main__ with the payload as
+# its stdin, and one response line {"ok", "stdout", "stderr"[, "error"]} is written back on
+# the pipe whose fd is argv[2], which neither the script nor native code writing to fd 1 can reach.
+WORKER_BOOTSTRAP = r"""
+import io, json, os, sys, traceback
+path = sys.argv[1]
+channel_out = os.fdopen(int(sys.argv[2]), "w", encoding="utf-8")
+sys.argv = [path]
+sys.path[0] = os.path.dirname(os.path.abspath(path))
+with open(path, "r", encoding="utf-8") as handle:
+    code = compile(handle.read(), path, "exec")
+channel_in, real_stdout, real_stderr = sys.stdin, sys.stdout, sys.stderr
+for line in channel_in:
+    request = json.loads(line)
+    # Text streams over bytes, so scripts may use sys.stdin.buffer / sys.stdout.buffer as usual.
+    payload = json.dumps(request.get("payload")).encode("utf-8")
+    stdout, stderr = io.BytesIO(), io.BytesIO()
+    sys.stdin = io.TextIOWrapper(io.BytesIO(payload), encoding="utf-8")
+    sys.stdout = io.TextIOWrapper(stdout, encoding="utf-8", write_through=True)
+    sys.stderr = io.TextIOWrapper(stderr, encoding="utf-8", write_through=True)
+    response = {"ok": True}
+    try:
+        exec(code, {"__name__": "__main__", "__file__": path, "__builtins__": __builtins__})
+    except SystemExit as exc:
+        if exc.code not in (None, 0):
+            response = {"ok": False, "error": f"exit status {exc.code}"}
+    except Exception:
+        response = {"ok": False, "error": traceback.format_exc()}
+    for stream in (sys.stdout, sys.stderr):
+        try:
+            stream.flush()
+        except ValueError:
+            pass
+    response["stdout"] = stdout.getvalue().decode("utf-8", "replace")
+    response["stderr"] = stderr.getvalue()[-4000:].decode("utf-8", "replace")
+    sys.stdin, sys.stdout, sys.stderr = channel_in, real_stdout, real_stderr
+    channel_out.write(json.dumps(response) + "\n")
+    channel_out.flush()
+"""
 
 START_TS = int(time.time() * 1000)
 STATUS: Dict[str, Any] = {
@@ -34,7 +87,11 @@ RUN_LOCK = threading.Lock()
 JOBS_LOCK = threading.Lock()
 JOBS: Dict[str, Dict[str, Any]] = {}
 CANCEL_EVENT = threading.Event()
-RUN_PROC: Optional[subprocess.Popen[bytes]] = None
+LOGGER = logging.getLogger("script_handler")
+PROCS_LOCK = threading.Lock()
+RUNNING_PROCS: Set[subprocess.Popen] = set()
+WORKERS_LOCK = threading.Lock()
+IDLE_WORKERS: Dict[str, List["ScriptWorker"]] = {}
 CURRENT_JOB_ID: Optional[str] = None
 
 
@@ -71,11 +128,15 @@ def request_kill(job_id: Optional[str] = None) -> Dict[str, Any]:
     CANCEL_EVENT.set()
     if job_id:
         update_job(job_id, status="canceled", finished_ts=now_ms(), result={"status": "canceled"})
-    if RUN_PROC and RUN_PROC.poll() is None:
+    with PROCS_LOCK:
+        running = [proc for proc in RUNNING_PROCS if proc.poll() is None]
+    for proc in running:
         try:
-            RUN_PROC.terminate()
+            proc.terminate()
         except Exception:
             pass
+    # A cycle between two script runs (e.g. fetching telemetry) sees the event on its next step.
+    if running or RUN_LOCK.locked():
         return {"status": "killing"}
     CANCEL_EVENT.clear()
     return {"status": "idle"}
@@ -92,7 +153,7 @@ class HealthHandler(BaseHTTPRequestHandler):
             self._send_json(200, payload)
             return
         if self.path == "/status":
-            payload = {**STATUS, "uptime_ms": now_ms() - START_TS, "mode": MODE}
+            payload = {**STATUS, "uptime_ms": now_ms() - START_TS, "mode": MODE, "workers": worker_stats()}
             self._send_json(200, payload)
             return
         if self.path.startswith("/jobs/"):
@@ -245,6 +306,49 @@ def fetch_device_telemetry(device_id: str, key: Optional[str], limit: int, hours
     return response.json()
 
 
+def fetch_devices_telemetry(
+    device_keys: Dict[str, Optional[str]],
+    limit: int,
+    hours: int,
+) -> Dict[str, Dict[str, Any]]:
+    """Telemetry of many devices through POST /telemetry/batch, in chunks the middleware accepts.
+
+    Every device gets an entry; like `fetch_device_telemetry`, a failed chunk or item gives `{}`.
+    """
+    if not device_keys:
+        return {}
+    url = f"{MIDDLEWARE_URL}/telemetry/batch"
+    device_ids = list(device_keys)
+    combined: Dict[str, Dict[str, Any]] = {device_id: {} for device_id in device_ids}
+    with httpx.Client(timeout=30) as client:
+        for start in range(0, len(device_ids), TELEMETRY_BATCH_MAX_ITEMS):
+            chunk = device_ids[start : start + TELEMETRY_BATCH_MAX_ITEMS]
+            items: List[Dict[str, Any]] = []
+            for device_id in chunk:
+                item: Dict[str, Any] = {"deviceId": device_id, "limit": limit, "hours": hours}
+                key = device_keys[device_id]
+                if key:
+                    item["keys"] = key
+                items.append(item)
+            response = client.post(url, json={"items": items})
+            if response.status_code != 200:
+                LOGGER.warning(
+                    "Telemetry batch of %d devices failed (%s): %s",
+                    len(chunk),
+                    response.status_code,
+                    response.text[:200],
+                )
+                continue
+            results = response.json().get("items") or []
+            for device_id, result in zip(chunk, results):
+                if not isinstance(result, dict) or result.get("status") != "ok":
+                    detail = result.get("detail") if isinstance(result, dict) else "invalid item"
+                    LOGGER.warning("Telemetry of %s unavailable: %s", device_id, detail)
+                    continue
+                combined[device_id] = {k: v for k, v in result.items() if k != "status"}
+    return combined
+
+
 def post_predictions(items: List[Dict[str, Any]]) -> bool:
     if not items:
         return True
@@ -255,43 +359,225 @@ def post_predictions(items: List[Dict[str, Any]]) -> bool:
     return response.status_code == 200
 
 
-def run_script(script_path: Path, payload: Dict[str, Any], timeout_sec: int) -> Optional[Dict[str, Any]]:
-    global RUN_PROC
+def track_proc(proc: subprocess.Popen, running: bool) -> None:
+    with PROCS_LOCK:
+        if running:
+            RUNNING_PROCS.add(proc)
+        else:
+            RUNNING_PROCS.discard(proc)
+
+
+def script_version(script_path: Path) -> str:
+    try:
+        stat = script_path.stat()
+    except OSError:
+        return ""
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+class ScriptWorker:
+    """Long-lived interpreter running one cached script per request (see WORKER_BOOTSTRAP)."""
+
+    def __init__(self, script_path: Path) -> None:
+        self.script_path = script_path
+        self.version = script_version(script_path)
+        self.calls = 0
+        self.closed = False
+        self.idle_since = time.time()
+        read_fd, write_fd = os.pipe()
+        try:
+            self.proc = subprocess.Popen(
+                ["python", "-c", WORKER_BOOTSTRAP, str(script_path), str(write_fd)],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                pass_fds=(write_fd,),
+            )
+        except BaseException:
+            os.close(read_fd)
+            raise
+        finally:
+            os.close(write_fd)
+        self.channel = os.fdopen(read_fd, "rb")
+        self.responses: "queue.Queue[Optional[bytes]]" = queue.Queue()
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self) -> None:
+        with self.channel:
+            for line in self.channel:
+                self.responses.put(line)
+        self.closed = True
+        self.responses.put(None)
+
+    def alive(self) -> bool:
+        return not self.closed and self.proc.poll() is None
+
+    def stop(self) -> None:
+        try:
+            self.proc.terminate()
+            self.proc.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+        except Exception:
+            pass
+
+    def call(self, payload: Dict[str, Any], timeout_sec: int) -> Optional[Dict[str, Any]]:
+        self.calls += 1
+        track_proc(self.proc, True)
+        try:
+            try:
+                if self.proc.stdin:
+                    self.proc.stdin.write(json.dumps({"payload": payload}).encode("utf-8") + b"\n")
+                    self.proc.stdin.flush()
+            except OSError:
+                return None
+            start = time.time()
+            while True:
+                if CANCEL_EVENT.is_set():
+                    self.stop()
+                    raise RuntimeError("killed")
+                try:
+                    line = self.responses.get(timeout=0.2)
+                except queue.Empty:
+                    if (time.time() - start) > timeout_sec:
+                        self.stop()
+                        raise RuntimeError("timeout")
+                    continue
+                if line is None:
+                    # The worker died mid-call: killed, or the script crashed the interpreter.
+                    if CANCEL_EVENT.is_set():
+                        raise RuntimeError("killed")
+                    return None
+                try:
+                    response = json.loads(line.decode("utf-8"))
+                    if not isinstance(response, dict):
+                        raise ValueError("response is not an object")
+                except ValueError as exc:
+                    # Out of step with the worker: never hand it another payload.
+                    LOGGER.warning("Dropping worker for %s: bad response (%s)", self.script_path.name, exc)
+                    self.closed = True
+                    self.stop()
+                    return None
+                if not response.get("ok"):
+                    LOGGER.warning(
+                        "Script %s failed: %s\n%s",
+                        self.script_path.name,
+                        (response.get("error") or "").strip(),
+                        (response.get("stderr") or "").strip(),
+                    )
+                    return None
+                return json.loads(response.get("stdout") or "")
+        finally:
+            track_proc(self.proc, False)
+
+
+def acquire_worker(script_path: Path) -> ScriptWorker:
+    version = script_version(script_path)
+    stale: List[ScriptWorker] = []
+    worker = None
+    with WORKERS_LOCK:
+        idle = IDLE_WORKERS.get(str(script_path), [])
+        while idle:
+            candidate = idle.pop()
+            if candidate.alive() and candidate.version == version:
+                worker = candidate
+                break
+            stale.append(candidate)
+    for candidate in stale:
+        candidate.stop()
+    return worker or ScriptWorker(script_path)
+
+
+def release_worker(worker: ScriptWorker) -> None:
+    keep = (
+        worker.alive()
+        and worker.calls < SCRIPT_WORKER_MAX_CALLS
+        and worker.version == script_version(worker.script_path)
+    )
+    if keep:
+        worker.idle_since = time.time()
+        with WORKERS_LOCK:
+            idle = IDLE_WORKERS.setdefault(str(worker.script_path), [])
+            if len(idle) < SCRIPT_WORKER_POOL_SIZE:
+                idle.append(worker)
+                return
+    worker.stop()
+
+
+def prune_workers() -> None:
+    """Stop workers left idle for more than SCRIPT_WORKER_IDLE_SEC (e.g. removed scripts)."""
+    cutoff = time.time() - SCRIPT_WORKER_IDLE_SEC
+    expired: List[ScriptWorker] = []
+    with WORKERS_LOCK:
+        for path, idle in list(IDLE_WORKERS.items()):
+            expired.extend(worker for worker in idle if worker.idle_since < cutoff)
+            idle[:] = [worker for worker in idle if worker.idle_since >= cutoff]
+            if not idle:
+                del IDLE_WORKERS[path]
+    for worker in expired:
+        worker.stop()
+
+
+def worker_stats() -> Dict[str, Any]:
+    with WORKERS_LOCK:
+        idle = {Path(path).name: len(workers) for path, workers in IDLE_WORKERS.items()}
+    with PROCS_LOCK:
+        running = len(RUNNING_PROCS)
+    return {"enabled": SCRIPT_WORKERS_ENABLED, "idle": idle, "running": running}
+
+
+def run_script(
+    script_path: Path,
+    payload: Dict[str, Any],
+    timeout_sec: int,
+    warm: bool = True,
+) -> Optional[Dict[str, Any]]:
     if CANCEL_EVENT.is_set():
         raise RuntimeError("killed")
+    if not warm or not SCRIPT_WORKERS_ENABLED:
+        return run_script_once(script_path, payload, timeout_sec)
+    worker = acquire_worker(script_path)
     try:
-        RUN_PROC = subprocess.Popen(
-            ["python", str(script_path)],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
-        if RUN_PROC.stdin:
-            RUN_PROC.stdin.write(json.dumps(payload).encode("utf-8"))
-            RUN_PROC.stdin.close()
+        return worker.call(payload, timeout_sec)
+    finally:
+        release_worker(worker)
+
+
+def run_script_once(script_path: Path, payload: Dict[str, Any], timeout_sec: int) -> Optional[Dict[str, Any]]:
+    proc = subprocess.Popen(
+        ["python", str(script_path)],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    track_proc(proc, True)
+    try:
+        if proc.stdin:
+            proc.stdin.write(json.dumps(payload).encode("utf-8"))
+            proc.stdin.close()
         start = time.time()
         while True:
             if CANCEL_EVENT.is_set():
                 try:
-                    RUN_PROC.terminate()
+                    proc.terminate()
                 except Exception:
                     pass
                 raise RuntimeError("killed")
-            if RUN_PROC.poll() is not None:
+            if proc.poll() is not None:
                 break
             if (time.time() - start) > timeout_sec:
                 try:
-                    RUN_PROC.terminate()
+                    proc.terminate()
                 except Exception:
                     pass
                 raise RuntimeError("timeout")
             time.sleep(0.2)
-        stdout = RUN_PROC.stdout.read() if RUN_PROC.stdout else b""
-        if RUN_PROC.returncode != 0:
+        stdout = proc.stdout.read() if proc.stdout else b""
+        if proc.returncode != 0:
             return None
         return json.loads(stdout.decode("utf-8"))
     finally:
-        RUN_PROC = None
+        track_proc(proc, False)
 
 
 def normalize_output(
@@ -340,6 +626,82 @@ def build_payload(
     }
 
 
+def run_device(
+    script_path: Path,
+    script: Dict[str, Any],
+    dev_id: str,
+    dev: Dict[str, Any],
+    mapping: Dict[str, Any],
+    max_run_sec: int,
+    warm: bool,
+) -> List[Dict[str, Any]]:
+    if CANCEL_EVENT.is_set():
+        raise RuntimeError("killed")
+    telemetry_cfg = script.get("telemetry") or {}
+    key_override = telemetry_cfg.get("keys")
+    limit = int(telemetry_cfg.get("limit") or 24)
+    hours = int(telemetry_cfg.get("hours") or 24)
+    t_key = key_override or (dev.get("connector", {}) or {}).get("telemetryKey") or dev.get("type")
+    telemetry = fetch_device_telemetry(dev_id, t_key, limit, hours)
+    payload = build_payload(dev_id, dev, telemetry, mapping, script)
+    output = run_script(script_path, payload, max_run_sec, warm)
+    return normalize_output(output or {}, dev_id, "DEVICE")
+
+
+def run_batch(
+    script_path: Path,
+    script: Dict[str, Any],
+    chunk: List[Tuple[str, Dict[str, Any]]],
+    mapping: Dict[str, Any],
+    max_run_sec: int,
+    warm: bool,
+) -> List[Dict[str, Any]]:
+    """One script invocation for a chunk of devices: {"batch": [per-device payloads]} -> {"items": [...]}."""
+    if CANCEL_EVENT.is_set():
+        raise RuntimeError("killed")
+    telemetry_cfg = script.get("telemetry") or {}
+    key_override = telemetry_cfg.get("keys")
+    limit = int(telemetry_cfg.get("limit") or 24)
+    hours = int(telemetry_cfg.get("hours") or 24)
+    device_keys = {
+        dev_id: key_override or (dev.get("connector", {}) or {}).get("telemetryKey") or dev.get("type")
+        for dev_id, dev in chunk
+    }
+    combined = fetch_devices_telemetry(device_keys, limit, hours)
+    # Devices whose telemetry is unavailable run with {} exactly as in run_device.
+    batch = [build_payload(dev_id, dev, combined.get(dev_id) or {}, mapping, script) for dev_id, dev in chunk]
+    if not batch:
+        return []
+    payload = {
+        "batch": batch,
+        "context": {"script": script.get("name"), "scope": "per-device", "batch": True},
+    }
+    output = run_script(script_path, payload, max_run_sec, warm)
+    items: List[Dict[str, Any]] = []
+    for item in normalize_output(output or {}, None, "DEVICE"):
+        items.extend(normalize_output(item, None, "DEVICE"))
+    return items
+
+
+def map_ordered(
+    func: Callable[..., List[Dict[str, Any]]],
+    tasks: List[Tuple[Any, ...]],
+    workers: int,
+) -> List[List[Dict[str, Any]]]:
+    """Run `func(*task)` for every task on `workers` threads; results follow the task order."""
+    if workers <= 1 or len(tasks) <= 1:
+        return [func(*task) for task in tasks]
+    with ThreadPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+        futures = [executor.submit(func, *task) for task in tasks]
+        try:
+            return [future.result() for future in futures]
+        except BaseException:
+            # Tasks not started yet are dropped; running ones stop at their next CANCEL_EVENT check.
+            for future in futures:
+                future.cancel()
+            raise
+
+
 def run_cycle(
     mapping: Dict[str, Any],
     only_scripts: Optional[List[str]] = None,
@@ -351,6 +713,7 @@ def run_cycle(
 
     schedule = predictor.get("schedule", {})
     max_run_sec = int(schedule.get("maxRunSec") or 60)
+    concurrency = int(predictor.get("concurrency") or PREDICTOR_CONCURRENCY)
     refresh_sec = int((predictor.get("github", {}) or {}).get("refreshSec") or 600)
     allowlist = (predictor.get("github", {}) or {}).get("allowlist") or []
     scripts = predictor.get("scripts") or []
@@ -372,33 +735,45 @@ def run_cycle(
             continue
 
         scope = str(script.get("scope") or "per-device")
+        warm = bool(script.get("warm", True))
         telemetry_cfg = script.get("telemetry") or {}
         key_override = telemetry_cfg.get("keys")
         limit = int(telemetry_cfg.get("limit") or 24)
         hours = int(telemetry_cfg.get("hours") or 24)
 
         if scope == "global":
-            combined = {}
-            for dev_id, dev in devices.items():
-                t_key = key_override or (dev.get("connector", {}) or {}).get("telemetryKey") or dev.get("type")
-                combined[dev_id] = fetch_device_telemetry(dev_id, t_key, limit, hours)
+            device_keys = {
+                dev_id: key_override or (dev.get("connector", {}) or {}).get("telemetryKey") or dev.get("type")
+                for dev_id, dev in devices.items()
+            }
+            combined = fetch_devices_telemetry(device_keys, limit, hours)
             payload = {
                 "deviceId": global_device,
                 "devices": devices,
                 "telemetry": combined,
                 "context": {"script": script.get("name"), "scope": "global"},
             }
-            output = run_script(script_path, payload, max_run_sec)
+            output = run_script(script_path, payload, max_run_sec, warm)
             items.extend(normalize_output(output or {}, global_device, "DEVICE"))
             continue
 
-        for dev_id, dev in devices.items():
-            t_key = key_override or (dev.get("connector", {}) or {}).get("telemetryKey") or dev.get("type")
-            telemetry = fetch_device_telemetry(dev_id, t_key, limit, hours)
-            payload = build_payload(dev_id, dev, telemetry, mapping, script)
-            output = run_script(script_path, payload, max_run_sec)
-            items.extend(normalize_output(output or {}, dev_id, "DEVICE"))
-
+        if script.get("batch"):
+            size = max(1, min(int(script.get("batchSize") or PREDICTOR_BATCH_SIZE), TELEMETRY_BATCH_MAX_ITEMS))
+            entries = list(devices.items())
+            chunks = [(entries[i : i + size],) for i in range(0, len(entries), size)]
+            run_chunk = partial(
+                run_batch, script_path, script, mapping=mapping, max_run_sec=max_run_sec, warm=warm
+            )
+            results = map_ordered(run_chunk, chunks, concurrency)
+        else:
+            run_one = partial(
+                run_device, script_path, script, mapping=mapping, max_run_sec=max_run_sec, warm=warm
+            )
+            results = map_ordered(run_one, list(devices.items()), concurrency)
+        for result_items in results:
+            items.extend(result_items)
+
+    prune_workers()
     if items:
         post_predictions(items)
     return len(items)
@@ -495,6 +870,7 @@ def scheduler_loop() -> None:
 
 
 def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
     start_api_server()
     if MODE in {"loop", "scheduler"}:
         thread = threading.Thread(target=scheduler_loop, daemon=True)
@@ -0,0 +1,57 @@
+import json
+import os
+import sys
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+REAL_CLIENT = httpx.Client
+SCRIPT = Path(__file__).resolve().parents[2] / "predictors" / "scripts" / "per_device" / "humidity_drying.py"
+HOUR_MS = 3_600_000
+TELEMETRY = {
+    "dev-a": [{"ts": i * HOUR_MS, "value": 90 - 2 * i} for i in range(8)],
+    "dev-c": [{"ts": i * HOUR_MS, "value": 60.0} for i in range(8)],
+}
+
+
+def handler(request):
+    if request.url.path == "/telemetry/batch":
+        results = []
+        for item in json.loads(request.content)["items"]:
+            points = TELEMETRY.get(item["deviceId"])
+            if points is None:
+                results.append({"status": "error", "detail": "upstream failed"})
+            else:
+                results.append({"status": "ok", "points": points})
+        return httpx.Response(200, json={"items": results})
+    device_id = request.url.path.split("/")[2]
+    points = TELEMETRY.get(device_id)
+    if points is None:
+        return httpx.Response(502, json={"detail": "upstream failed"})
+    return httpx.Response(200, json={"points": points})
+
+
+def run_predictions(monkeypatch, script):
+    transport = httpx.MockTransport(handler)
+    monkeypatch.setattr(app.httpx, "Client", lambda **kwargs: REAL_CLIENT(transport=transport, **kwargs))
+    monkeypatch.setattr(app, "fetch_script", lambda script, allowlist, refresh: SCRIPT)
+    posted = []
+    monkeypatch.setattr(app, "post_predictions", lambda items: posted.extend(items) or True)
+    mapping = {
+        "devices": {dev_id: {"type": "humidity"} for dev_id in ("dev-a", "dev-b", "dev-c")},
+        "predictor": {"enabled": True, "concurrency": 1, "scripts": [{"name": "drying", "warm": False, **script}]},
+    }
+    assert app.run_cycle(mapping) == len(posted)
+    return posted
+
+
+def test_batch_and_per_device_modes_publish_the_same_predictions(monkeypatch):
+    per_device = run_predictions(monkeypatch, {})
+    batched = run_predictions(monkeypatch, {"batch": True, "batchSize": 2})
+    assert [item["deviceId"] for item in per_device] == ["dev-a", "dev-b", "dev-c"]
+    assert per_device[1]["attributes"] == {"drying_status": "insufficient_data"}
+    assert batched == per_device
@@ -0,0 +1,132 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+SCRIPT = """
+import json, os, sys
+payload = json.loads(sys.stdin.buffer.read().decode("utf-8"))
+print("log line that is not the result", file=sys.stderr)
+if payload.get("crash"):
+    os._exit(3)
+if payload.get("raise"):
+    raise ValueError("bad payload")
+if payload.get("exit"):
+    sys.exit(payload["exit"])
+result = {"pid": os.getpid(), "echo": payload.get("value"), "text": "two\\nlines"}
+sys.stdout.buffer.write(json.dumps(result, indent=2).encode("utf-8"))
+"""
+
+
+@pytest.fixture
+def script(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "IDLE_WORKERS", {})
+    path = tmp_path / "predictor.py"
+    path.write_text(SCRIPT, encoding="utf-8")
+    yield path
+    for workers in app.IDLE_WORKERS.values():
+        for worker in workers:
+            worker.stop()
+
+
+def test_cold_and_warm_runs_agree(script):
+    payload = {"value": "été"}
+    cold = app.run_script(script, payload, 10, warm=False)
+    warm = app.run_script(script, payload, 10)
+    assert cold["echo"] == warm["echo"] == "été"
+    assert cold["text"] == warm["text"] == "two\nlines"
+    assert cold["pid"] != warm["pid"]
+
+
+def test_warm_worker_is_reused_between_calls(script):
+    first = app.run_script(script, {"value": 1}, 10)
+    second = app.run_script(script, {"value": 2}, 10)
+    assert (first["echo"], second["echo"]) == (1, 2)
+    assert first["pid"] == second["pid"]
+    (worker,) = app.IDLE_WORKERS[str(script)]
+    assert worker.calls == 2
+
+
+def test_failing_script_keeps_the_worker(script):
+    pid = app.run_script(script, {}, 10)["pid"]
+    assert app.run_script(script, {"raise": True}, 10) is None
+    assert app.run_script(script, {"exit": 2}, 10) is None
+    assert app.run_script(script, {}, 10)["pid"] == pid
+
+
+def test_crashed_worker_is_replaced(script):
+    pid = app.run_script(script, {}, 10)["pid"]
+    assert app.run_script(script, {"crash": True}, 10) is None
+    assert app.IDLE_WORKERS[str(script)] == []
+    assert app.run_script(script, {}, 10)["pid"] != pid
+
+
+def test_edited_script_gets_a_fresh_worker(script):
+    pid = app.run_script(script, {}, 10)["pid"]
+    script.write_text(SCRIPT.replace('"echo"', '"edited": True, "echo"'), encoding="utf-8")
+    os.utime(script, ns=(0, os.stat(script).st_mtime_ns + 1_000_000_000))
+    result = app.run_script(script, {}, 10)
+    assert result["edited"] is True
+    assert result["pid"] != pid
+
+
+def test_worker_speaks_one_json_line_per_request(script):
+    worker = app.ScriptWorker(script)
+    try:
+        for value in range(3):
+            worker.proc.stdin.write(json.dumps({"payload": {"value": value}}).encode("utf-8") + b"\n")
+        worker.proc.stdin.flush()
+        lines = [worker.responses.get(timeout=10) for _ in range(3)]
+    finally:
+        worker.stop()
+    responses = [json.loads(line) for line in lines]
+    assert all(response["ok"] for response in responses)
+    assert [json.loads(response["stdout"])["echo"] for response in responses] == [0, 1, 2]
+
+
+def test_writes_to_fd_1_do_not_shift_responses(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "IDLE_WORKERS", {})
+    path = tmp_path / "noisy.py"
+    path.write_text(
+        "import json, os, sys\n"
+        "payload = json.load(sys.stdin)\n"
+        "if payload['deviceId'] == 'A':\n"
+        "    os.write(1, b'native noise\\n')\n"
+        "print(json.dumps({'deviceId': payload['deviceId']}))\n",
+        encoding="utf-8",
+    )
+    try:
+        outputs = [app.run_script(path, {"deviceId": device}, 10) for device in ("A", "B", "C")]
+    finally:
+        for worker in app.IDLE_WORKERS.get(str(path), []):
+            worker.stop()
+    assert outputs == [{"deviceId": "A"}, {"deviceId": "B"}, {"deviceId": "C"}]
+
+
+def test_failed_run_reports_the_stderr_tail(script):
+    worker = app.ScriptWorker(script)
+    try:
+        worker.proc.stdin.write(json.dumps({"payload": {"exit": 4}}).encode("utf-8") + b"\n")
+        worker.proc.stdin.write(json.dumps({"payload": {}}).encode("utf-8") + b"\n")
+        worker.proc.stdin.flush()
+        failed, ok = (json.loads(worker.responses.get(timeout=10)) for _ in range(2))
+    finally:
+        worker.stop()
+    assert failed["ok"] is False
+    assert failed["error"] == "exit status 4"
+    assert "log line that is not the result" in failed["stderr"]
+    assert ok["ok"] is True
+
+
+def test_undecodable_response_retires_the_worker(script):
+    worker = app.acquire_worker(script)
+    worker.responses.put(b"not json\n")
+    assert worker.call({}, 10) is None
+    assert not worker.alive()
+    app.release_worker(worker)
+    assert app.IDLE_WORKERS.get(str(script), []) == []
@@ -0,0 +1,35 @@
+import json
+import os
+import sys
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+def use_middleware(monkeypatch, handler):
+    transport = httpx.MockTransport(handler)
+    real_client = httpx.Client
+    monkeypatch.setattr(app.httpx, "Client", lambda **kwargs: real_client(transport=transport, **kwargs))
+
+
+def test_batch_fetch_gives_every_device_an_entry(monkeypatch):
+    monkeypatch.setattr(app, "TELEMETRY_BATCH_MAX_ITEMS", 2)
+
+    def handler(request):
+        items = json.loads(request.content)["items"]
+        if items[0]["deviceId"] == "c":
+            return httpx.Response(502, text="upstream down")
+        results = []
+        for item in items:
+            if item["deviceId"] == "b":
+                results.append({"status": "error", "detail": "not mapped"})
+            else:
+                results.append({"status": "ok", "temperature": [{"ts": 1, "value": 20.5}]})
+        return httpx.Response(200, json={"items": results})
+
+    use_middleware(monkeypatch, handler)
+    combined = app.fetch_devices_telemetry({"a": "temperature", "b": None, "c": None, "d": None}, 24, 24)
+    assert combined == {"a": {"temperature": [{"ts": 1, "value": 20.5}]}, "b": {}, "c": {}, "d": {}}
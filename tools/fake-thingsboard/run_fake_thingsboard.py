@@ -0,0 +1,580 @@
+import argparse
+import asyncio
+import base64
+import json
+import random
+import time
+import uuid
+import zlib
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse
+
+
+ROOT = Path(__file__).resolve().parents[2]
+DEFAULT_CONFIG = ROOT / "data" / "devices.ifc.json"
+AGGREGATIONS = {"AVG", "MIN", "MAX", "SUM", "COUNT"}
+
+
+class SeriesStore:
+    """In-memory timeseries: one pair of growable numpy arrays (ts, value) per (entity, key).
+
+    Device series are generated lazily on first access from a seed derived from the entity
+    id and key, so runs are reproducible and 100k devices cost nothing until queried.
+    Other keys (predictions, ...) only hold what was posted.
+    """
+
+    def __init__(self, history_hours: float, step_ms: int, seed: int) -> None:
+        self.history_hours = history_hours
+        self.step_ms = step_ms
+        self.seed = seed
+        self.origin_ms = int(time.time() * 1000)
+        self._series: Dict[Tuple[str, str], List[Any]] = {}
+
+    def _generate(self, entity_id: str, key: str) -> List[Any]:
+        count = int(self.history_hours * 3_600_000 // self.step_ms)
+        end = self.origin_ms - self.origin_ms % self.step_ms
+        ts = end - np.arange(count - 1, -1, -1, dtype=np.int64) * self.step_ms
+        rng = np.random.default_rng(zlib.crc32(f"{self.seed}:{entity_id}:{key}".encode("utf-8")))
+        base = 20.0 + 30.0 * rng.random()
+        phase = np.arange(count) * (2 * np.pi * self.step_ms / 86_400_000)
+        values = base + 3.0 * np.sin(phase + rng.random() * 6.28) + rng.normal(0, 0.3, count)
+        capacity = max(16, count * 2)
+        ts_buffer = np.empty(capacity, dtype=np.int64)
+        value_buffer = np.empty(capacity, dtype=np.float64)
+        ts_buffer[:count] = ts
+        value_buffer[:count] = np.round(values, 2)
+        return [ts_buffer, value_buffer, count]
+
+    def series(self, entity_id: str, key: str, generate: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        entry = self._series.get((entity_id, key))
+        if entry is None:
+            if not generate:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+            entry = self._series[(entity_id, key)] = self._generate(entity_id, key)
+        return entry[0][: entry[2]], entry[1][: entry[2]]
+
+    def keys_for(self, entity_id: str) -> List[str]:
+        return [key for entity, key in self._series if entity == entity_id]
+
+    def append(self, entity_id: str, key: str, ts: int, value: float, generate: bool = True) -> None:
+        if (entity_id, key) not in self._series:
+            if generate:
+                self.series(entity_id, key)
+            else:
+                empty = [np.empty(16, dtype=np.int64), np.empty(16, dtype=np.float64), 0]
+                self._series[(entity_id, key)] = empty
+        entry = self._series[(entity_id, key)]
+        ts_buffer, value_buffer, count = entry
+        if count and ts < ts_buffer[count - 1]:
+            position = int(np.searchsorted(ts_buffer[:count], ts, side="right"))
+        else:
+            position = count
+        if count == len(ts_buffer):
+            ts_buffer = np.concatenate([ts_buffer, np.empty(count, dtype=np.int64)])
+            value_buffer = np.concatenate([value_buffer, np.empty(count, dtype=np.float64)])
+            entry[0], entry[1] = ts_buffer, value_buffer
+        ts_buffer[position + 1 : count + 1] = ts_buffer[position:count].copy()
+        value_buffer[position + 1 : count + 1] = value_buffer[position:count].copy()
+        ts_buffer[position] = ts
+        value_buffer[position] = value
+        entry[2] = count + 1
+
+    def query(
+        self,
+        entity_id: str,
+        key: str,
+        start_ts: int,
+        end_ts: int,
+        limit: int,
+        agg: str,
+        interval: int,
+        order_by: str,
+        generate: bool = True,
+    ) -> List[Dict[str, Any]]:
+        ts, values = self.series(entity_id, key, generate)
+        lo = int(np.searchsorted(ts, start_ts, side="left"))
+        hi = int(np.searchsorted(ts, end_ts, side="right"))
+        ts, values = ts[lo:hi], values[lo:hi]
+        if agg in AGGREGATIONS and interval > 0:
+            ts, values = aggregate(ts, values, start_ts, end_ts, interval, agg)
+        if order_by == "ASC":
+            ts, values = ts[:limit], values[:limit]
+        else:
+            ts, values = ts[::-1][:limit], values[::-1][:limit]
+        return [{"ts": t, "value": format_value(v)} for t, v in zip(ts.tolist(), values.tolist())]
+
+
+def aggregate(
+    ts: np.ndarray, values: np.ndarray, start_ts: int, end_ts: int, interval: int, agg: str
+) -> Tuple[np.ndarray, np.ndarray]:
+    """ThingsBoard-style bucketed aggregation; each bucket is stamped at its middle."""
+    buckets = max(1, -(-(end_ts - start_ts) // interval))
+    index = np.minimum((ts - start_ts) // interval, buckets - 1)
+    count = np.bincount(index, minlength=buckets)
+    if agg == "COUNT":
+        result = count.astype(np.float64)
+    elif agg in {"AVG", "SUM"}:
+        total = np.bincount(index, weights=values, minlength=buckets)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result = total / count if agg == "AVG" else total
+    else:
+        result = np.full(buckets, np.inf if agg == "MIN" else -np.inf)
+        (np.minimum if agg == "MIN" else np.maximum).at(result, index, values)
+    filled = count > 0
+    stamps = start_ts + np.arange(buckets, dtype=np.int64) * interval + interval // 2
+    return stamps[filled], result[filled]
+
+
+def format_value(value: float) -> str:
+    # ThingsBoard returns telemetry values as strings unless useStrictDataTypes is set.
+    return str(int(value)) if float(value).is_integer() else str(round(value, 6))
+
+
+def make_jwt(subject: str, ttl_sec: int) -> str:
+    def encode(part: Dict[str, Any]) -> str:
+        return base64.urlsafe_b64encode(json.dumps(part).encode("utf-8")).decode("ascii").rstrip("=")
+
+    now = int(time.time())
+    claims = {"sub": subject, "iat": now, "exp": now + ttl_sec, "jti": uuid.uuid4().hex}
+    return f"{encode({'alg': 'none', 'typ': 'JWT'})}.{encode(claims)}.fake"
+
+
+def jwt_exp(token: str) -> int:
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return int(json.loads(base64.urlsafe_b64decode(payload)).get("exp", 0))
+    except Exception:
+        return 0
+
+
+def parse_telemetry_payload(payload: Any, now_ms: int) -> List[Tuple[int, Dict[str, Any]]]:
+    """`{k: v}`, `{ts, values}` or a list of either, as (ts, values) pairs."""
+    entries = payload if isinstance(payload, list) else [payload]
+    result = []
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        if "ts" in entry and isinstance(entry.get("values"), dict):
+            result.append((int(entry["ts"]), entry["values"]))
+        else:
+            result.append((now_ms, entry))
+    return result
+
+
+def load_devices(config_path: Optional[Path], count: int) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, str]]:
+    """Devices (entity id -> {type, key}) and access tokens (token -> entity id)."""
+    devices: Dict[str, Dict[str, Any]] = {}
+    tokens: Dict[str, str] = {}
+    if config_path and config_path.exists():
+        with config_path.open("r", encoding="utf-8") as f:
+            config = json.load(f)
+        for name, device in (config.get("devices") or {}).items():
+            connector = device.get("connector") or {}
+            if connector.get("type") != "thingsboard":
+                continue
+            entity_id = connector.get("deviceId") or name
+            devices[entity_id] = {
+                "type": device.get("type") or "value",
+                "key": connector.get("telemetryKey") or device.get("type") or "value",
+            }
+            token = connector.get("accessToken")
+            if token:
+                tokens[str(token).strip()] = entity_id
+    types = ["temperature", "humidity", "co2"]
+    for i in range(count):
+        kind = types[i % len(types)]
+        entity_id = f"fake-{i:06d}"
+        devices[entity_id] = {"type": kind, "key": kind}
+        tokens[f"token-{i:06d}"] = entity_id
+    return devices, tokens
+
+
+def write_mapping(
+    path: Path, devices: Dict[str, Dict[str, Any]], tokens: Dict[str, str], base_url: str
+) -> None:
+    """A devices.ifc.json pointing the middleware at this server."""
+    token_by_entity = {entity_id: token for token, entity_id in tokens.items()}
+    mapping = {
+        "model": {"file": "model.ifc"},
+        "backend": {
+            "thingsboard": {"baseUrl": base_url, "username": "tenant@thingsboard.org", "password": "tenant"}
+        },
+        "devices": {
+            entity_id: {
+                "type": device["type"],
+                "ifcGuids": [],
+                "connector": {
+                    "type": "thingsboard",
+                    "deviceId": entity_id,
+                    "entityType": "DEVICE",
+                    "telemetryKey": device["key"],
+                    "accessToken": token_by_entity.get(entity_id, ""),
+                },
+            }
+            for entity_id, device in devices.items()
+        },
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8") as f:
+        json.dump(mapping, f, indent=2)
+
+
+def lifespan(feed: Optional[Callable[[], Awaitable[None]]]):
+    @asynccontextmanager
+    async def context(_: FastAPI):
+        task = asyncio.create_task(feed()) if feed else None
+        yield
+        if task:
+            task.cancel()
+
+    return context
+
+
+def create_app(args: argparse.Namespace) -> FastAPI:
+    app = FastAPI(title="Fake Thingsboard")
+    store = SeriesStore(args.history_hours, args.step_ms, args.seed)
+    devices, tokens = load_devices(Path(args.config) if args.config else None, args.devices)
+    attributes: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    alarms: Dict[str, List[Dict[str, Any]]] = {}
+    alarm_index: Dict[str, Dict[str, Any]] = {}
+    subscribers: Dict[str, Set[Tuple[WebSocket, int]]] = {}
+    stats: Dict[str, int] = {}
+    rng = random.Random(args.seed)
+
+    def generated(entity_id: str, key: str) -> bool:
+        device = devices.get(entity_id)
+        return bool(device) and device["key"] == key
+
+    def alarms_for(entity_type: str, entity_id: str) -> List[Dict[str, Any]]:
+        if entity_id not in alarms:
+            local = random.Random(zlib.crc32(f"{args.seed}:alarms:{entity_id}".encode("utf-8")))
+            items = []
+            now = int(time.time() * 1000)
+            for i in range(args.alarms_per_device):
+                status = local.choice(["ACTIVE_UNACK", "ACTIVE_ACK", "CLEARED_UNACK", "CLEARED_ACK"])
+                alarm_id = str(uuid.UUID(int=local.getrandbits(128)))
+                alarm = {
+                    "id": {"entityType": "ALARM", "id": alarm_id},
+                    "createdTime": now - local.randint(0, 7 * 86_400_000),
+                    "type": local.choice(["High Temperature", "Low Humidity", "Sensor Offline"]),
+                    "severity": local.choice(["CRITICAL", "MAJOR", "MINOR", "WARNING"]),
+                    "status": status,
+                    "acknowledged": status.endswith("_ACK"),
+                    "cleared": status.startswith("CLEARED"),
+                    "originator": {"entityType": entity_type, "id": entity_id},
+                }
+                items.append(alarm)
+                alarm_index[alarm_id] = alarm
+            items.sort(key=lambda alarm: alarm["createdTime"], reverse=True)
+            alarms[entity_id] = items
+        return alarms[entity_id]
+
+    async def simulate(request_kind: str) -> Optional[JSONResponse]:
+        stats[request_kind] = stats.get(request_kind, 0) + 1
+        delay = args.latency_ms + (rng.random() * args.jitter_ms if args.jitter_ms else 0)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        if args.error_rate and rng.random() < args.error_rate:
+            stats["errors"] = stats.get("errors", 0) + 1
+            return JSONResponse({"status": 500, "message": "Simulated failure"}, status_code=500)
+        return None
+
+    def authorized(request: Request) -> bool:
+        header = request.headers.get("x-authorization", "")
+        scheme, _, credential = header.partition(" ")
+        if scheme == "ApiKey":
+            return not args.api_key or credential == args.api_key
+        if scheme == "Bearer":
+            return jwt_exp(credential) > time.time()
+        return False
+
+    def unauthorized() -> JSONResponse:
+        return JSONResponse(
+            {"status": 401, "message": "Authentication failed", "errorCode": 10}, status_code=401
+        )
+
+    async def notify(entity_id: str, entries: List[Tuple[int, Dict[str, Any]]]) -> None:
+        targets = subscribers.get(entity_id)
+        if not targets:
+            return
+        data: Dict[str, List[List[Any]]] = {}
+        for ts, values in entries:
+            for key, value in values.items():
+                data.setdefault(key, []).append([ts, str(value)])
+        for ws, cmd_id in list(targets):
+            try:
+                await ws.send_text(
+                    json.dumps({"subscriptionId": cmd_id, "errorCode": 0, "errorMsg": None, "data": data})
+                )
+            except Exception:
+                targets.discard((ws, cmd_id))
+
+    async def ingest(entity_id: str, payload: Any) -> None:
+        entries = parse_telemetry_payload(payload, int(time.time() * 1000))
+        for ts, values in entries:
+            for key, value in values.items():
+                try:
+                    store.append(entity_id, key, ts, float(value), generated(entity_id, key))
+                except (TypeError, ValueError):
+                    continue
+        await notify(entity_id, entries)
+
+    @app.post("/api/auth/login")
+    async def login(request: Request) -> Any:
+        failure = await simulate("login")
+        if failure:
+            return failure
+        body = await request.json()
+        if not body.get("username") or not body.get("password"):
+            return unauthorized()
+        return {
+            "token": make_jwt(body["username"], args.token_ttl),
+            "refreshToken": make_jwt(body["username"], 604800),
+        }
+
+    @app.get("/api/plugins/telemetry/{entity_type}/{entity_id}/values/timeseries")
+    async def timeseries(
+        request: Request,
+        entity_type: str,
+        entity_id: str,
+        keys: str,
+        startTs: int,
+        endTs: int,
+        limit: int = 100,
+        agg: str = "NONE",
+        interval: int = 0,
+        orderBy: str = "DESC",
+    ) -> Any:
+        failure = await simulate("timeseries")
+        if failure:
+            return failure
+        if not authorized(request):
+            return unauthorized()
+        result = {}
+        for key in [k.strip() for k in keys.split(",") if k.strip()]:
+            points = store.query(
+                entity_id,
+                key,
+                startTs,
+                endTs,
+                limit,
+                agg.upper(),
+                interval,
+                orderBy.upper(),
+                generated(entity_id, key),
+            )
+            if points:
+                result[key] = points
+        return result
+
+    @app.post("/api/plugins/telemetry/{entity_type}/{entity_id}/timeseries")
+    @app.post("/api/plugins/telemetry/{entity_type}/{entity_id}/timeseries/{scope}")
+    async def post_timeseries(request: Request, entity_type: str, entity_id: str, scope: str = "ANY") -> Any:
+        failure = await simulate("publish")
+        if failure:
+            return failure
+        if not authorized(request):
+            return unauthorized()
+        await ingest(entity_id, await request.json())
+        return JSONResponse(None)
+
+    @app.post("/api/plugins/telemetry/{entity_type}/{entity_id}/attributes/{scope}")
+    async def post_attributes(request: Request, entity_type: str, entity_id: str, scope: str) -> Any:
+        failure = await simulate("attributes")
+        if failure:
+            return failure
+        if not authorized(request):
+            return unauthorized()
+        attributes.setdefault((entity_id, scope.upper()), {}).update(await request.json())
+        return JSONResponse(None)
+
+    @app.get("/api/alarm/{entity_type}/{entity_id}")
+    async def list_alarms(
+        request: Request,
+        entity_type: str,
+        entity_id: str,
+        pageSize: int = 10,
+        page: int = 0,
+        searchStatus: Optional[str] = None,
+        sortOrder: str = "DESC",
+    ) -> Any:
+        failure = await simulate("alarms")
+        if failure:
+            return failure
+        if not authorized(request):
+            return unauthorized()
+        items = alarms_for(entity_type, entity_id)
+        status = (searchStatus or "ANY").upper()
+        if status == "ACTIVE":
+            items = [alarm for alarm in items if not alarm["cleared"]]
+        elif status == "CLEARED":
+            items = [alarm for alarm in items if alarm["cleared"]]
+        elif status == "ACK":
+            items = [alarm for alarm in items if alarm["acknowledged"]]
+        elif status == "UNACK":
+            items = [alarm for alarm in items if not alarm["acknowledged"]]
+        if sortOrder.upper() == "ASC":
+            items = items[::-1]
+        total = len(items)
+        data = items[page * pageSize : (page + 1) * pageSize]
+        total_pages = -(-total // pageSize) if pageSize else 0
+        return {
+            "data": data,
+            "totalPages": total_pages,
+            "totalElements": total,
+            "hasNext": page + 1 < total_pages,
+        }
+
+    @app.post("/api/alarm/{alarm_id}/{action}")
+    async def alarm_action(request: Request, alarm_id: str, action: str) -> Any:
+        failure = await simulate("alarm_action")
+        if failure:
+            return failure
+        if not authorized(request):
+            return unauthorized()
+        alarm = alarm_index.get(alarm_id)
+        if alarm is None or action not in {"ack", "clear"}:
+            return JSONResponse({"status": 404, "message": "Requested item wasn't found!"}, status_code=404)
+        if action == "ack":
+            alarm["acknowledged"] = True
+        else:
+            alarm["cleared"] = True
+        state = "CLEARED" if alarm["cleared"] else "ACTIVE"
+        alarm["status"] = f"{state}_{'ACK' if alarm['acknowledged'] else 'UNACK'}"
+        return alarm
+
+    @app.get("/api/system/info")
+    async def system_info(request: Request) -> Any:
+        failure = await simulate("system_info")
+        if failure:
+            return failure
+        if not authorized(request):
+            return unauthorized()
+        return {"version": "fake", "devices": len(devices)}
+
+    @app.post("/api/v1/{token}/telemetry")
+    async def device_telemetry(request: Request, token: str) -> Any:
+        failure = await simulate("device_telemetry")
+        if failure:
+            return failure
+        entity_id = tokens.get(token)
+        if entity_id is None:
+            if args.strict_tokens:
+                return JSONResponse({"status": 401, "message": "Invalid access token"}, status_code=401)
+            entity_id = tokens[token] = token
+        await ingest(entity_id, await request.json())
+        return JSONResponse(None)
+
+    @app.websocket("/api/ws")
+    async def websocket(ws: WebSocket) -> None:
+        await ws.accept()
+        stats["ws_sessions"] = stats.get("ws_sessions", 0) + 1
+        header = ws.headers.get("x-authorization", "")
+        authenticated = header.startswith("ApiKey ")
+        mine: Set[Tuple[str, int]] = set()
+        try:
+            while True:
+                message = json.loads(await ws.receive_text())
+                auth = message.get("authCmd")
+                if auth:
+                    authenticated = jwt_exp(str(auth.get("token") or "")) > time.time()
+                for cmd in message.get("cmds") or []:
+                    cmd_id = int(cmd.get("cmdId", 0))
+                    entity_id = str(cmd.get("entityId"))
+                    if not authenticated:
+                        await ws.send_text(
+                            json.dumps({"subscriptionId": cmd_id, "errorCode": 10, "errorMsg": "Unauthorized"})
+                        )
+                        continue
+                    if cmd.get("unsubscribe"):
+                        subscribers.get(entity_id, set()).discard((ws, cmd_id))
+                        mine.discard((entity_id, cmd_id))
+                        continue
+                    subscribers.setdefault(entity_id, set()).add((ws, cmd_id))
+                    mine.add((entity_id, cmd_id))
+                    device = devices.get(entity_id)
+                    keys = set(store.keys_for(entity_id)) | ({device["key"]} if device else set())
+                    latest = {}
+                    for key in keys:
+                        ts, values = store.series(entity_id, key, generated(entity_id, key))
+                        if len(ts):
+                            latest[key] = [[int(ts[-1]), format_value(float(values[-1]))]]
+                    await ws.send_text(
+                        json.dumps({"subscriptionId": cmd_id, "errorCode": 0, "errorMsg": None, "data": latest})
+                    )
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+        finally:
+            for entity_id, cmd_id in mine:
+                subscribers.get(entity_id, set()).discard((ws, cmd_id))
+
+    @app.get("/fake/stats")
+    async def fake_stats() -> Dict[str, Any]:
+        return {
+            "requests": stats,
+            "devices": len(devices),
+            "series": len(store._series),
+            "subscriptions": sum(len(targets) for targets in subscribers.values()),
+        }
+
+    async def tick() -> None:
+        """Append one point per device every `--tick-sec`, as a live feed."""
+        while True:
+            await asyncio.sleep(args.tick_sec)
+            now = int(time.time() * 1000)
+            for entity_id, device in devices.items():
+                ts, values = store.series(entity_id, device["key"])
+                last = float(values[-1]) if len(values) else 20.0
+                value = round(last + rng.gauss(0, 0.2), 2)
+                await ingest(entity_id, {"ts": now, "values": {device["key"]: value}})
+
+    app.router.lifespan_context = lifespan(tick if args.tick_sec > 0 else None)
+    return app
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Fake Thingsboard server for local benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7000)
+    parser.add_argument(
+        "--config",
+        default=str(DEFAULT_CONFIG),
+        help="devices.ifc.json whose Thingsboard devices are served (empty to skip)",
+    )
+    parser.add_argument("--devices", type=int, default=0, help="Additional synthetic devices")
+    parser.add_argument("--history-hours", type=float, default=24.0, help="History generated per series")
+    parser.add_argument("--step-ms", type=int, default=60_000, help="Spacing of generated points")
+    parser.add_argument("--alarms-per-device", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay added to every request")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Random extra delay (uniform)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 500")
+    parser.add_argument("--token-ttl", type=int, default=9000, help="JWT lifetime in seconds")
+    parser.add_argument("--api-key", default="", help="Only accept this ApiKey (any key if empty)")
+    parser.add_argument("--strict-tokens", action="store_true", help="Reject unknown device access tokens")
+    parser.add_argument("--tick-sec", type=float, default=0.0, help="Live point per device (0 = off)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--write-mapping",
+        default=None,
+        help="Write a devices.ifc.json for the middleware pointing at this server, then start",
+    )
+    args = parser.parse_args()
+
+    app = create_app(args)
+    if args.write_mapping:
+        devices, tokens = load_devices(Path(args.config) if args.config else None, args.devices)
+        write_mapping(Path(args.write_mapping), devices, tokens, f"http://{args.host}:{args.port}")
+        print(f"Mapping written to {args.write_mapping} ({len(devices)} devices)")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,389 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+
+ROOT = Path(__file__).resolve().parents[2]
+FAKE_THINGSBOARD = ROOT / "tools" / "fake-thingsboard" / "run_fake_thingsboard.py"
+SCENARIOS = ["telemetry", "alarms_summary", "alarms_recent", "predictions", "mapping"]
+# Relative change beyond --threshold that counts as a regression, per metric direction.
+HIGHER_IS_WORSE = ["p50Ms", "p95Ms", "p99Ms"]
+LOWER_IS_WORSE = ["throughput"]
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = q / 100 * (len(sorted_values) - 1)
+    low = int(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def summarize(latencies: List[float], statuses: Dict[str, int], errors: int, elapsed: float) -> Dict[str, Any]:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": statuses,
+        "elapsedSec": round(elapsed, 3),
+        "throughput": round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+        "meanMs": round(sum(ordered) / len(ordered), 2) if ordered else 0.0,
+        "p50Ms": round(percentile(ordered, 50), 2),
+        "p95Ms": round(percentile(ordered, 95), 2),
+        "p99Ms": round(percentile(ordered, 99), 2),
+        "maxMs": round(ordered[-1], 2) if ordered else 0.0,
+    }
+
+
+async def drive(
+    client: httpx.AsyncClient,
+    make_request: Callable[[random.Random], Tuple[str, str, Optional[Dict[str, Any]]]],
+    total: int,
+    concurrency: int,
+    duration: float,
+    warmup: int,
+    seed: int,
+) -> Dict[str, Any]:
+    """Send `total` requests from `concurrency` workers (or until `duration` elapses)."""
+    rng = random.Random(seed)
+    for _ in range(warmup):
+        method, path, body = make_request(rng)
+        try:
+            await client.request(method, path, json=body)
+        except httpx.HTTPError:
+            pass
+
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    errors = 0
+    remaining = total
+    deadline = time.perf_counter() + duration if duration > 0 else None
+
+    async def worker() -> None:
+        nonlocal remaining, errors
+        while remaining > 0 and (deadline is None or time.perf_counter() < deadline):
+            remaining -= 1
+            method, path, body = make_request(rng)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                await response.aread()
+                status = str(response.status_code)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError as exc:
+                status = type(exc).__name__
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return summarize(latencies, statuses, errors, time.perf_counter() - started)
+
+
+def scenario_requests(
+    scenario: str, device_ids: List[str], tb_ids: List[str], args: argparse.Namespace
+) -> List[Tuple[str, Callable[[random.Random], Tuple[str, str, Optional[Dict[str, Any]]]]]]:
+    """(name, request factory) pairs for one scenario; telemetry has one entry per window.
+
+    `device_ids` are mapping keys (what /devices/{id}/... looks up), `tb_ids` the
+    Thingsboard ids /predictions/apply publishes to.
+    """
+    if scenario == "telemetry":
+        def telemetry(hours: int):
+            def make(rng: random.Random):
+                device_id = rng.choice(device_ids)
+                return "GET", f"/devices/{device_id}/telemetry?hours={hours}&limit={args.limit}", None
+            return make
+        return [(f"telemetry[hours={hours}]", telemetry(hours)) for hours in args.windows]
+    if scenario == "alarms_summary":
+        return [("alarms_summary", lambda rng: ("GET", "/alarms/summary", None))]
+    if scenario == "alarms_recent":
+        return [("alarms_recent", lambda rng: ("GET", "/alarms/recent?limit=8", None))]
+    if scenario == "predictions":
+        def predictions(rng: random.Random):
+            now = int(time.time() * 1000)
+            items = [
+                {
+                    "deviceId": rng.choice(tb_ids),
+                    "telemetry": {"ts": now, "values": {"prediction": rng.random()}},
+                }
+                for _ in range(args.predictions_batch)
+            ]
+            return "POST", "/predictions/apply", {"wait": True, "items": items}
+        if not tb_ids:
+            raise SystemExit("The predictions scenario needs Thingsboard-connected devices")
+        return [(f"predictions[batch={args.predictions_batch}]", predictions)]
+    if scenario == "mapping":
+        return [("mapping", lambda rng: ("GET", "/devices.ifc.json", None))]
+    raise SystemExit(f"Unknown scenario: {scenario}")
+
+
+async def wait_ready(url: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(timeout=2.0) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise SystemExit(f"Timed out waiting for {url}")
+
+
+async def run_against(base_url: str, args: argparse.Namespace) -> Dict[str, Any]:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        mapping = (await client.get("/devices.ifc.json")).json()
+        devices = mapping.get("devices") or {}
+        device_ids = list(devices)
+        tb_ids = [
+            device["connector"]["deviceId"]
+            for device in devices.values()
+            if (device.get("connector") or {}).get("type") == "thingsboard" and device["connector"].get("deviceId")
+        ]
+        if not device_ids:
+            raise SystemExit("The middleware mapping has no devices")
+        results = {}
+        for scenario in args.scenarios:
+            for name, make_request in scenario_requests(scenario, device_ids, tb_ids, args):
+                print(f"  {name} ...", file=sys.stderr, flush=True)
+                results[name] = await drive(
+                    client, make_request, args.requests, args.concurrency, args.duration, args.warmup, args.seed
+                )
+        return {"deviceCount": len(device_ids), "results": results}
+
+
+def spawn(command: List[str], env: Dict[str, str], log_path: Path) -> subprocess.Popen:
+    log = log_path.open("w", encoding="utf-8")
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def stop(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+async def run_spawned(device_count: int, args: argparse.Namespace, workdir: Path) -> Dict[str, Any]:
+    """Start the fake Thingsboard and the middleware for `device_count` devices, then run the scenarios."""
+    mapping_path = workdir / f"devices-{device_count}.ifc.json"
+    fake_url = f"http://127.0.0.1:{args.fake_port}"
+    middleware_url = f"http://127.0.0.1:{args.middleware_port}"
+    fake = spawn(
+        [
+            sys.executable,
+            str(FAKE_THINGSBOARD),
+            "--port",
+            str(args.fake_port),
+            "--config",
+            "",
+            "--devices",
+            str(device_count),
+            "--history-hours",
+            str(max(args.windows)),
+            "--step-ms",
+            str(args.step_ms),
+            "--latency-ms",
+            str(args.tb_latency_ms),
+            "--jitter-ms",
+            str(args.tb_jitter_ms),
+            "--write-mapping",
+            str(mapping_path),
+        ],
+        dict(os.environ),
+        workdir / f"fake-{device_count}.log",
+    )
+    env = dict(os.environ, DEVICE_MAPPING_PATH=str(mapping_path))
+    env.pop("PUBLISH_QUEUE_PATH", None)
+    for item in args.middleware_env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    middleware = None
+    try:
+        await wait_ready(f"{fake_url}/fake/stats", args.startup_timeout)
+        middleware = spawn(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "app:app",
+                "--app-dir",
+                "middleware",
+                "--port",
+                str(args.middleware_port),
+                "--log-level",
+                "warning",
+            ],
+            env,
+            workdir / f"middleware-{device_count}.log",
+        )
+        await wait_ready(f"{middleware_url}/health", args.startup_timeout)
+        return await run_against(middleware_url, args)
+    finally:
+        if middleware:
+            stop(middleware)
+        stop(fake)
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    report: Dict[str, Any] = {
+        "meta": {
+            "createdAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "windows": args.windows,
+            "scenarios": args.scenarios,
+            "tbLatencyMs": args.tb_latency_ms,
+        },
+        "runs": {},
+    }
+    if args.middleware_url:
+        print(f"Running against {args.middleware_url}", file=sys.stderr)
+        outcome = await run_against(args.middleware_url, args)
+        report["runs"][str(outcome["deviceCount"])] = outcome["results"]
+        return report
+    with tempfile.TemporaryDirectory(prefix="bim-iot-load-") as tmp:
+        for device_count in args.devices:
+            print(f"Running with {device_count} devices", file=sys.stderr)
+            outcome = await run_spawned(device_count, args, Path(tmp))
+            report["runs"][str(device_count)] = outcome["results"]
+    return report
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """Per (devices, scenario, metric) relative changes; `regression` is set beyond the threshold."""
+    rows = []
+    for devices, results in current.get("runs", {}).items():
+        for name, metrics in results.items():
+            before = baseline.get("runs", {}).get(devices, {}).get(name)
+            if not before:
+                continue
+            for metric in HIGHER_IS_WORSE + LOWER_IS_WORSE:
+                old, new = before.get(metric), metrics.get(metric)
+                if not old or new is None:
+                    continue
+                change = (new - old) / old
+                worse = change > threshold if metric in HIGHER_IS_WORSE else change < -threshold
+                rows.append(
+                    {
+                        "devices": devices,
+                        "scenario": name,
+                        "metric": metric,
+                        "baseline": old,
+                        "current": new,
+                        "change": round(change, 4),
+                        "regression": worse,
+                    }
+                )
+    return rows
+
+
+def print_comparison(rows: List[Dict[str, Any]], stream: Any) -> None:
+    header = f"{'devices':>8}  {'scenario':<28} {'metric':<11} {'baseline':>10} {'current':>10} {'change':>8}"
+    print(header, file=stream)
+    for row in rows:
+        flag = "  REGRESSION" if row["regression"] else ""
+        print(
+            f"{row['devices']:>8}  {row['scenario']:<28} {row['metric']:<11} "
+            f"{row['baseline']:>10} {row['current']:>10} {row['change'] * 100:>7.1f}%{flag}",
+            file=stream,
+        )
+
+
+def load_report(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="BIM-IOT middleware load test")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the scenarios and write a JSON report")
+    run_parser.add_argument(
+        "--middleware-url",
+        default=None,
+        help="Test an already running middleware instead of starting the fake Thingsboard and the middleware",
+    )
+    run_parser.add_argument("--devices", type=int_list, default=[10, 1000], help="Device counts, e.g. 10,1000")
+    run_parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma list among {SCENARIOS}")
+    run_parser.add_argument("--concurrency", type=int, default=16)
+    run_parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    run_parser.add_argument("--duration", type=float, default=0.0, help="Time cap per scenario (s)")
+    run_parser.add_argument("--warmup", type=int, default=5, help="Untimed requests before each scenario")
+    run_parser.add_argument("--windows", type=int_list, default=[1, 24, 168], help="Telemetry windows in hours")
+    run_parser.add_argument("--limit", type=int, default=1000, help="Telemetry limit parameter")
+    run_parser.add_argument("--predictions-batch", type=int, default=50, help="Items per apply call")
+    run_parser.add_argument("--step-ms", type=int, default=60_000, help="Fake Thingsboard point spacing")
+    run_parser.add_argument("--tb-latency-ms", type=float, default=0.0, help="Latency of the fake Thingsboard")
+    run_parser.add_argument("--tb-jitter-ms", type=float, default=0.0)
+    run_parser.add_argument("--fake-port", type=int, default=7100)
+    run_parser.add_argument("--middleware-port", type=int, default=8100)
+    run_parser.add_argument(
+        "--middleware-env", action="append", default=[], help="KEY=VALUE passed to the middleware (repeatable)"
+    )
+    run_parser.add_argument("--startup-timeout", type=float, default=60.0)
+    run_parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    run_parser.add_argument("--seed", type=int, default=42)
+    run_parser.add_argument("--output", default="-", help="Report file (default: stdout)")
+    run_parser.add_argument("--baseline", default=None, help="Compare with this report after the run")
+    run_parser.add_argument("--threshold", type=float, default=0.10, help="Regression threshold")
+
+    compare_parser = commands.add_parser("compare", help="Compare two reports")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.10)
+
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        baseline, current = load_report(args.baseline), load_report(args.current)
+    else:
+        args.scenarios = [item.strip() for item in args.scenarios.split(",") if item.strip()]
+        current = asyncio.run(run(args))
+        text = json.dumps(current, indent=2)
+        if args.output == "-":
+            print(text)
+        else:
+            Path(args.output).write_text(text, encoding="utf-8")
+            print(f"Report written to {args.output}", file=sys.stderr)
+        if not args.baseline:
+            return 0
+        baseline = load_report(args.baseline)
+
+    # Keep stdout for the JSON report when it is written there.
+    stream = sys.stderr if args.command == "run" and args.output == "-" else sys.stdout
+    rows = compare(baseline, current, args.threshold)
+    print_comparison(rows, stream)
+    regressions = [row for row in rows if row["regression"]]
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.threshold * 100:.0f}%", file=stream)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())